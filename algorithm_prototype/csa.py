@@ -0,0 +1,312 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from algorithm_prototype.raptor import (
+    Stop,
+    Route,
+    Transfer,
+    INF,
+)
+from algorithm_prototype.timetable import (
+    Timetable,
+    build_timetable,
+    day_offsets,
+    validate_timetable,
+)
+
+
+@dataclass(frozen=True)
+class Connections:
+    """Every trip of a Timetable cut into connections (one stop to the next),
+    sorted by departure, for the Connection Scan Algorithm (see
+    build_connections). Build once per timetable and share between queries.
+
+    Layout:
+        - connection c leaves stop dep_stops[c] at dep_times[c] and gets to stop
+          arr_stops[c] at arr_times[c], on run runs[c] (a trip on one of the
+          days it runs) of trip trips[c], from position positions[c] of its route
+        - connections are ordered by departure, then arrival
+    """
+
+    dep_times: Sequence[int]
+    arr_times: Sequence[int]
+    dep_stops: Sequence[int]
+    arr_stops: Sequence[int]
+    runs: Sequence[int]
+    trips: Sequence[int]
+    positions: Sequence[int]
+    num_runs: int
+
+    def __len__(self) -> int:
+        return len(self.dep_times)
+
+
+def build_connections(timetable: Timetable) -> Connections:
+    """Flatten the trips of a timetable into a connection array.
+
+    Each run of a trip gives a connection between every two consecutive stops it
+    has a time at (INF holes skipped). A step back in time is left out, trip
+    times never go backwards in a validated timetable.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+
+    Returns:
+        Connections: The connections sorted by departure.
+    """
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    route_trip_offsets = timetable.route_trip_offsets
+    trip_time_offsets = timetable.trip_time_offsets
+    trip_days = timetable.trip_days
+    stop_times = timetable.stop_times
+
+    dep_times = array("i")
+    arr_times = array("i")
+    dep_stops = array("i")
+    arr_stops = array("i")
+    runs = array("i")
+    trips = array("i")
+    positions = array("i")
+    num_runs = 0
+    for r in range(timetable.num_routes):
+        first_slot = route_stop_offsets[r]
+        num_stops_in_route = route_stop_offsets[r + 1] - first_slot
+        for trip in range(route_trip_offsets[r], route_trip_offsets[r + 1]):
+            base = trip_time_offsets[trip]
+            # (position, time) of the stops the trip has a time at
+            events = [
+                (pos, stop_times[base + pos])
+                for pos in range(num_stops_in_route)
+                if stop_times[base + pos] != INF
+            ]
+            for day in day_offsets(trip_days[trip]):
+                for (pos, dep), (next_pos, arr) in zip(events, events[1:]):
+                    if arr < dep:
+                        continue
+                    dep_times.append(dep + day)
+                    arr_times.append(arr + day)
+                    dep_stops.append(route_stops[first_slot + pos])
+                    arr_stops.append(route_stops[first_slot + next_pos])
+                    runs.append(num_runs)
+                    trips.append(trip)
+                    positions.append(pos)
+                num_runs += 1
+
+    # by departure, then arrival (two stable sorts), so a zero minute
+    # connection comes before those leaving where it arrives
+    order = sorted(range(len(dep_times)), key=arr_times.__getitem__)
+    order.sort(key=dep_times.__getitem__)
+
+    def ordered(values: Sequence[int]) -> Sequence[int]:
+        return array("i", [values[c] for c in order])
+
+    return Connections(
+        dep_times=ordered(dep_times),
+        arr_times=ordered(arr_times),
+        dep_stops=ordered(dep_stops),
+        arr_stops=ordered(arr_stops),
+        runs=ordered(runs),
+        trips=ordered(trips),
+        positions=ordered(positions),
+        num_runs=num_runs,
+    )
+
+
+def _connection_path(
+    legs: Dict[int, Tuple[int, int, int]],
+    timetable: Timetable,
+    connections: Connections,
+    source_idx: int,
+    target_idx: int,
+    departure_time: int,
+) -> List[Dict[str, Any]]:
+    """Steps from the source to the target, same format as raptor_algo paths.
+    legs[s] is how stop s was reached: (boarding connection, connection got off,
+    walk after it)."""
+    idx_to_id = timetable.stop_ids
+    stop_times = timetable.stop_times
+    trip_time_offsets = timetable.trip_time_offsets
+
+    chain: List[Tuple[int, int, int, int]] = []  # (stop, enter, exit, walk)
+    stop_idx = target_idx
+    while stop_idx != source_idx:
+        enter, exit_, walk = legs[stop_idx]
+        chain.append((stop_idx, enter, exit_, walk))
+        stop_idx = connections.dep_stops[enter]
+    chain.reverse()
+
+    path: List[Dict[str, Any]] = [
+        {
+            "stop_id": idx_to_id[source_idx],
+            "arrival_time": departure_time,
+            "mode": "start",
+            "route_id": None,
+            "trip_id": None,
+            "transfer_time": None,
+            "from_stop_id": None,
+        }
+    ]
+    for k, (stop_idx, enter, exit_, walk) in enumerate(chain, start=1):
+        trip = connections.trips[exit_]
+        board_stop_idx = connections.dep_stops[enter]
+        alight_stop_idx = connections.arr_stops[exit_]
+        arrival = connections.arr_times[exit_]
+        # the connection ends at the next position the trip has a time at
+        base = trip_time_offsets[trip]
+        disembark_pos = connections.positions[exit_] + 1
+        while stop_times[base + disembark_pos] == INF:
+            disembark_pos += 1
+        # routes own consecutive trips
+        route = bisect_right(timetable.route_trip_offsets, trip) - 1
+        path.append(
+            {
+                "prev_idx": board_stop_idx,
+                "arrival_time": arrival,
+                "mode": "trip",
+                "route_id": timetable.route_ids[route],
+                "trip_id": timetable.trip_day_id(trip, disembark_pos, arrival),
+                "transfer_time": None,
+                "board_pos": connections.positions[enter],
+                "disembark_pos": disembark_pos,
+                "round": k,
+                "stop_id": idx_to_id[alight_stop_idx],
+                "from_stop_id": idx_to_id[board_stop_idx],
+            }
+        )
+        if walk:
+            path.append(
+                {
+                    "prev_idx": alight_stop_idx,
+                    "arrival_time": arrival + walk,
+                    "mode": "transfer",
+                    "route_id": None,
+                    "trip_id": None,
+                    "transfer_time": walk,
+                    "round": k,
+                    "stop_id": idx_to_id[stop_idx],
+                    "from_stop_id": idx_to_id[alight_stop_idx],
+                }
+            )
+    return path
+
+
+def csa_algo(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    departure_time: int,
+    max_rounds: int = 10,  # not used in CSA, kept for compatibility
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    connections: Optional[Connections] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Connection Scan Algorithm - earliest arrival by one scan over the
+    connections (see build_connections) in departure order, from the first one
+    leaving at departure_time until they leave after the target is reached.
+
+    A connection is taken if its run was already boarded or one is at its stop
+    by its departure. Arriving by a trip one can walk one footpath on, none is
+    walked before the first trip (as in raptor_algo).
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        source_id (str): Origin stop id.
+        target_id (str): Destination stop id.
+        departure_time (int): Departure time at the origin (minutes).
+        max_rounds (int, optional): Not used in CSA (any number of trips), kept
+            for interface compatibility.
+        debug (bool, optional): Trace mode: validate the timetable unless
+            validate_timetable already did at load. Defaults to False.
+        timetable (Timetable, optional): Compiled timetable (see raptor_algo).
+        connections (Connections, optional): Connections of the timetable.
+            Should be built once at load - computed here if not given.
+        max_walk_dist (float, optional): Longest footpath to walk in meters (see
+            raptor_algo). Defaults to None (all of them).
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of arrival times at the stops reached on the way (only upper
+              bounds, the scan stops once the target is reached) and the
+              earliest arrival at the target.
+            - List of steps (fastest path from source to target, as raptor_algo).
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    if debug and not timetable.validated:
+        validate_timetable(timetable)
+    if connections is None:
+        connections = build_connections(timetable)
+
+    id_to_idx = timetable.stop_index
+    if source_id not in id_to_idx:
+        raise ValueError("Origin not a valid Stop.")
+    source_idx = id_to_idx[source_id]
+    target_idx: Optional[int] = id_to_idx.get(target_id)
+
+    transfer_offsets = timetable.transfer_offsets
+    transfer_targets = timetable.transfer_targets
+    transfer_walks = timetable.transfer_walks
+    transfer_distances = timetable.transfer_distances
+    walk_limit = INF if max_walk_dist is None else max_walk_dist
+    dep_times = connections.dep_times
+    arr_times = connections.arr_times
+    dep_stops = connections.dep_stops
+    arr_stops = connections.arr_stops
+    runs = connections.runs
+
+    arrivals = [INF] * timetable.num_stops
+    arrivals[source_idx] = departure_time
+    # earliest arrival by a trip (footpaths start from these)
+    trip_arrivals = [INF] * timetable.num_stops
+    # connection each run was boarded at (-1: not boarded)
+    boarded = [-1] * connections.num_runs
+    # how each stop was reached: (boarding connection, last connection, walk)
+    legs: Dict[int, Tuple[int, int, int]] = {}
+
+    target = target_idx if target_idx is not None else -1
+    target_arrival = INF
+    for c in range(bisect_left(dep_times, departure_time), len(dep_times)):
+        if dep_times[c] >= target_arrival:
+            break  # nor do the later connections get there earlier
+        run = runs[c]
+        enter = boarded[run]
+        if enter < 0:
+            if arrivals[dep_stops[c]] > dep_times[c]:
+                continue
+            boarded[run] = enter = c
+        time = arr_times[c]
+        stop_idx = arr_stops[c]
+        if time >= trip_arrivals[stop_idx]:
+            continue
+        trip_arrivals[stop_idx] = time
+        if time < arrivals[stop_idx]:
+            arrivals[stop_idx] = time
+            legs[stop_idx] = (enter, c, 0)
+        for j in range(transfer_offsets[stop_idx], transfer_offsets[stop_idx + 1]):
+            # nearest first, so the rest are too long as well
+            if transfer_distances[j] > walk_limit:
+                break
+            v = transfer_targets[j]
+            if time + transfer_walks[j] < arrivals[v]:
+                arrivals[v] = time + transfer_walks[j]
+                legs[v] = (enter, c, transfer_walks[j])
+        if target >= 0:
+            target_arrival = arrivals[target]
+
+    idx_to_id = timetable.stop_ids
+    result: Dict[str, int] = dict(zip(idx_to_id, arrivals))
+    if target_idx is None or target_idx == source_idx or target_idx not in legs:
+        return result, []
+
+    path = _connection_path(
+        legs, timetable, connections, source_idx, target_idx, departure_time
+    )
+    return result, path
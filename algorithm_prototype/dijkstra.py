@@ -8,7 +8,12 @@ from algorithm_prototype.raptor import (
     Trip,
     Transfer,
     INF,
-    MIN_TRANSFER_TIME,
+)
+from algorithm_prototype.timetable import (
+    Timetable,
+    build_timetable,
+    day_offsets,
+    format_trip_day,
 )
 
 
@@ -133,6 +138,8 @@ def dijkstra_algo(
     departure_time: int,
     max_rounds: int = 10,  # not used in Dijkstra, kept for compatibility
     debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    max_walk_dist: Optional[float] = None,
 ) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
     """Dijkstra-based public transit journey planner using standard implementation.
 
@@ -149,6 +156,10 @@ def dijkstra_algo(
         departure_time: Departure time in minutes since Monday 00:00
         max_rounds: Not used in Dijkstra, kept for interface compatibility
         debug: Enable debug output
+        timetable: Compiled timetable (see build_timetable), built once at load and
+            shared with raptor_algo. Compiled here if not given.
+        max_walk_dist: Longest footpath to walk in meters (see raptor_algo),
+            None for all of them
 
     Returns:
         Tuple of (result_dict, path_list) compatible with raptor_algo:
@@ -159,20 +170,21 @@ def dijkstra_algo(
     if source_id not in stops or target_id not in stops:
         return {}, []
 
-    # Build transfer lookup for efficiency - stop_id -> [(to_stop_id, walk_time)]
-    transfer_map: Dict[str, List[Tuple[str, int]]] = {}
-    for t in transfers:
-        if t.from_stop.id not in transfer_map:
-            transfer_map[t.from_stop.id] = []
-        transfer_map[t.from_stop.id].append((t.to_stop.id, t.walking_time))
-
-    # Build route-stop mappings for efficient lookup - stop_id -> [(route_id, position)]
-    stop_to_routes: Dict[str, List[Tuple[str, int]]] = {}
-    for route_id, route in routes.items():
-        for pos, stop in enumerate(route.stops):
-            if stop.id not in stop_to_routes:
-                stop_to_routes[stop.id] = []
-            stop_to_routes[stop.id].append((route_id, pos))
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+
+    # transfer, route-stop and trip lookups come from the compiled timetable
+    stop_ids = timetable.stop_ids
+    stop_index = timetable.stop_index
+    walk_limit = INF if max_walk_dist is None else max_walk_dist
+    route_ids = timetable.route_ids
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    route_trip_offsets = timetable.route_trip_offsets
+    trip_ids = timetable.trip_ids
+    trip_time_offsets = timetable.trip_time_offsets
+    trip_days = timetable.trip_days
+    stop_times = timetable.stop_times
 
     # Standard Dijkstra data structures
     unvisited: Dict[DijkstraNode, int] = {}  # unvisited nodes with their costs
@@ -225,11 +237,18 @@ def dijkstra_algo(
         if best_target_cost != INF and current_cost >= best_target_cost:
             continue
 
+        current_idx = stop_index[current_node.stop_id]
+
         # Explore walking transfers from current stop
-        for to_stop_id, walk_time in transfer_map.get(current_node.stop_id, []):
-            walk_time = max(
-                walk_time, MIN_TRANSFER_TIME
-            )  # enforce minimum transfer time
+        for j in range(
+            timetable.transfer_offsets[current_idx],
+            timetable.transfer_offsets[current_idx + 1],
+        ):
+            # nearest first, so the rest are too long as well
+            if timetable.transfer_distances[j] > walk_limit:
+                break
+            to_stop_id = stop_ids[timetable.transfer_targets[j]]
+            walk_time = timetable.transfer_walks[j]  # minimum transfer time included
             new_time = current_node.time + walk_time
             new_node = DijkstraNode(to_stop_id, new_time)
 
@@ -256,52 +275,70 @@ def dijkstra_algo(
                 )
 
         # Explore boarding vehicles at current stop
-        for route_id, stop_pos in stop_to_routes.get(current_node.stop_id, []):
-            route = routes[route_id]
-
-            # Try each trip on this route
-            for trip in route.trips:
-                # Check if we can board this trip at this stop
-                board_time = trip.departure_times[stop_pos]
-                if board_time == INF or board_time < current_node.time:
-                    continue  # can't board this trip - already departed or invalid time
-
-                # Explore all subsequent stops on this trip
-                for next_pos in range(stop_pos + 1, len(route.stops)):
-                    arrival_time = trip.departure_times[next_pos]
-                    if arrival_time == INF or arrival_time <= board_time:
-                        continue  # invalid or backward time on trip
-
-                    next_stop = route.stops[next_pos]
-                    trip_node = DijkstraNode(
-                        next_stop.id, arrival_time, trip.id, route_id
+        for j in range(
+            timetable.stop_route_offsets[current_idx],
+            timetable.stop_route_offsets[current_idx + 1],
+        ):
+            r = timetable.stop_routes[j]
+            stop_pos = timetable.stop_route_positions[j]
+            route_id = route_ids[r]
+            first_slot = route_stop_offsets[r]
+            num_stops_in_route = route_stop_offsets[r + 1] - first_slot
+
+            # Try each trip on this route, on each day it runs
+            for trip in range(route_trip_offsets[r], route_trip_offsets[r + 1]):
+                trip_base = trip_time_offsets[trip]
+                if stop_times[trip_base + stop_pos] == INF:
+                    continue  # trip doesn't serve this stop
+                for day_offset in day_offsets(trip_days[trip]):
+                    # Check if we can board this trip at this stop
+                    board_time = stop_times[trip_base + stop_pos] + day_offset
+                    if board_time < current_node.time:
+                        continue  # can't board this trip - already departed
+                    trip_id = format_trip_day(
+                        trip_ids[trip], trip_days[trip], day_offset
                     )
 
-                    # Skip if already visited
-                    if trip_node in visited:
-                        continue
-
-                    # Cost is the arrival time (minimize arrival time)
-                    new_cost = arrival_time
-
-                    # Update if we found a better path
-                    if new_cost < distances.get(
-                        trip_node, INF
-                    ) and new_cost < result.get(next_stop.id, INF):
-
-                        distances[trip_node] = new_cost
-                        unvisited[trip_node] = new_cost
-                        result[next_stop.id] = min(result[next_stop.id], arrival_time)
-
-                        states[trip_node] = DijkstraState(
-                            node=trip_node,
-                            predecessor=current_node,
-                            mode="trip",
-                            cost=new_cost,
-                            board_pos=stop_pos,
-                            disembark_pos=next_pos,
+                    # Explore all subsequent stops on this trip
+                    for next_pos in range(stop_pos + 1, num_stops_in_route):
+                        if stop_times[trip_base + next_pos] == INF:
+                            continue  # invalid time on trip
+                        arrival_time = stop_times[trip_base + next_pos] + day_offset
+                        if arrival_time <= board_time:
+                            continue  # backward time on trip
+
+                        next_stop_id = stop_ids[route_stops[first_slot + next_pos]]
+                        trip_node = DijkstraNode(
+                            next_stop_id, arrival_time, trip_id, route_id
                         )
 
+                        # Skip if already visited
+                        if trip_node in visited:
+                            continue
+
+                        # Cost is the arrival time (minimize arrival time)
+                        new_cost = arrival_time
+
+                        # Update if we found a better path
+                        if new_cost < distances.get(
+                            trip_node, INF
+                        ) and new_cost < result.get(next_stop_id, INF):
+
+                            distances[trip_node] = new_cost
+                            unvisited[trip_node] = new_cost
+                            result[next_stop_id] = min(
+                                result[next_stop_id], arrival_time
+                            )
+
+                            states[trip_node] = DijkstraState(
+                                node=trip_node,
+                                predecessor=current_node,
+                                mode="trip",
+                                cost=new_cost,
+                                board_pos=stop_pos,
+                                disembark_pos=next_pos,
+                            )
+
     # Reconstruct path from target back to source
     path = []
     if best_target_node is not None:
@@ -0,0 +1,437 @@
+import json
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from heapq import heappop, heappush
+from math import ceil, cos, radians
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from algorithm_prototype.raptor import (
+    helper_functions as hf,
+    Stop,
+    Transfer,
+    INF,
+    MAX_WALK_DIST,
+    METERS_PER_DEG_LAT,
+    MIN_TRANSFER_TIME,
+    WALKING_SPEED,
+)
+
+# street network footpaths saved in the GTFS folder (see write_footpath_index)
+WALK_FOOTPATHS_FILE = "walk_footpaths.json"
+
+
+@dataclass(frozen=True)
+class FootpathIndex:
+    """Footpaths of every stop out to max_distance meters, nearest first (see
+    build_footpath_index). The footpaths for any shorter maximum walking distance
+    are a prefix of each stop's list, so they need no new spatial search. Build
+    once at load and share between queries.
+
+    Layout:
+        - the s-th stop (in the order of the stops dict) has footpaths
+          footpaths[offsets[s]:offsets[s + 1]], distances[...] meters long, in
+          ascending distance
+        - access_detours[stop_id]: how much longer walking to the stop is than
+          the straight line (street network footpaths, see osm_walk). Stops
+          without one are walked to in a straight line
+    """
+
+    max_distance: float
+    offsets: Tuple[int, ...]
+    footpaths: Tuple[Transfer, ...]
+    distances: Tuple[float, ...]
+    access_detours: Dict[str, float] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.footpaths)
+
+    def access_distance(self, stop_id: str, distance: float) -> float:
+        """Walking distance to stop_id from a location distance meters away in a
+        straight line."""
+        return distance * self.access_detours.get(stop_id, 1.0)
+
+    def transfers(self, max_walking_dist: float) -> List[Transfer]:
+        """Footpaths at most max_walking_dist meters long, grouped by origin stop.
+
+        Args:
+            max_walking_dist (float): Maximum walking distance in meters, up to
+                max_distance.
+
+        Returns:
+            List[Transfer]: The footpaths within max_walking_dist.
+        """
+        if max_walking_dist > self.max_distance:
+            raise ValueError(
+                f"Maximum walking distance {max_walking_dist} m is beyond the "
+                f"{self.max_distance} m the footpaths were built for."
+            )
+        offsets = self.offsets
+        footpaths = self.footpaths
+        distances = self.distances
+        transfers: List[Transfer] = []
+        for s in range(len(offsets) - 1):
+            lo = offsets[s]
+            hi = bisect_right(distances, max_walking_dist, lo, offsets[s + 1])
+            transfers.extend(footpaths[lo:hi])
+        return transfers
+
+
+class PointGrid:
+    """Grid hash of points (e.g. stops or street nodes) for lookups around a
+    location: points are bucketed into lat/lon cells at least cell_size meters
+    wide, so a search only looks at the cells around the location instead of
+    every point. Build once and share between queries.
+
+    Points are referred to by position, ids[point] names them if given (see
+    from_stops).
+    """
+
+    def __init__(
+        self,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        cell_size: float,
+        ids: Sequence[str] = (),
+    ) -> None:
+        self.ids = tuple(ids)
+        self.lats = list(lats)
+        self.lons = list(lons)
+        self.cell_size = max(cell_size, 1.0)
+        self.cell_lat = self.cell_size / METERS_PER_DEG_LAT
+        # a degree of longitude is shorter away from the equator
+        max_abs_lat = max((abs(lat) for lat in self.lats), default=0.0)
+        self.cell_lon = self.cell_lat / max(cos(radians(max_abs_lat)), 1e-6)
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for p, (lat, lon) in enumerate(zip(self.lats, self.lons)):
+            self.cells.setdefault(self._cell(lat, lon), []).append(p)
+        rows = [y for y, _ in self.cells]
+        cols = [x for _, x in self.cells]
+        # occupied cells span rows[0]..rows[1], columns cols[0]..cols[1]
+        self.rows = (min(rows, default=0), max(rows, default=0))
+        self.cols = (min(cols, default=0), max(cols, default=0))
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @classmethod
+    def from_stops(cls, stops: Dict[str, Stop], cell_size: float) -> "PointGrid":
+        """Grid of stops, ids the stop ids (in the order of the stops dict)."""
+        return cls(
+            [stop.lat for stop in stops.values()],
+            [stop.lon for stop in stops.values()],
+            cell_size,
+            ids=list(stops),
+        )
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(lat // self.cell_lat), int(lon // self.cell_lon)
+
+    def _lon_cell_meters(self, lat: float, radius: float) -> float:
+        # narrowest a cell gets anywhere within radius of latitude lat
+        far_lat = min(90.0, abs(lat) + radius / METERS_PER_DEG_LAT)
+        return self.cell_lon * METERS_PER_DEG_LAT * max(cos(radians(far_lat)), 1e-6)
+
+    def within(self, lat: float, lon: float, radius: float) -> List[Tuple[int, float]]:
+        """Points at most radius meters from (lat, lon).
+
+        Args:
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+            radius (float): Search radius in meters.
+
+        Returns:
+            List[Tuple[int, float]]: (point, distance in meters) of each point
+                within radius, in point order.
+        """
+        if radius < 0:
+            return []
+        cy, cx = self._cell(lat, lon)
+        rows = ceil(radius / self.cell_size)
+        cols = ceil(radius / self._lon_cell_meters(lat, radius))
+        found: List[Tuple[int, float]] = []
+        for dy in range(-rows, rows + 1):
+            for dx in range(-cols, cols + 1):
+                for p in self.cells.get((cy + dy, cx + dx), ()):
+                    distance = hf.haversine(lat, lon, self.lats[p], self.lons[p])
+                    if distance <= radius:
+                        found.append((p, distance))
+        found.sort()
+        return found
+
+    def nearest(
+        self, lat: float, lon: float, max_distance: float = INF
+    ) -> Tuple[int, float]:
+        """Closest point to (lat, lon), searching rings of cells outwards until
+        no closer point can be left.
+
+        Args:
+            lat (float): Latitude of the location.
+            lon (float): Longitude of the location.
+            max_distance (float, optional): Furthest the point may be, in meters.
+                Defaults to INF (any point).
+
+        Returns:
+            Tuple[int, float]: (point, distance in meters), (-1, max_distance)
+                if there is none within max_distance.
+        """
+        best = (-1, float(max_distance))
+        if not self.cells:
+            return best
+        cy, cx = self._cell(lat, lon)
+        # rings beyond the furthest occupied cell hold nothing
+        last_ring = max(
+            cy - self.rows[0], self.rows[1] - cy, cx - self.cols[0], self.cols[1] - cx
+        )
+        ring = 0
+        while ring <= last_ring:
+            for dy in range(-ring, ring + 1):
+                # whole top and bottom rows, the two ends of the others
+                step = 1 if abs(dy) == ring else 2 * ring
+                for dx in range(-ring, ring + 1, step):
+                    for p in self.cells.get((cy + dy, cx + dx), ()):
+                        distance = hf.haversine(lat, lon, self.lats[p], self.lons[p])
+                        # ties to the first point
+                        if distance < best[1] or (
+                            distance == best[1] and (best[0] < 0 or p < best[0])
+                        ):
+                            best = (p, distance)
+            # points in the next rings are at least this far away
+            reach = ring * min(
+                self.cell_size,
+                self._lon_cell_meters(lat, (ring + 1) * self.cell_size),
+            )
+            if reach > best[1]:
+                break
+            ring += 1
+        return best
+
+
+def build_footpath_index(
+    stops: Dict[str, Stop],
+    max_walking_dist: float = MAX_WALK_DIST,
+    min_transfer_time: int = MIN_TRANSFER_TIME,
+    walking_speed: float = WALKING_SPEED,
+) -> FootpathIndex:
+    """Find the footpaths between all stops at most max_walking_dist apart (one
+    spatial search, see helper_functions.walkable_pairs) and index them (see
+    footpath_index_from_pairs).
+
+    Args:
+        stops (Dict[str, Stop]): Stops to connect.
+        max_walking_dist (float, optional): Largest maximum walking distance that
+            will be asked for, in meters. Defaults to MAX_WALK_DIST.
+        min_transfer_time (int, optional): Minimum time to complete a transfer.
+            Defaults to MIN_TRANSFER_TIME.
+        walking_speed (float, optional): Walking speed in meters per minute.
+            Defaults to WALKING_SPEED.
+
+    Returns:
+        FootpathIndex: The footpaths, nearest first.
+    """
+    sources, targets, lengths = hf.walkable_pairs(stops, max_walking_dist)
+    return footpath_index_from_pairs(
+        stops,
+        sources,
+        targets,
+        lengths,
+        max_walking_dist,
+        min_transfer_time=min_transfer_time,
+        walking_speed=walking_speed,
+    )
+
+
+def footpath_index_from_pairs(
+    stops: Dict[str, Stop],
+    sources: Sequence[int],
+    targets: Sequence[int],
+    lengths: Sequence[float],
+    max_walking_dist: float,
+    access_detours: Optional[Dict[str, float]] = None,
+    min_transfer_time: int = MIN_TRANSFER_TIME,
+    walking_speed: float = WALKING_SPEED,
+) -> FootpathIndex:
+    """Index footpaths given as (from stop, to stop, length) columns, stops by
+    position in stops, ordered by from stop, then to stop (as
+    helper_functions.walkable_pairs). The walking time of a footpath is its
+    length at walking_speed, rounded up.
+
+    Args:
+        stops (Dict[str, Stop]): Stops the positions refer to.
+        sources (Sequence[int]): From stop of each footpath.
+        targets (Sequence[int]): To stop of each footpath.
+        lengths (Sequence[float]): Walking distance of each footpath in meters,
+            at most max_walking_dist.
+        max_walking_dist (float): Distance the footpaths were found up to.
+        access_detours (Dict[str, float], optional): See FootpathIndex.
+        min_transfer_time (int, optional): Minimum time to complete a transfer.
+            Defaults to MIN_TRANSFER_TIME.
+        walking_speed (float, optional): Walking speed in meters per minute.
+            Defaults to WALKING_SPEED.
+
+    Returns:
+        FootpathIndex: The footpaths, nearest first.
+    """
+    stop_list = list(stops.values())
+    offsets = [0]
+    footpaths: List[Transfer] = []
+    distances: List[float] = []
+    # pairs come grouped by origin, with their targets in stop order
+    end = 0
+    for s, stop in enumerate(stop_list):
+        start = end
+        end = bisect_right(sources, s, start)
+        # stable, so ties stay in stop order
+        for k in sorted(range(start, end), key=lengths.__getitem__):
+            distance = lengths[k]
+            footpaths.append(
+                Transfer(
+                    stop,
+                    stop_list[targets[k]],
+                    max(min_transfer_time, ceil(distance / walking_speed)),
+                    distance,
+                )
+            )
+            distances.append(distance)
+        offsets.append(len(footpaths))
+    return FootpathIndex(
+        max_distance=max_walking_dist,
+        offsets=tuple(offsets),
+        footpaths=tuple(footpaths),
+        distances=tuple(distances),
+        access_detours=dict(access_detours or {}),
+    )
+
+
+def write_footpath_index(path: str, footpaths: FootpathIndex) -> None:
+    """Save a footpath index (e.g. street network footpaths from osm_walk) as
+    JSON, to be read at load instead of searching the footpaths again.
+
+    Args:
+        path (str): File to write.
+        footpaths (FootpathIndex): Footpaths to save.
+    """
+    data = {
+        "max_distance": footpaths.max_distance,
+        "footpaths": [
+            [t.from_stop.id, t.to_stop.id, round(distance, 2)]
+            for t, distance in zip(footpaths.footpaths, footpaths.distances)
+        ],
+        "access_detours": footpaths.access_detours,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def read_footpath_index(
+    path: str,
+    stops: Dict[str, Stop],
+    min_transfer_time: int = MIN_TRANSFER_TIME,
+    walking_speed: float = WALKING_SPEED,
+) -> FootpathIndex:
+    """Read a footpath index saved by write_footpath_index. Footpaths and
+    detours of stops not in stops (the feed changed since) are left out.
+
+    Args:
+        path (str): File to read.
+        stops (Dict[str, Stop]): Stops of the network.
+        min_transfer_time (int, optional): Minimum time to complete a transfer.
+            Defaults to MIN_TRANSFER_TIME.
+        walking_speed (float, optional): Walking speed in meters per minute.
+            Defaults to WALKING_SPEED.
+
+    Returns:
+        FootpathIndex: The saved footpaths.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    position = {stop_id: s for s, stop_id in enumerate(stops)}
+    pairs = sorted(
+        (position[from_id], position[to_id], distance)
+        for from_id, to_id, distance in data["footpaths"]
+        if from_id in position and to_id in position
+    )
+    return footpath_index_from_pairs(
+        stops,
+        [pair[0] for pair in pairs],
+        [pair[1] for pair in pairs],
+        [pair[2] for pair in pairs],
+        data["max_distance"],
+        access_detours={
+            stop_id: detour
+            for stop_id, detour in data["access_detours"].items()
+            if stop_id in position
+        },
+        min_transfer_time=min_transfer_time,
+        walking_speed=walking_speed,
+    )
+
+
+def close_footpaths(
+    transfers: Sequence[Transfer], max_walk_time: int
+) -> List[Transfer]:
+    """Transitive closure of footpaths up to a time budget: a direct footpath
+    from every stop to every stop reachable by a chain of footpaths in at most
+    max_walk_time minutes, taking the quickest chain's time and distance
+    (summed walking times and distances, straight line for footpaths without
+    one). The given footpaths are kept, also those longer than the budget.
+
+    The engines walk one footpath between two trips, so a chain A -> B -> C is
+    only found if A -> C is a footpath of its own. Closing short footpaths
+    gives those walks with far fewer footpaths than a larger walking distance.
+    Footpaths are found by a Dijkstra search bounded by max_walk_time from each
+    stop.
+
+    Args:
+        transfers (Sequence[Transfer]): Footpaths to close.
+        max_walk_time (int): Longest chain of footpaths to add, in minutes.
+
+    Returns:
+        List[Transfer]: The closed footpaths, grouped by origin stop, quickest
+            first.
+    """
+    stop_list: List[Stop] = []
+    position: Dict[str, int] = {}
+    adj: List[List[Tuple[int, int, float]]] = []
+    for t in transfers:
+        for stop in (t.from_stop, t.to_stop):
+            if stop.id not in position:
+                position[stop.id] = len(stop_list)
+                stop_list.append(stop)
+                adj.append([])
+        distance = t.distance
+        if distance is None:
+            distance = hf.haversine(
+                t.from_stop.lat, t.from_stop.lon, t.to_stop.lat, t.to_stop.lon
+            )
+        adj[position[t.from_stop.id]].append(
+            (position[t.to_stop.id], t.walking_time, distance)
+        )
+
+    closed: List[Transfer] = []
+    for u, edges in enumerate(adj):
+        if not edges:
+            continue
+        # direct footpaths whatever their time, chains within the budget
+        best: Dict[int, int] = {u: 0}
+        lengths: Dict[int, float] = {u: 0.0}
+        heap: List[Tuple[int, int]] = []
+        for v, walk_time, distance in edges:
+            if walk_time < best.get(v, INF):
+                best[v] = walk_time
+                lengths[v] = distance
+                heappush(heap, (walk_time, v))
+        while heap:
+            time, v = heappop(heap)
+            if time > best[v] or time > max_walk_time:
+                continue
+            for w, walk_time, distance in adj[v]:
+                reached = time + walk_time
+                if reached <= max_walk_time and reached < best.get(w, INF):
+                    best[w] = reached
+                    lengths[w] = lengths[v] + distance
+                    heappush(heap, (reached, w))
+        del best[u]
+        # quickest first, ties by stop order
+        for v, time in sorted(best.items(), key=lambda item: (item[1], item[0])):
+            closed.append(Transfer(stop_list[u], stop_list[v], time, lengths[v]))
+    return closed
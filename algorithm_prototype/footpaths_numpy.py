@@ -0,0 +1,99 @@
+from math import asin, pi, sin
+from typing import Sequence, Tuple
+
+from algorithm_prototype.raptor_numpy import HAS_NUMPY, np
+
+# mean earth radius in meters (as helper_functions.haversine)
+EARTH_RADIUS_M: float = 6371 * 1000
+# most cells along one axis of the grid (keeps cell keys within int64)
+MAX_GRID_CELLS: int = 2**30
+
+
+def grid_walkable_pairs(
+    lats: Sequence[float], lons: Sequence[float], max_walking_dist: float
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """All ordered pairs of distinct points at most max_walking_dist meters apart
+    (haversine), found with a grid hash instead of a spatial index.
+
+    Points are bucketed into lat/lon cells no smaller than the walking distance,
+    so a point's neighbours are all in its own or the 8 adjacent cells. Each of
+    the 9 cell offsets is one vectorized pass: every point is paired with the
+    points of the cell at that offset (sorted cell keys, searchsorted) and the
+    candidates are kept if their haversine distance is within max_walking_dist.
+    Longitude is not wrapped at +-180 degrees (as the R-tree search).
+
+    Args:
+        lats (Sequence[float]): Latitudes of the points (degrees).
+        lons (Sequence[float]): Longitudes of the points (degrees).
+        max_walking_dist (float): Maximum distance in meters.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (from point, to point,
+        distance in meters) of each pair, ordered by from point, then to point.
+    """
+    if not HAS_NUMPY:
+        raise ImportError("grid_walkable_pairs needs NumPy")
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    n = len(lat)
+    if n == 0 or max_walking_dist < 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+
+    # cell height: a pair within the distance is at most this far apart in latitude
+    angle = max_walking_dist / EARTH_RADIUS_M
+    # cell width: sin(dlon / 2) <= sin(angle / 2) / cos(lat) for both points, from
+    # the haversine formula, so the largest |lat| bounds it
+    min_cos = float(np.cos(np.abs(lat).max()))
+    ratio = sin(angle / 2) / min_cos if min_cos > 0 else 2.0
+    cell_lon = 2 * asin(ratio) if ratio < 1 else 2 * pi
+    lat_min, lon_min = float(lat.min()), float(lon.min())
+    cell_lat = max(angle, (float(lat.max()) - lat_min) / MAX_GRID_CELLS, 1e-12)
+    cell_lon = max(cell_lon, (float(lon.max()) - lon_min) / MAX_GRID_CELLS, 1e-12)
+    cy = ((lat - lat_min) // cell_lat).astype(np.int64)
+    cx = ((lon - lon_min) // cell_lon).astype(np.int64)
+    # one spare column each side, so the offset cells of a row don't wrap into
+    # the next one
+    width = int(cx.max()) + 3
+    keys = (cy + 1) * width + (cx + 1)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    cos_lat = np.cos(lat)
+    points = np.arange(n, dtype=np.int64)
+
+    sources, targets, distances = [], [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            cell_keys = keys + (dy * width + dx)
+            lo = np.searchsorted(sorted_keys, cell_keys, side="left")
+            counts = np.searchsorted(sorted_keys, cell_keys, side="right") - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # candidate k pairs point src[k] with the rank-th point of its cell
+            src = np.repeat(points, counts)
+            rank = np.arange(total, dtype=np.int64) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            dst = order[np.repeat(lo, counts) + rank]
+            distinct = src != dst
+            src, dst = src[distinct], dst[distinct]
+            # haversine, as helper_functions.haversine
+            a = (
+                np.sin((lat[dst] - lat[src]) / 2) ** 2
+                + np.sin((lon[dst] - lon[src]) / 2) ** 2 * cos_lat[src] * cos_lat[dst]
+            )
+            dist = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+            near = dist <= max_walking_dist
+            sources.append(src[near])
+            targets.append(dst[near])
+            distances.append(dist[near])
+
+    if not sources:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+    src = np.concatenate(sources)
+    dst = np.concatenate(targets)
+    dist = np.concatenate(distances)
+    pair_order = np.lexsort((dst, src))
+    return src[pair_order], dst[pair_order], dist[pair_order]
@@ -1,5 +1,7 @@
 from collections import defaultdict
-from typing import Dict, Set, List, Tuple
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Set, List, Optional, Tuple
 from os import read
 from sys import exception
 import sys
@@ -13,6 +15,7 @@ from algorithm_prototype.raptor import (
     Transfer,
     reconstruct_path_objs,
 )
+from algorithm_prototype.timetable import DAY_MINS
 from pathlib import Path
 
 INF: int = sys.maxsize
@@ -26,6 +29,31 @@ WEEKDAY_MULT = {
     "saturday": 5,
     "sunday": 6,
 }
+# calendar.txt / calendar_dates.txt date format
+GTFS_DATE_FORMAT = "%Y%m%d"
+
+
+@dataclass
+class Service:
+    """When a GTFS service runs: its weekdays between start_date and end_date
+    (calendar.txt) with the exceptions of calendar_dates.txt."""
+
+    weekdays: int = 0  # bit d = day d, 0=Monday
+    start_date: Optional[date] = None  # None: no limit
+    end_date: Optional[date] = None
+    added: Set[date] = field(default_factory=set)
+    removed: Set[date] = field(default_factory=set)
+
+    def runs_on(self, day: date) -> bool:
+        if day in self.removed:
+            return False
+        if day in self.added:
+            return True
+        return bool(
+            self.weekdays >> day.weekday() & 1
+            and (self.start_date is None or self.start_date <= day)
+            and (self.end_date is None or day <= self.end_date)
+        )
 
 
 class GTFSReader:
@@ -39,11 +67,17 @@ class GTFSReader:
         self.trips_file = gtfs_folder + "trips.txt"
         self.stop_times_file = gtfs_folder + "stop_times.txt"
         self.calendar_file = gtfs_folder + "calendar.txt"
+        self.calendar_dates_file = gtfs_folder + "calendar_dates.txt"
 
         self.stops: Dict[str, Stop] = {}
         self.routes: Dict[str, Route] = {}
         self.trips: Dict[str, Trip] = {}
         self.stop_times: Dict[str, List[Dict]] = {}
+        self.services: Dict[str, Service] = {}
+        self.trip_services: Dict[str, str] = {}  # trip_id -> service_id
+        # like routes but with every trip, also those only running on dates
+        # added in calendar_dates.txt (see routes_on)
+        self.dated_routes: Dict[str, Route] = {}
 
         # call methods to read GTFS data - method names start with _ to indicate that they are private
         self._read_stops()
@@ -82,83 +116,109 @@ class GTFSReader:
             return f"{day_names[day]} {hh:02d}:{mm:02d}"
         return f"{hh:02d}:{mm:02d}"
 
-    def _read_calendar(self) -> Dict[str, List[int]]:
-        """Reads the calendar.txt file and returns a dictionary mapping service_id to list of active days (as offsets).
+    def routes_on(self, day: date) -> Dict[str, Route]:
+        """Routes with only the trips running on a service date, for a timetable
+        of that date (see RaptorEngine). Times are absolute like the weekly
+        timetable's (minutes since Monday 00:00 of day's week). Runs of the day
+        before still going after midnight and of the day after (journeys ending
+        after midnight) are included too. Trip ids get their service date
+        appended, e.g. "ga_29_20240101", and trips are sorted by departure.
+
+        Args:
+            day (date): Service date.
 
         Returns:
-            Dict[str, List[int]]: service_id -> list of active weekdays (ints 0..6)
+            Dict[str, Route]: route_id -> Route, routes without trips left out.
         """
+        weekday = day.weekday()
+        service_dates = [
+            (day + timedelta(days=d), (weekday + d) * DAY_MINS) for d in (-1, 0, 1)
+        ]
+        routes: Dict[str, Route] = {}
+        for route_id, route in self.dated_routes.items():
+            trips: List[Trip] = []
+            for trip in route.trips:
+                service = self.services[self.trip_services[trip.id]]
+                for service_date, offset in service_dates:
+                    if service_date < day and trip.departure_times[-1] < DAY_MINS:
+                        continue  # over before day starts
+                    if service.runs_on(service_date):
+                        trips.append(
+                            Trip(
+                                f"{trip.id}_{service_date.strftime(GTFS_DATE_FORMAT)}",
+                                [t + offset for t in trip.departure_times],
+                            )
+                        )
+            if trips:
+                dated = Route(route_id, route.stops, trips, name=route.name)
+                dated.sort_trips()
+                routes[route_id] = dated
+        return routes
+
+    def _read_calendar(self) -> Dict[str, Service]:
+        """Reads calendar.txt and calendar_dates.txt into the days each service runs.
+        start_date/end_date are optional (no limit if missing), as is
+        calendar_dates.txt (exception_type 1 adds a date, 2 removes it).
 
-        service_days: Dict[str, List[int]] = {}
+        Returns:
+            Dict[str, Service]: service_id -> Service
+        """
+
+        def parse_date(raw: Optional[str]) -> Optional[date]:
+            raw = (raw or "").strip()
+            return datetime.strptime(raw, GTFS_DATE_FORMAT).date() if raw else None
+
+        services: Dict[str, Service] = {}
         with open(self.calendar_file, newline="") as f:
             reader = csv.DictReader(f)
             for row in reader:
-                days = []
+                weekdays = 0
                 for day, offset in WEEKDAY_MULT.items():
                     if row[day] == "1":
-                        days.append(offset)
-                service_days[row["service_id"]] = days
-        return service_days
-
-    def _expand_trip_days(
-        self, cur_route: Route, departure_times: List[int], active_days: List[int]
-    ):
-        """Expands a list of trip departure times to cover multiple days based on active_days.
+                        weekdays |= 1 << offset
+                services[row["service_id"]] = Service(
+                    weekdays,
+                    parse_date(row.get("start_date")),
+                    parse_date(row.get("end_date")),
+                )
 
-        Args:
-            departure_times (List[int]): List of departure times in minutes since midnight.
-            active_days (List[int]): List of active days as offsets (0=Monday, ..., 6=Sunday).
-        """
-        for trip_id, trip_info in self.trips.items():
-            stop_times: List[int] = self.trips[trip_id].departure_times
-            for day_id in active_days:
-                day_offset = day_id * 24 * 60
-                # Add trip for this day
-                departure_times_for_day = [t + day_offset for t in departure_times]
-                trip_day_id = f"{trip_id}_day{day_id}"
-                trip = Trip(trip_day_id, departure_times_for_day)
-                cur_route.add_trip(trip)
-                # If it's Monday, also add trip for next week's Monday
-                if day_id == 0:
-                    next_week_offset = 7 * 24 * 60
-                    departure_times_next_monday = [
-                        t + day_offset + next_week_offset for t in departure_times
-                    ]
-                    trip_day_id_next = f"{trip_id}_day{day_id}_nextweek"
-                    trip_next = Trip(trip_day_id_next, departure_times_next_monday)
-                    cur_route.add_trip(trip_next)
+        if Path(self.calendar_dates_file).exists():
+            with open(self.calendar_dates_file, newline="") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    # a service may only run on added dates (not in calendar.txt)
+                    service = services.setdefault(row["service_id"], Service())
+                    day = parse_date(row["date"])
+                    if row["exception_type"].strip() == "1":
+                        service.added.add(day)
+                        service.removed.discard(day)
+                    else:
+                        service.removed.add(day)
+                        service.added.discard(day)
+        return services
 
     @staticmethod
-    def _align_by_occurrence(
-        canon_ids: List[str], trip_ids: List[str], times: List[int]
-    ) -> List[int]:
-        """Helper: align trip to canonical by nth occurrence
+    def _fifo_groups(trips: List[Trip]) -> List[List[Trip]]:
+        """Split the trips of one stop pattern into groups in which no trip
+        overtakes another on the same day: sorted by departure, each trip joins
+        the first group whose last trip is not later than it at any stop.
 
         Args:
-            canon_ids (List[str]): _description_
-            trip_ids (List[str]): _description_
-            times (List[int]): _description_
+            trips (List[Trip]): Trips with the same stops (no INF times).
 
         Returns:
-            List[int]: _description_
+            List[List[Trip]]: Groups of trips, each sorted by departure.
         """
-        canon_pos: Dict[str, List[int]] = defaultdict(list)
-        for i, sid in enumerate(canon_ids):
-            canon_pos[sid].append(i)
-        trip_pos: Dict[str, List[int]] = defaultdict(list)
-        for j, sid in enumerate(trip_ids):
-            trip_pos[sid].append(j)
-
-        used: Dict[str, int] = defaultdict(int)
-        aligned = [INF] * len(canon_ids)
-        for sid in canon_ids:
-            k = used[sid]
-            if k < len(trip_pos[sid]) and k < len(canon_pos[sid]):
-                src_idx = trip_pos[sid][k]
-                dst_idx = canon_pos[sid][k]
-                aligned[dst_idx] = times[src_idx]
-            used[sid] += 1
-        return aligned
+        groups: List[List[Trip]] = []
+        for trip in sorted(trips, key=lambda t: (t.departure_times[0], t.id)):
+            for group in groups:
+                last = group[-1].departure_times
+                if all(a <= b for a, b in zip(last, trip.departure_times)):
+                    group.append(trip)
+                    break
+            else:
+                groups.append([trip])
+        return groups
 
     def _read_stops(self):
         """TODO: _summary_"""
@@ -179,8 +239,8 @@ class GTFSReader:
     def _read_routes_trips_stoptimes(self):
         """Read routes, trips, stop_times -> build Route objects."""
         # Step 1:
-        #   Read calendar.txt to get service_id -> active days mapping
-        service_days = self._read_calendar()
+        #   Read calendar.txt and calendar_dates.txt to get service_id -> Service
+        self.services = self._read_calendar()
 
         # Collect non-monotonic trips for reporting
         non_monotone_trips: List[str] = []
@@ -294,7 +354,7 @@ class GTFSReader:
                     departure_times, via_mask
                 )
 
-                # Check monotone increasing times, if not, raise error
+                # Check monotone increasing times, if not, report the trip
                 valid, problem_stop = helper_functions._check_trip_times(
                     departure_times
                 )
@@ -319,6 +379,9 @@ class GTFSReader:
                         non_monotone_trips.append(
                             f"{trip_id} (route={route_id}, service={service_id})"
                         )
+                    # reported below and left out - a trip going back in time
+                    # can't be part of a FIFO pattern
+                    continue
 
                 # Store trip info for later expansion
                 # if route_id not in trips_by_route:
@@ -333,65 +396,74 @@ class GTFSReader:
                     }
                 )
 
-        # Step 5: build Route objects with correct stops and modes
-        self.routes = {}
-        for route_id, meta in route_data.items():
-            trip_list = trips_by_route.get(route_id, [])
-            if not trip_list:
-                continue  # Skip routes without trips
-
-            # choose canonical trip: longest, then most finite times
-            canonical = max(
-                trip_list,
-                key=lambda t: (
-                    len(t["stop_ids"]),
-                    sum(1 for x in t["departure_times"] if x != INF),
-                    t["trip_id"],
-                ),
-            )
-            canonical_stop_ids = canonical["stop_ids"]
-
-            stop_list: List[Stop] = []
-            for stop_id in canonical_stop_ids:
-                st = self.stops.get(stop_id)
-                if st is None:
-                    continue
-                st.mode = meta["mode"]
-                stop_list.append(st)
-
-            route = Route(route_id, stop_list, [], name=meta["name"])
-            self.routes[route_id] = route
-
-        # Step 6: Attach Trip objects for each active day in schedule
+        # Step 5: split each route into stop patterns - one internal route per
+        # distinct sequence of served stops, so every trip has a time at every
+        # stop of its route (no INF holes to skip in the RAPTOR scan)
+        patterns_by_route: Dict[str, Dict[Tuple[str, ...], List[Trip]]] = {}
         for route_id, trip_list in trips_by_route.items():
-            route = self.routes.get(route_id)
-            if not route:
-                continue  # Skip routes without trips
-            canonical_ids = [s.id for s in route.stops]
-
+            if route_id not in route_data:
+                continue  # Skip trips of unknown routes
+            patterns = patterns_by_route.setdefault(route_id, {})
             for trip in trip_list:
-                aligned_times = GTFSReader._align_by_occurrence(
-                    canonical_ids, trip["stop_ids"], trip["departure_times"]
+                # each trip is stored once with the weekdays it runs on, as a
+                # bitmask (the day's offset is added at query time, see
+                # day_offsets) - dates are resolved by routes_on
+                service = self.services.get(trip["service_id"])
+                if service is None or not (service.weekdays or service.added):
+                    continue  # never runs
+                # stops without a time (N/A) or unknown to stops.txt aren't served
+                served = [
+                    (stop_id, t)
+                    for stop_id, t in zip(trip["stop_ids"], trip["departure_times"])
+                    if t != INF and stop_id in self.stops
+                ]
+                if len(served) < 2:
+                    continue  # can't ride anywhere
+                stop_ids = tuple(stop_id for stop_id, _ in served)
+                patterns.setdefault(stop_ids, []).append(
+                    Trip(
+                        trip["trip_id"],
+                        [t for _, t in served],
+                        service_days=service.weekdays,
+                    )
                 )
-                active_days = service_days.get(trip["service_id"], [])
-                for day_id in active_days:
-                    day_offset = day_id * 24 * 60
-                    dep_times_for_day = [
-                        t + day_offset if t != INF else INF for t in aligned_times
-                    ]
-                    trip_day_id = f"{trip['trip_id']}_day{day_id}"
-                    trip_obj = Trip(trip_day_id, dep_times_for_day)
-                    route.add_trip(trip_obj)
-                    # If Monday, also add next week's Monday
-                    if day_id == 0:
-                        next_week_offset = WEEK_MINS
-                        dep_times_next_monday = [
-                            t + day_offset + next_week_offset if t != INF else INF
-                            for t in aligned_times
-                        ]
-                        trip_day_id_next = f"{trip['trip_id']}_day{day_id}_nextweek"
-                        trip_obj_next = Trip(trip_day_id_next, dep_times_next_monday)
-                        route.add_trip(trip_obj_next)
+                self.trip_services[trip["trip_id"]] = trip["service_id"]
+
+        # Step 6: build Route objects - trips of a pattern that overtake each other
+        # go to separate routes, so each route's trips are in the same order at
+        # every stop (FIFO) and the earliest trip can be found by binary search
+        self.routes = {}
+        self.dated_routes = {}
+        for route_id, meta in route_data.items():
+            route_patterns = [
+                (stop_ids, group)
+                for stop_ids, pattern_trips in patterns_by_route.get(
+                    route_id, {}
+                ).items()
+                for group in GTFSReader._fifo_groups(pattern_trips)
+            ]
+            for i, (stop_ids, group) in enumerate(route_patterns):
+                stop_list: List[Stop] = []
+                for stop_id in stop_ids:
+                    st = self.stops[stop_id]
+                    st.mode = meta["mode"]
+                    stop_list.append(st)
+                # a route with a single pattern keeps its GTFS id
+                pattern_id = (
+                    route_id if len(route_patterns) == 1 else f"{route_id}_p{i}"
+                )
+                route = Route(pattern_id, stop_list, [], name=meta["name"])
+                for trip in group:
+                    route.add_trip(trip)
+                self.dated_routes[pattern_id] = route
+                # the weekly timetable leaves out trips only running on added dates
+                weekly = [trip for trip in group if trip.service_days]
+                if len(weekly) == len(group):
+                    self.routes[pattern_id] = route
+                elif weekly:
+                    self.routes[pattern_id] = Route(
+                        pattern_id, stop_list, weekly, name=meta["name"]
+                    )
 
         try:
             out_path = Path(self.gtfs_folder + "non_monotone_trips.txt")
@@ -0,0 +1,371 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from algorithm_prototype.raptor import (
+    Stop,
+    Route,
+    Transfer,
+    INF,
+)
+from algorithm_prototype.timetable import (
+    Timetable,
+    build_timetable,
+    validate_timetable,
+)
+
+
+@dataclass(eq=False)
+class Label:
+    """A journey from the source to stop_idx, one entry of a McRAPTOR bag.
+    Criteria: arrival time, number of trips and total walking (transfer) minutes.
+    The rest describes the last leg (parent is the label it continues)."""
+
+    arrival: int
+    trips: int
+    walk: int
+    stop_idx: int
+    parent: Optional["Label"] = None
+    mode: str = "start"  # 'start', 'trip', 'transfer'
+    route_idx: int = -1
+    trip_idx: int = -1
+    board_pos: int = -1
+    disembark_pos: int = -1
+    transfer_time: Optional[int] = None
+    dominated: bool = False  # set once dropped from its bag
+
+    def dominates(self, other: "Label") -> bool:
+        return (
+            self.arrival <= other.arrival
+            and self.trips <= other.trips
+            and self.walk <= other.walk
+        )
+
+
+def _merge(bag: List[Label], label: Label) -> bool:
+    """Add label to a Pareto bag unless a label in the bag dominates it (or is
+    equal). Labels it dominates are removed and flagged.
+
+    Returns:
+        bool: True if label was added.
+    """
+    for other in bag:
+        if other.dominates(label):
+            return False
+    kept = []
+    for other in bag:
+        if label.dominates(other):
+            other.dominated = True
+        else:
+            kept.append(other)
+    kept.append(label)
+    bag[:] = kept
+    return True
+
+
+def _label_path(
+    label: Label, timetable: Timetable, source_idx: int
+) -> List[Dict[str, Any]]:
+    """Steps from the source to label's stop, same format as raptor_algo paths."""
+    idx_to_id = timetable.stop_ids
+    path: List[Dict[str, Any]] = []
+    while label.parent is not None:
+        step: Dict[str, Any] = {
+            "prev_idx": label.parent.stop_idx,
+            "arrival_time": label.arrival,
+            "mode": label.mode,
+            "route_id": None,
+            "trip_id": None,
+            "transfer_time": label.transfer_time,
+            "round": label.trips,
+            "stop_id": idx_to_id[label.stop_idx],
+            "from_stop_id": idx_to_id[label.parent.stop_idx],
+        }
+        if label.mode == "trip":
+            step["route_id"] = timetable.route_ids[label.route_idx]
+            step["trip_id"] = timetable.trip_day_id(
+                label.trip_idx, label.disembark_pos, label.arrival
+            )
+            step["board_pos"] = label.board_pos
+            step["disembark_pos"] = label.disembark_pos
+        path.append(step)
+        label = label.parent
+
+    path.append(
+        {
+            "stop_id": idx_to_id[source_idx],
+            "arrival_time": label.arrival,
+            "mode": "start",
+            "route_id": None,
+            "trip_id": None,
+            "transfer_time": None,
+            "from_stop_id": None,
+        }
+    )
+    path.reverse()
+    return path
+
+
+def mcraptor_algo(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    departure_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """McRAPTOR - multi-criteria RAPTOR.
+
+    Instead of one arrival time every stop keeps a bag of Pareto optimal labels
+    over (arrival time, number of trips, walking minutes). Round k extends the
+    labels of round k - 1 by one trip (each followed by at most one walk, as in
+    raptor_algo). Labels dominated by a label at the target are pruned.
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        source_id (str): Origin stop id.
+        target_id (str): Destination stop id.
+        departure_time (int): Departure time at the origin (minutes).
+        max_rounds (int, optional): Maximum number of trips. Defaults to 10.
+        debug (bool, optional): Trace mode: validate the timetable unless
+            validate_timetable already did at load. Defaults to False.
+        timetable (Timetable, optional): Compiled timetable (see raptor_algo).
+        max_walk_dist (float, optional): Longest footpath to walk in meters (see
+            raptor_algo). Defaults to None (all of them).
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of earliest arrival times at all stops.
+            - Pareto optimal journeys to the target ordered by arrival, each with
+              arrival_time, trips, walking_time and path (steps as in raptor_algo).
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    if debug and not timetable.validated:
+        validate_timetable(timetable)
+
+    id_to_idx = timetable.stop_index
+    n = timetable.num_stops
+    if source_id not in id_to_idx:
+        raise ValueError("Origin not a valid Stop.")
+    source_idx = id_to_idx[source_id]
+    target_idx: Optional[int] = id_to_idx.get(target_id)
+
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    trip_time_offsets = timetable.trip_time_offsets
+    stop_times = timetable.stop_times
+    slot_departures = timetable.slot_departures
+    slot_trips = timetable.slot_trips
+    stop_route_offsets = timetable.stop_route_offsets
+    stop_routes = timetable.stop_routes
+    stop_route_positions = timetable.stop_route_positions
+    transfer_offsets = timetable.transfer_offsets
+    transfer_targets = timetable.transfer_targets
+    transfer_walks = timetable.transfer_walks
+    transfer_distances = timetable.transfer_distances
+    walk_limit = INF if max_walk_dist is None else max_walk_dist
+
+    # best bags over all rounds
+    bags: List[List[Label]] = [[] for _ in range(n)]
+    target_bag: List[Label] = bags[target_idx] if target_idx is not None else []
+
+    def add(label: Label) -> bool:
+        # target pruning: arrival, trips and walking can only grow from here
+        for other in target_bag:
+            if other.dominates(label):
+                return False
+        return _merge(bags[label.stop_idx], label)
+
+    source_label = Label(departure_time, 0, 0, source_idx)
+    bags[source_idx].append(source_label)
+    # labels added in the previous round, by stop
+    new_labels: Dict[int, List[Label]] = {source_idx: [source_label]}
+
+    for k in range(1, max_rounds + 1):
+        # 1: routes serving stops with new labels, from the earliest such stop
+        Q: Dict[int, int] = {}
+        for stop_idx in new_labels:
+            for j in range(
+                stop_route_offsets[stop_idx], stop_route_offsets[stop_idx + 1]
+            ):
+                r = stop_routes[j]
+                pos = stop_route_positions[j]
+                if pos < Q.get(r, INF):
+                    Q[r] = pos
+
+        round_labels: Dict[int, List[Label]] = {}
+
+        # 2: traverse each route with a bag of boarded trips
+        for r, start_pos in Q.items():
+            first_slot = route_stop_offsets[r]
+            num_stops_in_route = route_stop_offsets[r + 1] - first_slot
+            # (trip, boarded label, board position, board time)
+            route_bag: List[Tuple[int, Label, int, int]] = []
+
+            for pos in range(start_pos, num_stops_in_route):
+                stop_idx = route_stops[first_slot + pos]
+
+                # a) get off here with every trip in the route bag
+                for trip, boarded, board_pos, board_time in route_bag:
+                    base = trip_time_offsets[trip]
+                    time = stop_times[base + pos]
+                    # plus the day the trip runs on (see build_timetable)
+                    trip_time = time + board_time - stop_times[base + board_pos]
+                    prev_time_same_trip = stop_times[base + pos - 1]
+                    # same validity rules as raptor_algo
+                    if (
+                        time == INF
+                        or trip_time < board_time
+                        or (prev_time_same_trip != INF and time < prev_time_same_trip)
+                    ):
+                        continue
+                    label = Label(
+                        trip_time,
+                        k,
+                        boarded.walk,
+                        stop_idx,
+                        boarded,
+                        "trip",
+                        r,
+                        trip,
+                        board_pos,
+                        pos,
+                    )
+                    if add(label):
+                        round_labels.setdefault(stop_idx, []).append(label)
+
+                # b) board the earliest trip with every label of the previous round
+                dep_times = slot_departures[first_slot + pos]
+                for boarded in new_labels.get(stop_idx, ()):
+                    if boarded.dominated:
+                        continue
+                    i = bisect_left(dep_times, boarded.arrival)
+                    if i == len(dep_times):
+                        continue
+                    route_bag = _merge_route_bag(
+                        route_bag,
+                        (slot_trips[first_slot + pos][i], boarded, pos, dep_times[i]),
+                        pos,
+                        trip_time_offsets,
+                        stop_times,
+                    )
+
+        # 3: one walk after each trip (no chained walks, as in raptor_algo). Walk
+        # from trip labels even if they were dominated since: a walked label
+        # can't walk on, so it may dominate a trip label that still leads further
+        for stop_idx, labels in list(round_labels.items()):
+            for label in list(labels):
+                if label.mode != "trip":
+                    continue
+                for j in range(
+                    transfer_offsets[stop_idx], transfer_offsets[stop_idx + 1]
+                ):
+                    # nearest first, so the rest are too long as well
+                    if transfer_distances[j] > walk_limit:
+                        break
+                    v = transfer_targets[j]
+                    if v == source_idx:
+                        continue
+                    walk_time = transfer_walks[j]
+                    walked = Label(
+                        label.arrival + walk_time,
+                        k,
+                        label.walk + walk_time,
+                        v,
+                        label,
+                        "transfer",
+                        transfer_time=walk_time,
+                    )
+                    if add(walked):
+                        round_labels.setdefault(v, []).append(walked)
+
+        if not round_labels:
+            break
+        new_labels = round_labels
+
+    result: Dict[str, int] = {
+        sid: min((label.arrival for label in bag), default=INF)
+        for sid, bag in zip(timetable.stop_ids, bags)
+    }
+    result[source_id] = departure_time
+
+    journeys: List[Dict[str, Any]] = []
+    if target_idx is not None and target_idx != source_idx:
+        for label in sorted(target_bag, key=lambda l: (l.arrival, l.trips, l.walk)):
+            journeys.append(
+                {
+                    "arrival_time": label.arrival,
+                    "trips": label.trips,
+                    "walking_time": label.walk,
+                    "path": _label_path(label, timetable, source_idx),
+                }
+            )
+
+    return result, journeys
+
+
+def _merge_route_bag(
+    route_bag: List[Tuple[int, Label, int, int]],
+    entry: Tuple[int, Label, int, int],
+    pos: int,
+    trip_time_offsets: Tuple[int, ...],
+    stop_times: Tuple[int, ...],
+) -> List[Tuple[int, Label, int, int]]:
+    """Pareto merge of a boarded trip into a route bag. All entries have the same
+    number of trips, so they compare on the time of their trip at pos (FIFO
+    trips keep that order further along the route) and walking minutes."""
+
+    def time_at(e: Tuple[int, Label, int, int]) -> int:
+        # the trip's time at pos on the day it was boarded (board time minus its
+        # stop time at the boarding position is the day offset)
+        base = trip_time_offsets[e[0]]
+        return stop_times[base + pos] + e[3] - stop_times[base + e[2]]
+
+    boarded = entry[1]
+    time = time_at(entry)
+    for other in route_bag:
+        if time_at(other) <= time and other[1].walk <= boarded.walk:
+            return route_bag
+    kept = [
+        e for e in route_bag if not (time <= time_at(e) and boarded.walk <= e[1].walk)
+    ]
+    kept.append(entry)
+    return kept
+
+
+def pick_journey(
+    journeys: List[Dict[str, Any]],
+    minimize_walking: bool = False,
+    minimize_transfers: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """Pick one journey from a McRAPTOR front by preference: fewest trips first
+    (minimize_transfers), then least walking (minimize_walking), then the
+    earliest arrival.
+
+    Args:
+        journeys (List[Dict[str, Any]]): Journeys as returned by mcraptor_algo.
+        minimize_walking (bool, optional): Prefer less walking. Defaults to False.
+        minimize_transfers (bool, optional): Prefer fewer trips. Defaults to False.
+
+    Returns:
+        Optional[Dict[str, Any]]: The chosen journey, None if there is none.
+    """
+    if not journeys:
+        return None
+    return min(
+        journeys,
+        key=lambda j: (
+            j["trips"] if minimize_transfers else 0,
+            j["walking_time"] if minimize_walking else 0,
+            j["arrival_time"],
+            j["trips"],
+            j["walking_time"],
+        ),
+    )
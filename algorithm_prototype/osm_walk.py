@@ -0,0 +1,375 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from heapq import heappop, heappush
+from statistics import median
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from xml.etree.ElementTree import iterparse
+
+from algorithm_prototype.footpaths import (
+    FootpathIndex,
+    PointGrid,
+    footpath_index_from_pairs,
+)
+from algorithm_prototype.raptor import (
+    helper_functions as hf,
+    Stop,
+    MAX_WALK_DIST,
+    MIN_TRANSFER_TIME,
+    WALKING_SPEED,
+)
+
+# highway=* values people can walk along
+WALKABLE_HIGHWAYS = frozenset(
+    {
+        "footway",
+        "pedestrian",
+        "path",
+        "steps",
+        "corridor",
+        "living_street",
+        "residential",
+        "service",
+        "unclassified",
+        "road",
+        "track",
+        "cycleway",
+        "tertiary",
+        "tertiary_link",
+        "secondary",
+        "secondary_link",
+        "primary",
+        "primary_link",
+        "trunk",
+        "trunk_link",
+    }
+)
+# furthest a stop may be from the street graph to be snapped to it (meters)
+MAX_SNAP_DIST = 200
+# source stops handed to a worker at a time
+STOPS_PER_TASK = 64
+
+
+@dataclass(frozen=True)
+class PedestrianGraph:
+    """Walkable OSM ways as a compact, undirected street graph (see read_osm).
+
+    Layout:
+        - node n (only nodes on walkable ways, renumbered from 0) is at
+          (lats[n], lons[n])
+        - node n has edges to targets[offsets[n]:offsets[n + 1]], lengths[...]
+          meters long (each way segment in both directions)
+    """
+
+    lats: Sequence[float]
+    lons: Sequence[float]
+    offsets: Sequence[int]
+    targets: Sequence[int]
+    lengths: Sequence[float]
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.lats)
+
+
+def _walkable(tags: Dict[str, str]) -> bool:
+    """Whether a way with these tags can be walked along."""
+    if tags.get("highway") not in WALKABLE_HIGHWAYS:
+        return False
+    foot = tags.get("foot")
+    if foot in ("no", "private"):
+        return False
+    if tags.get("access") in ("no", "private"):
+        return foot in ("yes", "designated", "permissive")
+    return True
+
+
+def _read_osm_xml(
+    path: str,
+) -> Tuple[Dict[int, Tuple[float, float]], List[List[int]]]:
+    """Node coordinates and walkable ways (node refs) of an .osm XML file."""
+    coords: Dict[int, Tuple[float, float]] = {}
+    ways: List[List[int]] = []
+    root = None
+    for event, elem in iterparse(path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == "node":
+            coords[int(elem.get("id"))] = (
+                float(elem.get("lat")),
+                float(elem.get("lon")),
+            )
+        elif elem.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+            if _walkable(tags):
+                ways.append([int(nd.get("ref")) for nd in elem.iter("nd")])
+        else:
+            continue
+        # drop what was read, an extract does not fit in memory as a tree
+        root.clear()
+    return coords, ways
+
+
+def _read_osm_pbf(
+    path: str,
+) -> Tuple[Dict[int, Tuple[float, float]], List[List[int]]]:
+    """Node coordinates and walkable ways of an .osm.pbf file (needs pyosmium)."""
+    try:
+        import osmium
+    except ImportError as e:
+        raise ImportError(
+            "Reading .osm.pbf extracts needs pyosmium (pip install osmium), or "
+            "convert the extract to .osm XML (e.g. osmium cat in.osm.pbf -o out.osm)"
+        ) from e
+
+    class _WayHandler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.coords: Dict[int, Tuple[float, float]] = {}
+            self.ways: List[List[int]] = []
+
+        def way(self, w):
+            if not _walkable({tag.k: tag.v for tag in w.tags}):
+                return
+            refs = []
+            for node in w.nodes:
+                if node.location.valid():
+                    self.coords[node.ref] = (node.location.lat, node.location.lon)
+                    refs.append(node.ref)
+            self.ways.append(refs)
+
+    handler = _WayHandler()
+    handler.apply_file(path, locations=True)
+    return handler.coords, handler.ways
+
+
+def read_osm(path: str) -> PedestrianGraph:
+    """Build the pedestrian graph of a local OpenStreetMap extract: .osm XML, or
+    .osm.pbf with pyosmium installed. Only nodes on walkable ways (see
+    WALKABLE_HIGHWAYS) are kept.
+
+    Args:
+        path (str): Path to the extract.
+
+    Returns:
+        PedestrianGraph: The street graph.
+    """
+    if path.endswith(".pbf"):
+        coords, ways = _read_osm_pbf(path)
+    else:
+        coords, ways = _read_osm_xml(path)
+    return build_pedestrian_graph(coords, ways)
+
+
+def build_pedestrian_graph(
+    coords: Dict[int, Tuple[float, float]], ways: Iterable[Sequence[int]]
+) -> PedestrianGraph:
+    """Compact OSM ways into a PedestrianGraph: nodes renumbered in order of
+    first use, an edge per way segment in both directions. Refs without
+    coordinates (outside the extract) are skipped.
+
+    Args:
+        coords (Dict[int, Tuple[float, float]]): (lat, lon) of OSM node ids.
+        ways (Iterable[Sequence[int]]): Node refs of each walkable way.
+
+    Returns:
+        PedestrianGraph: The street graph.
+    """
+    node_index: Dict[int, int] = {}
+    lats = array("d")
+    lons = array("d")
+    adj: List[List[Tuple[int, float]]] = []
+    for refs in ways:
+        prev = -1
+        for ref in refs:
+            if ref not in coords:
+                continue
+            n = node_index.get(ref)
+            if n is None:
+                n = node_index[ref] = len(lats)
+                lat, lon = coords[ref]
+                lats.append(lat)
+                lons.append(lon)
+                adj.append([])
+            if prev >= 0 and prev != n:
+                length = hf.haversine(lats[prev], lons[prev], lats[n], lons[n])
+                adj[prev].append((n, length))
+                adj[n].append((prev, length))
+            prev = n
+
+    offsets = array("i", [0])
+    targets = array("i")
+    lengths = array("d")
+    for edges in adj:
+        for v, length in edges:
+            targets.append(v)
+            lengths.append(length)
+        offsets.append(len(targets))
+    return PedestrianGraph(lats, lons, offsets, targets, lengths)
+
+
+def snap_to_graph(
+    graph: PedestrianGraph,
+    stops: Dict[str, Stop],
+    max_snap_dist: float = MAX_SNAP_DIST,
+) -> List[Tuple[int, float]]:
+    """Nearest graph node of each stop, found in a grid of max_snap_dist cells
+    (see PointGrid).
+
+    Args:
+        graph (PedestrianGraph): Street graph.
+        stops (Dict[str, Stop]): Stops to snap.
+        max_snap_dist (float, optional): Furthest a node may be, in meters.
+            Defaults to MAX_SNAP_DIST.
+
+    Returns:
+        List[Tuple[int, float]]: (node, distance in meters) per stop in the
+            order of stops, node -1 if none is within max_snap_dist.
+    """
+    if graph.num_nodes == 0:
+        return [(-1, 0.0)] * len(stops)
+    grid = PointGrid(graph.lats, graph.lons, max_snap_dist)
+    snaps: List[Tuple[int, float]] = []
+    for stop in stops.values():
+        node, distance = grid.nearest(stop.lat, stop.lon, max_snap_dist)
+        snaps.append((node, distance) if node >= 0 else (-1, 0.0))
+    return snaps
+
+
+# graph and snapped stops of a worker process (see _init_worker)
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(
+    graph: PedestrianGraph,
+    snaps: List[Tuple[int, float]],
+    max_walking_dist: float,
+) -> None:
+    node_stops: Dict[int, List[int]] = {}
+    for s, (node, _) in enumerate(snaps):
+        if node >= 0:
+            node_stops.setdefault(node, []).append(s)
+    _worker.update(
+        graph=graph, snaps=snaps, node_stops=node_stops, max_dist=max_walking_dist
+    )
+
+
+def _walks_from(sources: Sequence[int]) -> List[Tuple[int, int, float]]:
+    """(from stop, to stop, walking distance) of the stops walkable from each
+    source stop: a Dijkstra search over the street graph from the source's node,
+    bounded by the maximum walking distance (snapping walks included)."""
+    graph: PedestrianGraph = _worker["graph"]
+    snaps: List[Tuple[int, float]] = _worker["snaps"]
+    node_stops: Dict[int, List[int]] = _worker["node_stops"]
+    max_dist: float = _worker["max_dist"]
+    offsets, targets, lengths = graph.offsets, graph.targets, graph.lengths
+
+    walks: List[Tuple[int, int, float]] = []
+    for s in sources:
+        source_node, snap = snaps[s]
+        dist: Dict[int, float] = {source_node: snap}
+        heap: List[Tuple[float, int]] = [(snap, source_node)]
+        while heap:
+            d, u = heappop(heap)
+            if d > dist[u]:
+                continue
+            for t in node_stops.get(u, ()):
+                walk = d + snaps[t][1]
+                if t != s and walk <= max_dist:
+                    walks.append((s, t, walk))
+            for j in range(offsets[u], offsets[u + 1]):
+                v = targets[j]
+                reached = d + lengths[j]
+                if reached <= max_dist and reached < dist.get(v, max_dist + 1):
+                    dist[v] = reached
+                    heappush(heap, (reached, v))
+    return walks
+
+
+def street_footpaths(
+    graph: PedestrianGraph,
+    stops: Dict[str, Stop],
+    max_walking_dist: float = MAX_WALK_DIST,
+    max_snap_dist: float = MAX_SNAP_DIST,
+    processes: Optional[int] = None,
+    min_transfer_time: int = MIN_TRANSFER_TIME,
+    walking_speed: float = WALKING_SPEED,
+) -> FootpathIndex:
+    """Footpaths between stops along the street graph, for the footpath store
+    (see write_footpath_index), so queries never touch the graph.
+
+    Every stop is snapped to its nearest node (see snap_to_graph) and one
+    Dijkstra search per stop, bounded by max_walking_dist, finds the walking
+    distance to the stops around it (many-to-many). The searches run in
+    parallel over a process pool. A stop too far from any street to snap keeps
+    its straight-line footpaths. Each stop also gets an access detour, the
+    median of street over straight-line distance of its footpaths, which
+    scales the walks to and from it at query time (see FootpathIndex).
+
+    Args:
+        graph (PedestrianGraph): Street graph (see read_osm).
+        stops (Dict[str, Stop]): Stops to connect.
+        max_walking_dist (float, optional): Longest footpath in meters.
+            Defaults to MAX_WALK_DIST.
+        max_snap_dist (float, optional): Furthest a stop may be from the street
+            graph in meters. Defaults to MAX_SNAP_DIST.
+        processes (int, optional): Worker processes, one per CPU if None, none
+            (search in this process) if 1.
+        min_transfer_time (int, optional): Minimum time to complete a transfer.
+            Defaults to MIN_TRANSFER_TIME.
+        walking_speed (float, optional): Walking speed in meters per minute.
+            Defaults to WALKING_SPEED.
+
+    Returns:
+        FootpathIndex: The street network footpaths, nearest first.
+    """
+    stop_list = list(stops.values())
+    snaps = snap_to_graph(graph, stops, max_snap_dist)
+    snapped = [s for s, (node, _) in enumerate(snaps) if node >= 0]
+    tasks = [
+        snapped[i : i + STOPS_PER_TASK] for i in range(0, len(snapped), STOPS_PER_TASK)
+    ]
+
+    walks: List[Tuple[int, int, float]] = []
+    if processes == 1:
+        _init_worker(graph, snaps, max_walking_dist)
+        for task in tasks:
+            walks.extend(_walks_from(task))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(graph, snaps, max_walking_dist),
+        ) as executor:
+            for task_walks in executor.map(_walks_from, tasks):
+                walks.extend(task_walks)
+
+    # stops off the street graph walk in a straight line
+    sources, targets, distances = hf.walkable_pairs(stops, max_walking_dist)
+    for s, t, distance in zip(sources, targets, distances):
+        if snaps[s][0] < 0 or snaps[t][0] < 0:
+            walks.append((s, t, distance))
+    walks.sort()
+
+    ratios: Dict[int, List[float]] = {}
+    for s, t, walk in walks:
+        a, b = stop_list[s], stop_list[t]
+        straight = hf.haversine(a.lat, a.lon, b.lat, b.lon)
+        if straight > 0:
+            ratios.setdefault(s, []).append(walk / straight)
+    access_detours = {
+        stop_list[s].id: max(1.0, median(values)) for s, values in ratios.items()
+    }
+
+    return footpath_index_from_pairs(
+        stops,
+        [walk[0] for walk in walks],
+        [walk[1] for walk in walks],
+        [walk[2] for walk in walks],
+        max_walking_dist,
+        access_detours=access_detours,
+        min_transfer_time=min_transfer_time,
+        walking_speed=walking_speed,
+    )
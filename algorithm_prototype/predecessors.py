@@ -0,0 +1,161 @@
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from algorithm_prototype.timetable import Timetable
+
+# prev_stop of a stop without predecessor (and route/trip of a footpath)
+NONE: int = -1
+# bounded walk of the predecessor chain (as helper_functions.detect_local_cycle)
+MAX_CYCLE_STEPS: int = 128
+
+# the parallel arrays of one round, in this order
+LayerArrays = Tuple[Sequence[int], ...]
+FIELDS: Tuple[str, ...] = (
+    "prev_stop",
+    "arrival_time",
+    "route",
+    "trip",
+    "board_pos",
+    "disembark_pos",
+    "transfer_time",
+)
+
+
+class PredecessorLayers:
+    """Predecessors of a RAPTOR search per round, stored as parallel integer
+    arrays instead of a dict per improvement.
+
+    For round k and stop s: prev_stop (the boarding stop of the trip or the start
+    of the footpath, NONE if s has no predecessor in the round), arrival_time,
+    route and trip indices (NONE for a footpath), board_pos / disembark_pos of
+    the trip and transfer_time of the footpath. A round's arrays are allocated
+    when the round first runs (see allocate), so unused rounds cost nothing.
+    With a pool (see QueryWorkspace.layers) they are taken from / added to it,
+    clean arrays reused from an earlier query.
+
+    layers[k][s] gives the predecessor as a dict (the format reconstruct_path
+    reads), built on access - only the steps of a path are ever materialized.
+    """
+
+    def __init__(
+        self,
+        timetable: Timetable,
+        max_rounds: int,
+        pool: Optional[List[Optional[LayerArrays]]] = None,
+    ):
+        self.num_stops = timetable.num_stops
+        self.route_ids = timetable.route_ids
+        self.trip_day_id = timetable.trip_day_id
+        self.rounds: List[Optional[LayerArrays]] = [None] * (max_rounds + 1)
+        self.pool = pool
+
+    def allocate(self, k: int) -> LayerArrays:
+        """Arrays of round k (see FIELDS), allocated (all NONE) if not yet."""
+        arrays = self.rounds[k]
+        if arrays is None:
+            pool = self.pool
+            if pool is not None and k < len(pool):
+                arrays = pool[k]
+            if arrays is None:
+                # int32: times, indices and positions all fit
+                empty = array("i", [NONE]) * self.num_stops
+                arrays = tuple(array("i", empty) for _ in FIELDS)
+                if pool is not None:
+                    pool.extend([None] * (k + 1 - len(pool)))
+                    pool[k] = arrays
+            self.rounds[k] = arrays
+        return arrays
+
+    def step(self, k: int, stop_idx: int) -> Optional[Dict[str, Any]]:
+        """Predecessor of stop_idx in round k as a dict, None if it has none.
+
+        Trip steps have prev_idx, arrival_time, mode ("trip"), route_id, trip_id,
+        transfer_time (None), board_pos, disembark_pos, round and prev_round
+        (k - 1); footpath steps have no positions and prev_round k.
+        """
+        arrays = self.rounds[k]
+        if arrays is None or arrays[0][stop_idx] == NONE:
+            return None
+        prev_stop, arrival_time, route, trip, board_pos, disembark_pos, walk = (
+            int(field[stop_idx]) for field in arrays
+        )
+        if trip != NONE:
+            return {
+                "prev_idx": prev_stop,
+                "arrival_time": arrival_time,
+                "mode": "trip",
+                "route_id": self.route_ids[route],
+                "trip_id": self.trip_day_id(trip, disembark_pos, arrival_time),
+                "transfer_time": None,
+                "board_pos": board_pos,
+                "disembark_pos": disembark_pos,
+                "round": k,
+                "prev_round": k - 1,
+            }
+        return {
+            "prev_idx": prev_stop,
+            "arrival_time": arrival_time,
+            "mode": "transfer",
+            "route_id": None,
+            "trip_id": None,
+            "transfer_time": walk,
+            "round": k,
+            "prev_round": k,  # transfers stay in same round
+        }
+
+    def __len__(self) -> int:
+        return len(self.rounds)
+
+    def __getitem__(self, k: int) -> "PredecessorLayer":
+        if not 0 <= k < len(self.rounds):
+            raise IndexError(k)
+        return PredecessorLayer(self, k)
+
+
+class SuccessorLayers(PredecessorLayers):
+    """Successors of a backward search (see reverse_raptor) per round, in the
+    arrays of PredecessorLayers read the other way: prev_stop is the next stop
+    towards the target (where the trip is left or the footpath ends) and
+    arrival_time the arrival there. Steps have next_idx and next_round instead
+    of prev_idx and prev_round.
+    """
+
+    def step(self, k: int, stop_idx: int) -> Optional[Dict[str, Any]]:
+        step = super().step(k, stop_idx)
+        if step is not None:
+            step["next_idx"] = step.pop("prev_idx")
+            step["next_round"] = step.pop("prev_round")
+        return step
+
+
+class PredecessorLayer:
+    """Read-only view of one round of PredecessorLayers, indexed by stop."""
+
+    def __init__(self, layers: PredecessorLayers, k: int):
+        self.layers = layers
+        self.k = k
+
+    def __len__(self) -> int:
+        return self.layers.num_stops
+
+    def __getitem__(self, stop_idx: int) -> Optional[Dict[str, Any]]:
+        return self.layers.step(self.k, stop_idx)
+
+    def __iter__(self) -> Iterator[Optional[Dict[str, Any]]]:
+        return (self.layers.step(self.k, s) for s in range(self.layers.num_stops))
+
+
+def creates_cycle(prev_stop: Sequence[int], current_idx: int, prev_idx: int) -> bool:
+    """Would making prev_idx the predecessor of current_idx close a cycle in the
+    round? Same checks as helper_functions.safe_set_predecessor: a 2-cycle, or
+    current_idx on the (bounded) predecessor chain of prev_idx."""
+    if prev_stop[prev_idx] == current_idx:
+        return True
+    steps = 0
+    cur = prev_idx
+    while steps < MAX_CYCLE_STEPS and prev_stop[cur] != NONE:
+        if cur == current_idx:
+            return True
+        cur = prev_stop[cur]
+        steps += 1
+    return False
@@ -1,13 +1,38 @@
 ### version 1
 # import multiprocessing as mp
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
 from os import name, walk
 import queue
 from re import I
 import sys
-from typing import Any, List, Dict, Literal, Optional, Tuple
+from typing import Any, Callable, List, Dict, Literal, Optional, Tuple
 from math import ceil, radians, cos, sin, asin, sqrt
-from rtree import index
+
+from algorithm_prototype.footpaths_numpy import grid_walkable_pairs
+from algorithm_prototype.predecessors import NONE, PredecessorLayers, creates_cycle
+from algorithm_prototype.raptor_numba import (
+    HAS_NUMBA,
+    TimetableArrays,
+    cached_timetable_arrays,
+    raptor_rounds_compiled,
+)
+from algorithm_prototype.raptor_numpy import (
+    HAS_NUMPY,
+    HOLE,
+    RouteMatrices,
+    np,
+    scan_route,
+)
+from algorithm_prototype.timetable import (
+    MIN_TRANSFER_TIME,
+    Timetable,
+    build_timetable,
+    day_offsets,
+    format_trip_day,
+    validate_timetable,
+)
+from algorithm_prototype.workspace import QueryWorkspace, query_workspace
 
 # Haversine formula
 
@@ -15,7 +40,6 @@ from rtree import index
 INF: int = sys.maxsize
 MAX_WALK_DIST = 1000  # maximum walkable distance in meters
 WALKING_SPEED = 5 * 1000 / 60  # meters oer minute
-MIN_TRANSFER_TIME = 1  # mins
 EARTH_RADIUS_KM = 6371.0  # Standard Earth radius
 METERS_PER_DEG_LAT = 111111  # Approx. meters per degree lat
 
@@ -48,6 +72,9 @@ class Trip:
     departure_times: List[
         int
     ]  # departure times at corresponding stops (from associated route)
+    # days the trip runs on (bit d = day d, 0=Monday), its times then being
+    # minutes after midnight of that day. 0: runs once, times since Monday 00:00
+    service_days: int = 0
 
 
 @dataclass
@@ -64,6 +91,13 @@ class Route:
     def mode(self) -> int:
         return self.stops[0].mode if self.stops else -1
 
+    def sort_trips(self):
+        """Sort trips by departure (first finite time), so trip order follows the
+        timetable. Called once at load."""
+        self.trips.sort(
+            key=lambda t: (next((x for x in t.departure_times if x != INF), INF), t.id)
+        )
+
     def add_trip(self, trip: Trip):
         # Ensure trip matches stop count
         # TODO check that no duplicate trips
@@ -84,6 +118,7 @@ class Transfer:
     from_stop: Stop
     to_stop: Stop
     walking_time: int  # time in minutes
+    distance: Optional[float] = None  # walking distance in meters (None: straight line)
 
 
 class helper_functions:
@@ -253,29 +288,36 @@ class helper_functions:
         return True, -1
 
     @staticmethod
-    def create_transfers(
+    def walkable_pairs(
         stops: Dict[str, Stop],
-        max_walking_dist: int = MAX_WALK_DIST,
-        min_transfer_time: int = MIN_TRANSFER_TIME,
-        walking_speed: float = WALKING_SPEED,
-    ) -> List[Transfer]:
-        """Creates transfers between all stops that are walkable within the specified maximum walking distance.
-        Use R-tree pre-filter for efficiency (O(n log n))
+        max_walking_dist: float = MAX_WALK_DIST,
+    ) -> Tuple[List[int], List[int], List[float]]:
+        """Finds all ordered pairs of distinct stops at most max_walking_dist apart.
+        With NumPy a vectorized grid hash (see grid_walkable_pairs), otherwise an
+        R-tree pre-filter (O(n log n), needs rtree)
 
         Args:
-            stops (Dict[str, Stop]): Stops to consider for transfers.
-            max_walking_dist (int, optional): Maximum distance to create transfers between. Defaults to MAX_WALK_DIST.
-            min_transfer_time (int, optional): Minimum time to complete a transfer. Defaults to MIN_TRANSFER_TIME.
-            walking_speed (float, optional): Speed of travel -> Determines time taken. Defaults to WALKING_SPEED.
+            stops (Dict[str, Stop]): Stops to consider.
+            max_walking_dist (float, optional): Maximum distance in meters. Defaults to MAX_WALK_DIST.
 
         Returns:
-            List[Transfer]: List of transfers between stops.
+            Tuple[List[int], List[int], List[float]]: (from stop, to stop, distance in meters) columns
+            of the pairs, stops by position in stops. Ordered by from stop, then to stop.
         """
-
-        # determine if walkable
-        transfers: List[Transfer] = []
         stop_list = list(stops.values())
+        if HAS_NUMPY:
+            sources, targets, distances = grid_walkable_pairs(
+                [stop.lat for stop in stop_list],
+                [stop.lon for stop in stop_list],
+                max_walking_dist,
+            )
+            return sources.tolist(), targets.tolist(), distances.tolist()
 
+        from rtree import index
+
+        sources: List[int] = []
+        targets: List[int] = []
+        distances: List[float] = []
         # build r-tree index
         p = index.Property()
         idx = index.Index(properties=p)
@@ -288,17 +330,19 @@ class helper_functions:
         degree_offset = (
             max_walking_dist / METERS_PER_DEG_LAT
         )  # simplified bounding degree distance
-        for s1 in stop_list:
+        for s1_index, s1 in enumerate(stop_list):
+            # a degree of longitude is shorter away from the equator
+            lon_offset = degree_offset / max(cos(radians(s1.lat)), 1e-6)
             # define bounding box centered at s1
             # (min_lon, min_lat, max_lon, max_lat)
             bounding_box = (
-                s1.lon - degree_offset,
+                s1.lon - lon_offset,
                 s1.lat - degree_offset,
-                s1.lon + degree_offset,
+                s1.lon + lon_offset,
                 s1.lat + degree_offset,
             )
 
-            candidate_indices = idx.intersection(bounding_box)
+            candidate_indices = sorted(idx.intersection(bounding_box))
 
             # refine with haversine distance
             for s2_index in candidate_indices:
@@ -310,13 +354,44 @@ class helper_functions:
                 distance = helper_functions.haversine(s1.lat, s1.lon, s2.lat, s2.lon)
 
                 if distance <= max_walking_dist:
-                    walk_time_minutes = max(
-                        min_transfer_time,
-                        ceil(distance / walking_speed),  # meters per minute
-                    )
-                    transfers.append(Transfer(s1, s2, walk_time_minutes))
+                    sources.append(s1_index)
+                    targets.append(s2_index)
+                    distances.append(distance)
 
-        return transfers
+        return sources, targets, distances
+
+    @staticmethod
+    def create_transfers(
+        stops: Dict[str, Stop],
+        max_walking_dist: int = MAX_WALK_DIST,
+        min_transfer_time: int = MIN_TRANSFER_TIME,
+        walking_speed: float = WALKING_SPEED,
+    ) -> List[Transfer]:
+        """Creates transfers between all stops that are walkable within the specified maximum walking distance.
+        Pairs come from walkable_pairs: a vectorized NumPy grid hash, or an R-tree pre-filter without NumPy
+
+        Args:
+            stops (Dict[str, Stop]): Stops to consider for transfers.
+            max_walking_dist (int, optional): Maximum distance to create transfers between. Defaults to MAX_WALK_DIST.
+            min_transfer_time (int, optional): Minimum time to complete a transfer. Defaults to MIN_TRANSFER_TIME.
+            walking_speed (float, optional): Speed of travel -> Determines time taken. Defaults to WALKING_SPEED.
+
+        Returns:
+            List[Transfer]: List of transfers between stops.
+        """
+        stop_list = list(stops.values())
+        sources, targets, distances = helper_functions.walkable_pairs(
+            stops, max_walking_dist
+        )
+        return [
+            Transfer(
+                stop_list[i],
+                stop_list[j],
+                max(min_transfer_time, ceil(distance / walking_speed)),
+                distance,
+            )
+            for i, j, distance in zip(sources, targets, distances)
+        ]
 
     @staticmethod
     def create_transfer_map(
@@ -384,13 +459,13 @@ class helper_functions:
         if pred_prev is not None and pred_prev.get("prev_idx") == current_idx:
             if debug:
                 # raise ValueError(
-                #    f"2-cycle avoided: {idx_to_id.get(prev_idx)} <-> {idx_to_id.get(current_idx)} "
+                #    f"2-cycle avoided: {idx_to_id[prev_idx]} <-> {idx_to_id[current_idx]} "
                 #    f"(mode={mode}, route={route_id}, trip={trip_id})"
                 # )
                 # Log instead of raising; skip update
                 raise ValueError(
                     f"[safe_set_predecessor] 2-cycle skipped: "
-                    f"{idx_to_id.get(prev_idx)} <-> {idx_to_id.get(current_idx)} "
+                    f"{idx_to_id[prev_idx]} <-> {idx_to_id[current_idx]} "
                     f"(mode={mode}, route={route_id}, trip={trip_id}, t={arrival_time})"
                 )
             return False
@@ -405,7 +480,7 @@ class helper_functions:
                 # Log instead of raising; skip update
                 raise ValueError(
                     f"[safe_set_predecessor] 2-cycle skipped: "
-                    f"{idx_to_id.get(prev_idx)} <-> {idx_to_id.get(current_idx)} "
+                    f"{idx_to_id[prev_idx]} <-> {idx_to_id[current_idx]} "
                     f"(mode={mode}, route={route_id}, trip={trip_id}, t={arrival_time})"
                 )
             return False
@@ -421,313 +496,1118 @@ class helper_functions:
         return True
 
 
-def raptor_algo(
-    stops: Dict[str, Stop],
-    routes: Dict[str, Route],
-    transfers: List[Transfer],
-    source_id: str,
-    target_id: str,
-    departure_time: int,
-    max_rounds: int = 10,
-    debug: bool = True,
-) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
-    """RAPTOR - Round bAsed Public Transit Optimised Router.
+def _check_network(timetable: Timetable, debug: bool) -> None:
+    """Trace mode only: validate the timetable, unless validate_timetable already
+    did at load. Queries otherwise run no checks."""
+    if debug and not timetable.validated:
+        validate_timetable(timetable)
 
-    v1: unoptimised
+
+def _target_lower_bound(
+    timetable: Timetable, targets: Dict[int, int], lower_bound: bool
+) -> Optional[Callable[[int], float]]:
+    """Build the function used for target pruning (see raptor_algo).
 
     Args:
-        TODO
+        timetable (Timetable): Compiled timetable.
+        targets (Dict[int, int]): Target stop indices with their egress walk
+            (minutes), empty disables pruning.
+        lower_bound (bool): Use the straight-line distance to the target divided
+            by the fastest speed in the network, otherwise 0 (plus the egress walk).
 
     Returns:
-        Tuple[Dict[str, int], List[Optional[Dict]]]:
-            - Dict of earliest arrival times at all stops.
-            - List of steps (the reconstructed fastest path from source to target).
+        Optional[Callable[[int], float]]: Lower bound on the time left from a stop
+            to the destination, or None if there is nothing to prune against.
     """
+    if not targets:
+        return None
+    min_egress = min(targets.values())
+    max_speed = timetable.max_speed
+    if not (lower_bound and 0 < max_speed < float("inf")):
+        return lambda stop_idx: min_egress
+
+    # computed lazily as only touched stops need it
+    bound = [-1.0] * timetable.num_stops
+
+    def remaining(stop_idx: int) -> float:
+        if bound[stop_idx] < 0:
+            bound[stop_idx] = min(
+                timetable.distance(stop_idx, t) / max_speed + egress
+                for t, egress in targets.items()
+            )
+        return bound[stop_idx]
 
-    check_transfer_loops(transfers)  # check no self loops in transfers
+    return remaining
 
-    if debug:
-        # detect accidental duplicates or bad trip times before running
-        for r in routes.values():
-            for t in r.trips:
-                try:
-                    helper_functions._check_trip_times(t.departure_times)
-                except ValueError as e:
-                    raise ValueError(
-                        f"In route_id '{r.id}', trip_id '{t.id}': {e}"
-                    ) from e
-
-    # build index mapping for array storage
-    stop_ids = list(stops.keys())
-    id_to_idx: Dict[str, int] = {sid: i for i, sid in enumerate(stop_ids)}
-    idx_to_id: Dict[int, str] = {i: sid for sid, i in id_to_idx.items()}
-    n = len(stops.keys())
-
-    # adjacency lists for transfers (indices) - walking time from stop u to v
-    # TODO: THIS TAKES STUPIDLY LONG - DO IN PREPROCESSING
-    transfer_adj: List[List[Tuple[int, int]]] = [[] for _ in range(n)]
-    for t in transfers:
-        u = id_to_idx[t.from_stop.id]
-        v = id_to_idx[t.to_stop.id]
-        transfer_adj[u].append((v, t.walking_time))
 
-    # compute route-stop indices
-    routes_stop_indices: Dict[str, List[int]] = {}
-    for rid, route in routes.items():
-        routes_stop_indices[rid] = [id_to_idx[s.id] for s in route.stops]
+def _lower_label(labels: List[List[int]], k: int, stop_idx: int, time: int) -> None:
+    """Record an arrival at stop_idx using k trips: it is also the best so far
+    for any higher number of trips. Labels never increase with k, so stop at the
+    first round that is already as good."""
+    for j in range(k, len(labels)):
+        if labels[j][stop_idx] <= time:
+            break
+        labels[j][stop_idx] = time
 
-    target_idx: Optional[int] = id_to_idx[target_id] if target_id in id_to_idx else None
 
-    # earliest arrival time for each stop over all rounds
-    best = [INF] * n
-    prev = [INF] * n
-    cur = [INF] * n
+def _check_target_cycles(
+    predecessor: List[Optional[Dict]],
+    idx_to_id: Dict[int, str],
+    targets: Dict[int, int],
+) -> None:
+    """Cycle check of the predecessor chains of all targets in one layer (chains
+    end at a stop without predecessor in the layer, as the sources)."""
+    for target_idx in targets:
+        check_predecessor_cycles(predecessor, idx_to_id, target_idx, -1)
+
+
+def _cycle_error(
+    idx_to_id: Tuple[str, ...],
+    current_idx: int,
+    prev_idx: int,
+    mode: str,
+    trip_id: Optional[str],
+) -> ValueError:
+    """Error raised in trace mode for a predecessor that would close a cycle (see
+    helper_functions.safe_set_predecessor)."""
+    return ValueError(
+        f"Cycle skipped while setting predecessor of {idx_to_id[current_idx]} "
+        f"from {idx_to_id[prev_idx]} (mode={mode}, trip={trip_id})"
+    )
 
-    # initialise
-    if source_id not in id_to_idx:
-        raise ValueError("Origin not a valid Stop.")
-    source_idx = id_to_idx[source_id]
 
-    # store predecessors for path reconstruction
-    # each entry is a dict per round with keys: prev_idx, arrival_time, mode, route_id, trip_id, transfer_time
-    # or None if no predecessor (initially)
-    predecessor_layers: List[List[Optional[Dict]]] = [
-        [None] * n for _ in range(max_rounds + 1)
-    ]
-    improved_round: List[int] = [-1] * n  # last round a stop was improved
-
-    best[source_idx] = departure_time
-    prev[source_idx] = departure_time
-    cur[source_idx] = departure_time
-    # ↓ source known at round 0 ↓
-    improved_round[source_idx] = 0
-    predecessor_layers[0][source_idx] = None
-
-    # marked stops: those improved in the last round (init to only source)
-    marked = [False] * n
-    marked[source_idx] = True
-    marked_list = [source_idx]
+def _copy_labels(labels: List[List[int]]) -> List["np.ndarray"]:
+    """NumPy copies of labels, one per distinct list (rounds sharing a list, as
+    in a single run, share the copy)."""
+    copies: Dict[int, "np.ndarray"] = {}
+    for row in labels:
+        if id(row) not in copies:
+            copies[id(row)] = np.array(row, dtype=np.int64)
+    return [copies[id(row)] for row in labels]
+
+
+def _sync_labels(
+    label_arrays: List["np.ndarray"],
+    labels: List[List[int]],
+    k: int,
+    stops: List[int],
+) -> None:
+    """Copy the labels of stops, set from round k on (see _lower_label), to their
+    NumPy copies."""
+    if not stops:
+        return
+    synced = set()
+    for j in range(k, len(labels)):
+        row = labels[j]
+        if id(row) not in synced:
+            synced.add(id(row))
+            label_arrays[j][stops] = [row[stop_idx] for stop_idx in stops]
+
+
+def _raptor_rounds(
+    timetable: Timetable,
+    sources: Dict[int, int],
+    targets: Dict[int, int],
+    max_rounds: int,
+    labels: List[List[int]],
+    predecessor_layers: PredecessorLayers,
+    improved_round: List[int],
+    remaining: Optional[Callable[[int], float]],
+    debug: bool,
+    route_matrices: Optional[RouteMatrices] = None,
+    workspace: Optional[QueryWorkspace] = None,
+    label_arrays: Optional[List["np.ndarray"]] = None,
+    max_walk_dist: Optional[float] = None,
+) -> None:
+    """Run the RAPTOR rounds from the source stops.
+
+    labels, predecessor_layers and improved_round are updated in place. They are
+    normally fresh, but may hold the labels of an earlier run with a later
+    departure (rRAPTOR): those stay valid (one can always leave later) and prune
+    the search.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+        sources (Dict[int, int]): Source stop indices with the time each is
+            reached (departure time plus access walk).
+        targets (Dict[int, int]): Target stop indices with their egress walk
+            (minutes), may be empty.
+        max_rounds (int): Maximum number of rounds (trips).
+        labels (List[List[int]]): labels[k][s] is the earliest arrival at stop s
+            using at most k trips (see _lower_label). The same list may be used
+            for every round when only the overall earliest arrival matters.
+        predecessor_layers (PredecessorLayers): Predecessor per round and stop.
+        improved_round (List[int]): Last round each stop was improved in.
+        remaining (Optional[Callable[[int], float]]): Lower bound on the time from
+            a stop to the destination (including the egress walk), used for target
+            pruning. None disables pruning.
+        debug (bool): Trace mode: raise on a predecessor that would close a
+            cycle and check the targets' predecessor chains when improved.
+        route_matrices (RouteMatrices, optional): Scan the routes that have a
+            matrix with the NumPy kernel (see raptor_numpy), the rest in Python.
+        workspace (QueryWorkspace, optional): Round arrays to use (left clean,
+            the stops the rounds improved are added to its touched list).
+            Allocated here if not given.
+        label_arrays (List[np.ndarray], optional): NumPy copies of labels for
+            the route matrices (rounds sharing a list share the copy), kept in
+            step here. Copied from labels if not given.
+        max_walk_dist (float, optional): Only walk footpaths at most this many
+            meters long (the timetable's are nearest first, see
+            Timetable.transfer_distances). None walks all of them.
+    """
+    # integer stop indices come from the compiled timetable
+    idx_to_id = timetable.stop_ids
+    n = timetable.num_stops
+
+    # flat timetable arrays (locals for fast access in the loops below)
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    trip_ids = timetable.trip_ids
+    trip_time_offsets = timetable.trip_time_offsets
+    stop_times = timetable.stop_times
+    slot_departures = timetable.slot_departures
+    slot_trips = timetable.slot_trips
+    stop_route_offsets = timetable.stop_route_offsets
+    stop_routes = timetable.stop_routes
+    stop_route_positions = timetable.stop_route_positions
+    transfer_offsets = timetable.transfer_offsets
+    transfer_targets = timetable.transfer_targets
+    transfer_walks = timetable.transfer_walks
+    transfer_distances = timetable.transfer_distances
+    walk_limit = INF if max_walk_dist is None else max_walk_dist
+    fifo = timetable.fifo
+    matrix_times = route_matrices.times if route_matrices is not None else None
+
+    # earliest arrival with any number of trips (up to max_rounds)
+    best = labels[max_rounds]
+    # pruning: anything at or after target_arrival (best arrival at a target plus
+    # its egress walk) cannot give a better journey
+    prune = remaining is not None
+    target_arrival = min(
+        (best[t] + egress for t, egress in targets.items() if best[t] != INF),
+        default=INF,
+    )
+
+    # the round arrays are reused: only the entries written are reset, from
+    # the marked lists (a stop set in cur is marked in the round)
+    if workspace is None:
+        workspace = QueryWorkspace(n)
+    prev = workspace.prev
+    cur = workspace.cur
+    touched = workspace.touched
+    prev_stops: List[int] = list(sources)  # stops set in prev
+    cur_stops: List[int] = list(sources)  # set in cur, other than marked ones
+
+    # marked stops: those improved in the last round (init to the sources)
+    marked = workspace.marked
+    marked_list = []
+    touched.extend(sources)
+
+    for source_idx, time in sources.items():
+        _lower_label(labels, 0, source_idx, time)
+        prev[source_idx] = time
+        cur[source_idx] = time
+        # ↓ source known at round 0 ↓
+        improved_round[source_idx] = 0
+        marked[source_idx] = True
+        marked_list.append(source_idx)
+
+    # NumPy copies of prev and the labels for the vectorized route scan, updated
+    # where the lists change instead of copied every round
+    if matrix_times is not None:
+        prev_array = workspace.label_arrays()[0]
+        if label_arrays is None:
+            label_arrays = _copy_labels(labels)
+        _sync_labels(label_arrays, labels, 0, list(sources))
+        prev_array[prev_stops] = [prev[stop_idx] for stop_idx in prev_stops]
+
+    def ride(
+        k: int,
+        stop_idx: int,
+        trip_time: int,
+        r: int,
+        trip: int,
+        board_stop_idx: int,
+        boarded_at: int,
+        pos: int,
+    ) -> None:
+        """Commit an improvement of stop_idx by a trip boarded at board_stop_idx."""
+        nonlocal improved, target_arrival
+        # predecessor is the boarding stop (not the immediate previous stop).
+        # Arrival times strictly decrease along predecessor chains, so no cycle
+        # can form - only checked in trace mode
+        if debug and creates_cycle(pred_stop, stop_idx, board_stop_idx):
+            raise _cycle_error(
+                idx_to_id, stop_idx, board_stop_idx, "trip", trip_ids[trip]
+            )
+        # write to this round's layer, with boarding metadata for reconstruction
+        pred_stop[stop_idx] = board_stop_idx
+        pred_time[stop_idx] = trip_time
+        pred_route[stop_idx] = r
+        pred_trip[stop_idx] = trip
+        pred_board[stop_idx] = boarded_at
+        pred_disembark[stop_idx] = pos
+
+        # update times
+        cur[stop_idx] = trip_time
+        _lower_label(labels, k, stop_idx, trip_time)
+        # mark which round a stop was last improved
+        improved_round[stop_idx] = k
+
+        if not marked[stop_idx]:
+            marked[stop_idx] = True
+            marked_list.append(stop_idx)
+            improved = True
+
+        if stop_idx in targets:
+            target_arrival = min(target_arrival, trip_time + targets[stop_idx])
+
+        # debug: early cycle check when target reached
+        if debug and target_arrival != INF:
+            _check_target_cycles(predecessor_layers[k], idx_to_id, targets)
 
     # main round
     for k in range(1, max_rounds + 1):
         improved = False
+        # this round's predecessor arrays (allocated on first use)
+        (
+            pred_stop,
+            pred_time,
+            pred_route,
+            pred_trip,
+            pred_board,
+            pred_disembark,
+            pred_walk,
+        ) = predecessor_layers.allocate(k)
+        if matrix_times is not None:
+            # labels[k] only goes down during the round, its copy stays an upper
+            # bound until synced at the end of the round
+            round_labels = label_arrays[k]
 
         # 1: Accumulate routes serving marked stops from previous round
-        Q: List[Tuple[str, int]] = []  # (route_id, first_marked_stop_index_in_route)
-        for rid, route in routes.items():
-            stop_indices = routes_stop_indices[rid]
-            # find first marked index in the route
-            first_marked_pos = None
-            for pos, stop_idx in enumerate(stop_indices):
-                if marked[stop_idx]:
-                    first_marked_pos = pos
-                    break
-            if first_marked_pos is not None:
-                Q.append((rid, first_marked_pos))
+        # only the routes of marked stops are looked at, keeping the earliest
+        # marked position per route
+        Q: Dict[int, int] = {}  # route idx -> first_marked_stop_index_in_route
+        for stop_idx in marked_list:
+            for j in range(
+                stop_route_offsets[stop_idx], stop_route_offsets[stop_idx + 1]
+            ):
+                r = stop_routes[j]
+                pos = stop_route_positions[j]
+                if pos < Q.get(r, INF):
+                    Q[r] = pos
 
         # reset marked for this round — will mark as we improve earliest times
-        marked = [False] * n
+        for stop_idx in marked_list:
+            marked[stop_idx] = False
         marked_list = []
 
         # 2: Traverse each route
-        for rid, start_pos in Q:
-            cur_route = routes[rid]
-            stop_indices = routes_stop_indices[rid]
-            num_stops_in_route = len(stop_indices)
-
-            for trip in cur_route.trips:
-                # check whether we can board the trip (on this route) at any stop
-                # Try to board at earliest possible stop
-                boarded_at = None
-                best_board_time = None
-                for pos in range(start_pos, num_stops_in_route):
-                    stop_idx = stop_indices[pos]
-                    arr_prev = prev[stop_idx]
-                    if arr_prev == INF:
-                        continue  # if we cannot reach stop, then ignore
-                    trip_departure = trip.departure_times[pos]
-                    # skip invalid/missing times
-                    if trip_departure == INF:
-                        continue
-                    if trip_departure >= arr_prev:
-                        if best_board_time is None or trip_departure < best_board_time:
-                            best_board_time = trip_departure
-                            boarded_at = pos
-
-                if boarded_at is None:
-                    # can't use this trip from any marked stop
-                    continue
-
-                # stop where we boarded
-                board_stop_idx = stop_indices[boarded_at]
-                board_time = trip.departure_times[boarded_at]
-
-                # move along trip from boarded_at stop
-                # -> start look form stop after the boarding_at stop
-                for pos2 in range(boarded_at + 1, num_stops_in_route):
-                    stop_idx2 = stop_indices[pos2]
-                    # arrival time at stop_idx2
-                    trip_time = trip.departure_times[pos2]
-                    if trip_time == INF:
-                        continue  # don't propagate invalid times
-                    prev_stop_idx = stop_indices[pos2 - 1]
-
-                    # skip backward in time segments in the same trip
-                    prev_time_same_trip = trip.departure_times[pos2 - 1]
-                    if prev_time_same_trip != INF and trip_time < prev_time_same_trip:
-                        continue
-
-                    # NEW: enforce time >= boarding time to avoid drops after INF gaps/misalignment
-                    if trip_time < board_time:
-                        continue
-
-                    # commit only if both this round and overall best improved
-                    if trip_time < cur[stop_idx2] and trip_time < best[stop_idx2]:
-                        if stop_idx2 == source_idx and trip_time > departure_time:
-                            # Don't overwrite source with later time
-                            continue
-
-                        # predecessor is the boarding stop (not the immediate previous stop)
-                        if helper_functions.safe_set_predecessor(
-                            stop_idx2,
-                            board_stop_idx,
+        for r, start_pos in Q.items():
+            first_slot = route_stop_offsets[r]
+            num_stops_in_route = route_stop_offsets[r + 1] - first_slot
+
+            if matrix_times is not None and matrix_times[r] is not None:
+                # vectorized scan over all runs, then commit in route order
+                stops_on_route = route_matrices.stops[r]
+                arrivals, rows, board_positions = scan_route(
+                    matrix_times[r], prev_array[stops_on_route], start_pos
+                )
+                # labels only go down during a round: skip what can't beat them
+                offsets = np.flatnonzero(
+                    (arrivals != HOLE)
+                    & (arrivals < round_labels[stops_on_route[start_pos:]])
+                )
+                for offset, trip_time, trip, boarded_at in zip(
+                    offsets.tolist(),
+                    arrivals[offsets].tolist(),
+                    route_matrices.trips[r][rows[offsets]].tolist(),
+                    board_positions[offsets].tolist(),
+                ):
+                    pos = start_pos + offset
+                    stop_idx = route_stops[first_slot + pos]
+                    if (
+                        trip_time < cur[stop_idx]
+                        and trip_time < labels[k][stop_idx]
+                        and not (
+                            prune and trip_time + remaining(stop_idx) >= target_arrival
+                        )
+                    ):
+                        ride(
+                            k,
+                            stop_idx,
                             trip_time,
-                            "trip",
-                            rid,
-                            trip.id,
-                            None,
-                            predecessor_layers[k],  # write to this rounds layer
-                            idx_to_id,
-                            debug,
-                        ):
-                            # add boarding metadata to help reconstruction
-                            # TODO: handle predecessor_layers being None
-                            predecessor_layers[k][stop_idx2]["board_pos"] = boarded_at
-                            predecessor_layers[k][stop_idx2]["disembark_pos"] = pos2
-                            predecessor_layers[k][stop_idx2]["round"] = k
-                            predecessor_layers[k][stop_idx2]["prev_round"] = k - 1
-
-                            # update times
-                            cur[stop_idx2] = trip_time
-                            # best[stop_idx2] = min(best[stop_idx2], trip_time)
-                            best[stop_idx2] = trip_time
-                            # mark which round a stop was last improved
-                            improved_round[stop_idx2] = k
-
-                            if not marked[stop_idx2]:
-                                marked[stop_idx2] = True
-                                marked_list.append(stop_idx2)
-                                improved = True
-
-                            # debug: early cycle check when target reached
-                            if (
-                                debug
-                                and target_idx is not None
-                                and best[target_idx] != INF
-                            ):
-                                check_predecessor_cycles(
-                                    predecessor_layers[k],
-                                    idx_to_id,
-                                    target_idx,
-                                    source_idx,
+                            r,
+                            trip,
+                            route_stops[first_slot + boarded_at],
+                            boarded_at,
+                            pos,
+                        )
+                continue
+
+            # single pass along the route, holding the current (earliest) trip
+            trip = -1
+            trip_base = 0  # offset of the current trip's times in stop_times
+            day_offset = 0  # minutes to add to them for the day it runs on
+            boarded_at = -1
+            board_stop_idx = -1
+            board_time = INF
+
+            for pos in range(start_pos, num_stops_in_route):
+                stop_idx = route_stops[first_slot + pos]
+
+                # a) ride the current trip to this stop
+                if trip >= 0:
+                    time = stop_times[trip_base + pos]
+                    trip_time = time + day_offset
+                    # FIFO routes have a valid time at every stop. Otherwise don't
+                    # propagate invalid times, skip backward in time segments and
+                    # enforce time >= boarding time (INF gaps/misalignment)
+                    if (
+                        (
+                            fifo
+                            or (
+                                time != INF
+                                and trip_time >= board_time
+                                and not (
+                                    stop_times[trip_base + pos - 1] != INF
+                                    and time < stop_times[trip_base + pos - 1]
                                 )
+                            )
+                        )
+                        # commit only if both this round and overall best improved
+                        # (sources hold their departure, so no later overwrite)
+                        and trip_time < cur[stop_idx]
+                        and trip_time < labels[k][stop_idx]
+                        # can't lead to a faster journey to the target
+                        and not (
+                            prune and trip_time + remaining(stop_idx) >= target_arrival
+                        )
+                    ):
+                        ride(
+                            k,
+                            stop_idx,
+                            trip_time,
+                            r,
+                            trip,
+                            board_stop_idx,
+                            boarded_at,
+                            pos,
+                        )
 
-        # 3: Look at foot-paths (transfers) — since we have no chained walks and
-        # we are using a fixed distance based formula for walking time, all we
-        # have to do is 'walk' through (pardon the pun) each transfer.
+                # b) can we catch an earlier trip here? (reached in previous round)
+                arr_prev = prev[stop_idx]
+                if arr_prev == INF:
+                    continue  # if we cannot reach stop, then ignore
+                cur_departure = (
+                    stop_times[trip_base + pos] + day_offset if trip >= 0 else INF
+                )
+                if arr_prev > cur_departure:
+                    continue  # current trip already leaves before we get here
+                dep_times = slot_departures[first_slot + pos]
+                i = bisect_left(dep_times, arr_prev)
+                if (
+                    i < len(dep_times)
+                    and dep_times[i] < cur_departure
+                    and not (
+                        prune and dep_times[i] + remaining(stop_idx) >= target_arrival
+                    )
+                ):
+                    trip = slot_trips[first_slot + pos][i]
+                    trip_base = trip_time_offsets[trip]
+                    # the day the trip runs on follows from its departure here
+                    day_offset = dep_times[i] - stop_times[trip_base + pos]
+                    boarded_at = pos
+                    board_stop_idx = stop_idx
+                    board_time = dep_times[i]
+
+        # 3: Look at foot-paths (transfers) — one walk after a trip, so all we
+        # have to do is 'walk' through (pardon the pun) each transfer. Walks of
+        # several footpaths need them closed first (see close_footpaths).
         marked_list_copy = list(marked_list)  # avoid modification during iteration
         for p in marked_list_copy:
             arr_p = cur[p]
             if arr_p == INF:
                 continue
 
-            for v, walk_time in transfer_adj[p]:
-                # enforce strictly positive transfer time
-                walk_time = max(walk_time, MIN_TRANSFER_TIME)
+            for j in range(transfer_offsets[p], transfer_offsets[p + 1]):
+                # nearest first, so the rest are too long as well
+                if transfer_distances[j] > walk_limit:
+                    break
+                v = transfer_targets[j]
+                # strictly positive, see Timetable.transfer_walks
+                walk_time = transfer_walks[j]
                 new_arrival = arr_p + walk_time
 
-                if v == source_idx:
-                    # Don't overwrite source with later time
+                # (sources hold their departure, so never overwritten by a later time)
+                if prune and new_arrival + remaining(v) >= target_arrival:
                     continue
 
-                if new_arrival < cur[v] and new_arrival < best[v]:
-                    if helper_functions.safe_set_predecessor(
-                        v,
-                        p,
-                        new_arrival,
-                        "transfer",
-                        None,
-                        None,
-                        walk_time,
-                        predecessor_layers[k],  # write to this round's layer
-                        idx_to_id,
-                        debug,
-                    ):
-                        predecessor_layers[k][v]["round"] = k
-                        predecessor_layers[k][v][
-                            "prev_round"
-                        ] = k  # transfers stay in same round
-                        cur[v] = new_arrival
-                        best[v] = new_arrival
-                        improved_round[v] = (
-                            k  # mark which round a stop was last improved
-                        )
+                if new_arrival < cur[v] and new_arrival < labels[k][v]:
+                    if debug and creates_cycle(pred_stop, v, p):
+                        raise _cycle_error(idx_to_id, v, p, "transfer", None)
+                    # write to this round's layer (transfers stay in same round)
+                    pred_stop[v] = p
+                    pred_time[v] = new_arrival
+                    pred_route[v] = NONE
+                    pred_trip[v] = NONE
+                    pred_walk[v] = walk_time
+                    cur[v] = new_arrival
+                    _lower_label(labels, k, v, new_arrival)
+                    improved_round[v] = k  # mark which round a stop was last improved
+
+                    # transfers can mark a stop not reached by a trip
+                    if not marked[v]:
+                        marked[v] = True
+                        marked_list.append(v)
+                        improved = True
+
+                    if v in targets:
+                        target_arrival = min(target_arrival, new_arrival + targets[v])
+
+                    if debug and target_arrival != INF:
+                        # debug: early cycle check when target reached
+                        _check_target_cycles(predecessor_layers[k], idx_to_id, targets)
+
+        # this round's arrivals become prev, the old prev (cleared) cur
+        for stop_idx in prev_stops:
+            prev[stop_idx] = INF
+        if matrix_times is not None:
+            prev_array[prev_stops] = INF
+        prev, cur = cur, prev
+        prev_stops = cur_stops + marked_list
+        cur_stops = []
+        touched.extend(marked_list)
+        if matrix_times is not None:
+            # labels only changed at the stops marked this round
+            _sync_labels(label_arrays, labels, k, marked_list)
+            prev_array[prev_stops] = [prev[stop_idx] for stop_idx in prev_stops]
+        if not improved:
+            break
 
-                        # transfers can mark a stop not reached by a trip
-                        if not marked[v]:
-                            marked[v] = True
-                            marked_list.append(v)
-                            improved = True
+    # leave the round arrays clean for the next query
+    for stop_idx in marked_list:
+        marked[stop_idx] = False
+    for stop_idx in prev_stops + cur_stops:
+        prev[stop_idx] = INF
+        cur[stop_idx] = INF
+    if matrix_times is not None:
+        prev_array[prev_stops + cur_stops] = INF
+
+
+def _raptor_single(
+    timetable: Timetable,
+    sources: Dict[int, int],
+    targets: Dict[int, int],
+    max_rounds: int,
+    debug: bool,
+    target_pruning: bool,
+    lower_bound: bool,
+    route_matrices: Optional[RouteMatrices] = None,
+    timetable_arrays: Optional[TimetableArrays] = None,
+    workspace: Optional[QueryWorkspace] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[List[int], PredecessorLayers, List[int]]:
+    """Single departure RAPTOR run shared by raptor_algo, raptor_pareto and
+    raptor_multi (sources, targets and max_walk_dist as in _raptor_rounds). Runs
+    on the compiled kernel (see raptor_numba) when timetable_arrays is given and
+    debug is off, with the same results.
+
+    With a workspace (see query_workspace) the Python rounds allocate nothing
+    per stop: the results are its arrays, valid until it is handed back.
 
-                        if debug and target_idx is not None and best[target_idx] != INF:
-                            # debug: early cycle check when target reached
-                            check_predecessor_cycles(
-                                predecessor_layers[k], idx_to_id, target_idx, source_idx
-                            )
+    Returns:
+        Tuple of (earliest arrival per stop, predecessor layers, last improved
+        round per stop).
+    """
+    if timetable_arrays is not None and not debug:
+        max_speed = timetable.max_speed
+        return raptor_rounds_compiled(
+            timetable,
+            timetable_arrays,
+            sources,
+            targets,
+            max_rounds,
+            target_pruning and bool(targets),
+            max_speed if lower_bound and 0 < max_speed < float("inf") else 0.0,
+            MIN_TRANSFER_TIME,
+            max_walk_dist,
+        )
 
-                    # Optional: early cycle check once the target is reachable in this round
-                    # if target_id in id_to_idx:
-                    #    tidx = id_to_idx[target_id]
-                    #    if best[tidx] != INF:
-                    #        check_predecessor_cycles(
-                    #            predecessor, idx_to_id, tidx, source_idx
-                    #        )
+    if workspace is None:
+        workspace = QueryWorkspace(timetable.num_stops)
 
-        prev = cur[:]  # shallow copy list (values, not references)
-        cur = [INF] * n
-        if not improved:
-            break
+    # earliest arrival time for each stop over all rounds (a single run only needs
+    # the overall best, so every round shares one list)
+    best = workspace.best
+
+    # store predecessors for path reconstruction (arrays per round, see
+    # PredecessorLayers - dicts only for the steps of the returned paths)
+    predecessor_layers = PredecessorLayers(timetable, max_rounds, workspace.layers)
+    improved_round = workspace.improved_round  # last round a stop was improved
+
+    remaining = (
+        _target_lower_bound(timetable, targets, lower_bound) if target_pruning else None
+    )
+    # best's NumPy copy is kept in the workspace too
+    label_arrays = (
+        [workspace.label_arrays()[1]] * (max_rounds + 1)
+        if route_matrices is not None
+        else None
+    )
+    _raptor_rounds(
+        timetable,
+        sources,
+        targets,
+        max_rounds,
+        [best] * (max_rounds + 1),
+        predecessor_layers,
+        improved_round,
+        remaining,
+        debug,
+        route_matrices,
+        workspace,
+        label_arrays,
+        max_walk_dist,
+    )
+
+    return best, predecessor_layers, improved_round
+
+
+def _stop_indices(
+    timetable: Timetable, source_id: str, target_id: str
+) -> Tuple[int, Optional[int]]:
+    """Index of the source stop (must exist) and of the target stop (if any)."""
+    if source_id not in timetable.stop_index:
+        raise ValueError("Origin not a valid Stop.")
+    return timetable.stop_index[source_id], timetable.stop_index.get(target_id)
+
+
+def _source_times(
+    timetable: Timetable, sources: Dict[str, int], departure_time: int
+) -> Dict[int, int]:
+    """Time each source stop is reached: departure_time plus its access walk."""
+    id_to_idx = timetable.stop_index
+    if not sources or any(sid not in id_to_idx for sid in sources):
+        raise ValueError("Origin not a valid Stop.")
+    return {id_to_idx[sid]: departure_time + access for sid, access in sources.items()}
 
-    # finalize earliest arrival times dict
-    best[source_idx] = departure_time  # reset source to departure time
-    result: Dict[str, int] = {}
-    for i, sid in idx_to_id.items():
-        result[sid] = best[i]
 
-    # reconstruct path
-    if target_id not in id_to_idx or result[target_id] == INF:
-        # no path to target
-        return result, []
+def _compiled_arrays(
+    timetable: Timetable, timetable_arrays: Optional[TimetableArrays], debug: bool
+) -> Optional[TimetableArrays]:
+    """Arrays for the compiled kernel: the given ones, else those of timetable
+    when Numba is installed (built by its first query, see
+    cached_timetable_arrays). None in debug mode, whose checks only the Python
+    rounds run."""
+    if debug:
+        return None
+    if timetable_arrays is None and HAS_NUMBA:
+        return cached_timetable_arrays(timetable)
+    return timetable_arrays
+
+
+def raptor_algo(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    departure_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    target_pruning: bool = False,
+    lower_bound: bool = False,
+    route_matrices: Optional[RouteMatrices] = None,
+    timetable_arrays: Optional[TimetableArrays] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """RAPTOR - Round bAsed Public Transit Optimised Router.
+
+    v1: unoptimised
+
+    Args:
+        TODO
+        debug (bool, optional): Trace mode for debugging: validate the timetable
+            (unless validate_timetable certified it at load) and check the
+            predecessor chains for cycles while searching. Defaults to False,
+            queries then run no checks.
+        timetable (Timetable, optional): Compiled form of stops, routes and
+            transfers (see build_timetable). Should be built once at load and
+            passed in - compiled here (O(network)) if not given.
+        target_pruning (bool, optional): Don't improve stops (or board trips) at
+            times that cannot beat the best known arrival at the target. Only the
+            target's arrival is then exact, other stops are left at INF or an
+            upper bound, so point-to-point callers turn it on. Defaults to False
+            (earliest arrival at every stop).
+        lower_bound (bool, optional): Also add an admissible estimate of the time
+            still needed (straight-line distance / fastest speed in the network)
+            when pruning. Only used with target_pruning. Defaults to False.
+        route_matrices (RouteMatrices, optional): NumPy copies of the routes (see
+            raptor_numpy.build_route_matrices). Routes that have one are scanned
+            with vectorized operations over all their trips, the others by the
+            Python scan. Defaults to None (Python only).
+        timetable_arrays (TimetableArrays, optional): Typed arrays of the
+            timetable (see raptor_numba.build_timetable_arrays). Without debug the
+            rounds then run on the compiled kernel, same results as the Python
+            rounds. If Numba is installed and none are given, the timetable's
+            cached arrays are used (built by its first query), the Python rounds
+            are the fallback.
+        max_walk_dist (float, optional): Longest footpath to walk between trips
+            in meters, for a timetable compiled with longer footpaths (see
+            Timetable.transfer_distances). Defaults to None (all of them).
+
+    Returns:
+        Tuple[Dict[str, int], List[Optional[Dict]]]:
+            - Dict of earliest arrival times at all stops.
+            - List of steps (the reconstructed fastest path from source to target).
+    """
+
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    _check_network(timetable, debug)
+
+    source_idx, target_idx = _stop_indices(timetable, source_id, target_id)
+    with query_workspace(timetable) as workspace:
+        best, predecessor_layers, improved_round = _raptor_single(
+            timetable,
+            {source_idx: departure_time},
+            {target_idx: 0} if target_idx is not None else {},
+            max_rounds,
+            debug,
+            target_pruning,
+            lower_bound,
+            route_matrices,
+            _compiled_arrays(timetable, timetable_arrays, debug),
+            workspace,
+            max_walk_dist,
+        )
+
+        # finalize earliest arrival times dict
+        best[source_idx] = departure_time  # reset source to departure time
+        idx_to_id = timetable.stop_ids
+        result: Dict[str, int] = dict(zip(idx_to_id, best))
+
+        # reconstruct path
+        if target_idx is None or best[target_idx] == INF:
+            # no path to target
+            return result, []
+
+        journey = reconstruct_path(
+            predecessor_layers,
+            improved_round,
+            idx_to_id,
+            target_idx,
+            source_idx,
+            result,
+        )
+
+        return result, journey
+
+
+def raptor_pareto(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    departure_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    target_pruning: bool = False,
+    lower_bound: bool = False,
+    route_matrices: Optional[RouteMatrices] = None,
+    timetable_arrays: Optional[TimetableArrays] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """RAPTOR returning every (number of trips, arrival time) Pareto optimal
+    journey to the target. Round k gives the earliest arrival with at most k
+    trips, so the journeys come out of one run: one per round that improved the
+    target, traced back from that round's predecessor layer.
+
+    Args:
+        Same as raptor_algo.
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of earliest arrival times at all stops.
+            - Journeys ordered by number of trips (fewest first, fastest last),
+              each with trips, arrival_time, walking_time and path. The last
+              path is the one raptor_algo returns.
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    _check_network(timetable, debug)
+
+    source_idx, target_idx = _stop_indices(timetable, source_id, target_id)
+    sources = {source_idx: departure_time}
+    targets = {target_idx: 0} if target_idx is not None else {}
+    with query_workspace(timetable) as workspace:
+        best, predecessor_layers, improved_round = _raptor_single(
+            timetable,
+            sources,
+            targets,
+            max_rounds,
+            debug,
+            target_pruning,
+            lower_bound,
+            route_matrices,
+            _compiled_arrays(timetable, timetable_arrays, debug),
+            workspace,
+            max_walk_dist,
+        )
+
+        best[source_idx] = departure_time  # reset source to departure time
+        result: Dict[str, int] = dict(zip(timetable.stop_ids, best))
+
+        if target_idx is None or target_idx == source_idx:
+            return result, []
+
+        journeys = _pareto_journeys(
+            timetable,
+            predecessor_layers,
+            improved_round,
+            sources,
+            targets,
+            departure_time,
+            max_rounds,
+        )
+        return result, journeys
+
+
+def raptor_multi(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    sources: Dict[str, int],
+    targets: Dict[str, int],
+    departure_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    target_pruning: bool = False,
+    lower_bound: bool = False,
+    route_matrices: Optional[RouteMatrices] = None,
+    timetable_arrays: Optional[TimetableArrays] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """RAPTOR from several source stops to several target stops in one run.
+
+    Every source stop starts at departure_time plus its access walk and every
+    target stop adds its egress walk to the arrival, so one search replaces a
+    query per (source, target) pair. Journeys are the (number of trips, arrival)
+    Pareto front as in raptor_pareto. As in raptor_algo a journey starts with a
+    trip (the access walk takes the place of a first walk), so every stop within
+    walking distance of the origin should be a source.
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        sources (Dict[str, int]): Source stop ids with their access walk (minutes).
+        targets (Dict[str, int]): Target stop ids with their egress walk (minutes).
+            Unknown stops and stops that are also sources are ignored.
+        departure_time (int): Departure time at the origin (minutes).
+        Others same as raptor_algo.
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of earliest arrival times at all stops.
+            - Journeys ordered by number of trips (fewest first, fastest last),
+              each with source_id, target_id, trips, arrival_time (after the
+              egress walk), walking_time (access and egress included) and path.
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    _check_network(timetable, debug)
+
+    id_to_idx = timetable.stop_index
+    source_times = _source_times(timetable, sources, departure_time)
+    target_egress = {
+        id_to_idx[sid]: egress
+        for sid, egress in targets.items()
+        if sid in id_to_idx and id_to_idx[sid] not in source_times
+    }
+
+    with query_workspace(timetable) as workspace:
+        best, predecessor_layers, improved_round = _raptor_single(
+            timetable,
+            source_times,
+            target_egress,
+            max_rounds,
+            debug,
+            target_pruning,
+            lower_bound,
+            route_matrices,
+            _compiled_arrays(timetable, timetable_arrays, debug),
+            workspace,
+            max_walk_dist,
+        )
+        result: Dict[str, int] = dict(zip(timetable.stop_ids, best))
+
+        journeys = _pareto_journeys(
+            timetable,
+            predecessor_layers,
+            improved_round,
+            source_times,
+            target_egress,
+            departure_time,
+            max_rounds,
+        )
+        return result, journeys
+
+
+def raptor_one_to_all(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    sources: Dict[str, int],
+    departure_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    route_matrices: Optional[RouteMatrices] = None,
+    timetable_arrays: Optional[TimetableArrays] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Dict[str, int]:
+    """Earliest arrival at every stop from the source stops (one-to-all).
+
+    Same rounds as raptor_algo without a target: nothing is pruned and no path is
+    reconstructed. Used for reachability maps (isochrones).
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        sources (Dict[str, int]): Source stop ids with their access walk (minutes).
+        departure_time (int): Departure time at the origin (minutes).
+        max_rounds (int, optional): Maximum number of trips. Defaults to 10.
+        debug (bool, optional): Trace mode (see raptor_algo). Defaults to False.
+        timetable (Timetable, optional): Compiled timetable (see raptor_algo).
+        route_matrices (RouteMatrices, optional): See raptor_algo.
+        timetable_arrays (TimetableArrays, optional): See raptor_algo.
+        max_walk_dist (float, optional): See raptor_algo.
+
+    Returns:
+        Dict[str, int]: Earliest arrival times at all stops (INF if unreachable).
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    _check_network(timetable, debug)
+
+    with query_workspace(timetable) as workspace:
+        best, _, _ = _raptor_single(
+            timetable,
+            _source_times(timetable, sources, departure_time),
+            {},
+            max_rounds,
+            debug,
+            False,
+            False,
+            route_matrices,
+            _compiled_arrays(timetable, timetable_arrays, debug),
+            workspace,
+            max_walk_dist,
+        )
+        return dict(zip(timetable.stop_ids, best))
+
+
+def _pareto_journeys(
+    timetable: Timetable,
+    predecessor_layers: PredecessorLayers,
+    improved_round: List[int],
+    sources: Dict[int, int],
+    targets: Dict[int, int],
+    departure_time: int,
+    max_rounds: int,
+) -> List[Dict[str, Any]]:
+    """(trips, arrival) Pareto front over the targets: round k gives the earliest
+    arrival with at most k trips, so there is one journey per round that improved
+    the best arrival (plus egress walk), traced back from that round's layer."""
+    idx_to_id = timetable.stop_ids
+    journeys: List[Dict[str, Any]] = []
+    arrival = INF
+    for k in range(1, max_rounds + 1):
+        # only rounds that improved a target leave an entry in their layer
+        round_arrival, round_target = INF, -1
+        for target_idx, egress in targets.items():
+            pred = predecessor_layers[k][target_idx]
+            if pred is not None and pred["arrival_time"] + egress < round_arrival:
+                round_arrival, round_target = pred["arrival_time"] + egress, target_idx
+        if round_arrival >= arrival:
+            continue
+        arrival = round_arrival
+        path = reconstruct_path(
+            predecessor_layers,
+            improved_round,
+            idx_to_id,
+            round_target,
+            None,
+            {},
+            start_round=k,
+            source_times=sources,
+        )
+        if not path:
+            continue
+        access = sources[timetable.stop_index[path[0]["stop_id"]]] - departure_time
+        journeys.append(
+            {
+                "source_id": path[0]["stop_id"],
+                "target_id": idx_to_id[round_target],
+                "trips": sum(1 for step in path if step["mode"] == "trip"),
+                "arrival_time": arrival,
+                "walking_time": access
+                + targets[round_target]
+                + sum(
+                    step["transfer_time"] for step in path if step["mode"] == "transfer"
+                ),
+                "path": path,
+            }
+        )
+
+    return journeys
+
+
+def raptor_range(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    earliest_departure: int,
+    latest_departure: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    lower_bound: bool = False,
+    route_matrices: Optional[RouteMatrices] = None,
+    max_walk_dist: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """rRAPTOR - profile query for all departures in a time window.
+
+    Runs RAPTOR once for every departure of a trip from the source stop within
+    [earliest_departure, latest_departure], latest first. Labels are kept between
+    runs, so each run only explores what the previous (later) departures could
+    not already reach as early.
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        source_id (str): Origin stop id.
+        target_id (str): Destination stop id.
+        earliest_departure (int): Start of the departure window (minutes).
+        latest_departure (int): End of the departure window (minutes).
+        max_rounds (int, optional): Maximum number of trips. Defaults to 10.
+        debug (bool, optional): Trace mode (see raptor_algo). Defaults to False.
+        timetable (Timetable, optional): Compiled timetable (see raptor_algo).
+        lower_bound (bool, optional): Prune with a lower bound on the time left
+            to the target (see raptor_algo). Defaults to False.
+        route_matrices (RouteMatrices, optional): See raptor_algo.
+        max_walk_dist (float, optional): See raptor_algo.
+
+    Returns:
+        List[Dict[str, Any]]: Pareto optimal journeys (no other journey leaves
+            later and arrives earlier), ordered by departure. Each has
+            departure_time, arrival_time and path (steps as in raptor_algo).
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    _check_network(timetable, debug)
+
+    id_to_idx = timetable.stop_index
+    idx_to_id = timetable.stop_ids
+    n = timetable.num_stops
+
+    if source_id not in id_to_idx:
+        raise ValueError("Origin not a valid Stop.")
+    if target_id not in id_to_idx:
+        raise ValueError("Destination not a valid Stop.")
+    source_idx = id_to_idx[source_id]
     target_idx = id_to_idx[target_id]
 
-    # final cycle check before reconstructing path
-    # check_self_loops(predecessor, idx_to_id)
-    # check_predecessor_cycles(predecessor, idx_to_id, target_idx, source_idx)
+    # departures of all trips leaving the source within the window
+    departures = set()
+    for j in range(
+        timetable.stop_route_offsets[source_idx],
+        timetable.stop_route_offsets[source_idx + 1],
+    ):
+        slot = (
+            timetable.route_stop_offsets[timetable.stop_routes[j]]
+            + timetable.stop_route_positions[j]
+        )
+        dep_times = timetable.slot_departures[slot]
+        departures.update(
+            dep_times[
+                bisect_left(dep_times, earliest_departure) : bisect_right(
+                    dep_times, latest_departure
+                )
+            ]
+        )
 
-    journey = reconstruct_path(
-        predecessor_layers, improved_round, idx_to_id, target_idx, source_idx, result
-    )
+    # labels shared by all runs - kept per number of trips, as a stop reached
+    # earlier by a later departure but with more trips does not dominate
+    labels = [[INF] * n for _ in range(max_rounds + 1)]
+    best = labels[max_rounds]
+    predecessor_layers = PredecessorLayers(timetable, max_rounds)
+    improved_round: List[int] = [-1] * n
+    remaining = _target_lower_bound(timetable, {target_idx: 0}, lower_bound)
+    # their NumPy copies for the route matrices, kept in step by the runs
+    label_arrays = _copy_labels(labels) if route_matrices is not None else None
+
+    profile: List[Dict[str, Any]] = []
+    # the runs only borrow the round arrays (labels are kept here)
+    with query_workspace(timetable) as workspace:
+        for departure_time in sorted(departures, reverse=True):
+            arrival_before = best[target_idx]
+            _raptor_rounds(
+                timetable,
+                {source_idx: departure_time},
+                {target_idx: 0},
+                max_rounds,
+                labels,
+                predecessor_layers,
+                improved_round,
+                remaining,
+                debug,
+                route_matrices,
+                workspace,
+                label_arrays,
+                max_walk_dist,
+            )
+            # only a strictly earlier arrival is not dominated by a later departure
+            if best[target_idx] < arrival_before:
+                path = reconstruct_path(
+                    predecessor_layers,
+                    improved_round,
+                    idx_to_id,
+                    target_idx,
+                    source_idx,
+                    {source_id: departure_time},
+                )
+                profile.append(
+                    {
+                        "departure_time": departure_time,
+                        "arrival_time": best[target_idx],
+                        "path": path,
+                    }
+                )
 
-    return result, journey
+    profile.reverse()
+    return profile
 
 
 def reconstruct_path(
-    predecessor_layers: List[List[Optional[Dict]]],
+    predecessor_layers: PredecessorLayers | List[List[Optional[Dict]]],
     improved_round: List[int],
     idx_to_id: Dict[int, str],
     target_idx: int,
     source_idx: int,
     result: Dict[str, int],
+    start_round: Optional[int] = None,
+    source_times: Optional[Dict[int, int]] = None,
 ) -> List[Dict[str, Any]]:
     """TODO: _summary_
 
@@ -737,6 +1617,11 @@ def reconstruct_path(
         target_idx (_type_): _description_
         source_idx (_type_): _description_
         result (Dict[str, int]): _description_
+        start_round (int, optional): Round (number of trips) to trace the target
+            from. Defaults to the last round the target was improved in.
+        source_times (Dict[int, int], optional): Several sources (stop index ->
+            departure time): trace back to round 0 and start at the source
+            reached there (source_idx and result are not used).
 
     Returns:
         _type_: _description_
@@ -748,12 +1633,12 @@ def reconstruct_path(
     visited = set()  # to detect cycles
 
     # start from the round where target was last improved
-    r = improved_round[target_idx]
+    r = improved_round[target_idx] if start_round is None else start_round
     if r < 0:
         return []  # no path found
 
-    # trace from target back to source
-    while current != source_idx:
+    # trace from target back to source (to round 0 with several sources)
+    while current != source_idx if source_times is None else r > 0:
         pred = (
             predecessor_layers[r][current] if 0 <= r < len(predecessor_layers) else None
         )
@@ -788,11 +1673,20 @@ def reconstruct_path(
     #     empty_path: List[Dict] = []
     #     return empty_path
 
+    if source_times is not None:
+        if current not in source_times:
+            return []  # round 0 is only known at the sources
+        source_idx = current
+
     # add source stop as starting point
     path.append(
         {
             "stop_id": idx_to_id[source_idx],
-            "arrival_time": result[idx_to_id[source_idx]],
+            "arrival_time": (
+                result[idx_to_id[source_idx]]
+                if source_times is None
+                else source_times[source_idx]
+            ),
             "mode": "start",
             "route_id": None,
             "trip_id": None,
@@ -920,7 +1814,19 @@ def reconstruct_path_objs(
             if route is not None:
                 new_step["route_object"] = route
                 if tid:
-                    trip_obj = next((t for t in route.trips if t.id == tid), None)
+                    # a trip with service days is in paths by its id for the day
+                    trip_obj = next(
+                        (
+                            t
+                            for t in route.trips
+                            if tid == t.id
+                            or any(
+                                tid == format_trip_day(t.id, t.service_days, offset)
+                                for offset in day_offsets(t.service_days)
+                            )
+                        ),
+                        None,
+                    )
                     if trip_obj is not None:
                         new_step["trip_object"] = trip_obj
 
@@ -0,0 +1,523 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from math import asin, cos, radians, sin, sqrt
+from typing import Dict, List, Optional, Tuple
+
+from algorithm_prototype.predecessors import PredecessorLayers
+from algorithm_prototype.timetable import INF, Timetable
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, the Python RAPTOR rounds are used instead
+    np = None
+
+try:
+    from numba import njit
+
+    HAS_NUMBA: bool = True
+except ImportError:  # optional dependency: the kernel below then runs as plain Python
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# timetables whose arrays cached_timetable_arrays keeps (e.g. the weekly and a
+# few date timetables)
+ARRAYS_CACHE_SIZE: int = 4
+
+# id(timetable) -> (timetable, arrays), least recently used first. The timetable
+# is kept with its arrays so its id is not reused while cached
+_arrays_cache: "OrderedDict[int, Tuple[Timetable, TimetableArrays]]" = OrderedDict()
+_arrays_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class TimetableArrays:
+    """Typed integer arrays of a Timetable for the compiled RAPTOR rounds.
+
+    Same CSR layout as the Timetable (see its docstring) with the per slot
+    departures flattened: slot i holds slot_departures[slot_offsets[i]:slot_offsets[i + 1]]
+    (and slot_trips likewise).
+    """
+
+    route_stop_offsets: "np.ndarray"
+    route_stops: "np.ndarray"
+    trip_time_offsets: "np.ndarray"
+    stop_times: "np.ndarray"
+    slot_offsets: "np.ndarray"
+    slot_departures: "np.ndarray"
+    slot_trips: "np.ndarray"
+    stop_route_offsets: "np.ndarray"
+    stop_routes: "np.ndarray"
+    stop_route_positions: "np.ndarray"
+    transfer_offsets: "np.ndarray"
+    transfer_targets: "np.ndarray"
+    transfer_times: "np.ndarray"
+    transfer_distances: "np.ndarray"
+    stop_lats: "np.ndarray"
+    stop_lons: "np.ndarray"
+
+
+def build_timetable_arrays(timetable: Timetable) -> TimetableArrays:
+    """Convert a Timetable for raptor_rounds_compiled. Like the timetable, build
+    once at load and share between queries.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+
+    Raises:
+        ImportError: NumPy is not installed.
+
+    Returns:
+        TimetableArrays: The timetable as int64 (coordinates and distances
+            float64) arrays.
+    """
+    if np is None:
+        raise ImportError("NumPy is required for the compiled RAPTOR rounds.")
+
+    def ints(values) -> "np.ndarray":
+        return np.array(values, dtype=np.int64)
+
+    slot_offsets = [0]
+    for departures in timetable.slot_departures:
+        slot_offsets.append(slot_offsets[-1] + len(departures))
+    return TimetableArrays(
+        route_stop_offsets=ints(timetable.route_stop_offsets),
+        route_stops=ints(timetable.route_stops),
+        trip_time_offsets=ints(timetable.trip_time_offsets),
+        stop_times=ints(timetable.stop_times),
+        slot_offsets=ints(slot_offsets),
+        slot_departures=ints([t for d in timetable.slot_departures for t in d]),
+        slot_trips=ints([t for d in timetable.slot_trips for t in d]),
+        stop_route_offsets=ints(timetable.stop_route_offsets),
+        stop_routes=ints(timetable.stop_routes),
+        stop_route_positions=ints(timetable.stop_route_positions),
+        transfer_offsets=ints(timetable.transfer_offsets),
+        transfer_targets=ints(timetable.transfer_targets),
+        transfer_times=ints(timetable.transfer_times),
+        transfer_distances=np.array(timetable.transfer_distances, dtype=np.float64),
+        stop_lats=np.array(timetable.stop_lats, dtype=np.float64),
+        stop_lons=np.array(timetable.stop_lons, dtype=np.float64),
+    )
+
+
+def cached_timetable_arrays(timetable: Timetable) -> TimetableArrays:
+    """Arrays of timetable (see build_timetable_arrays), built on first use and
+    kept for the next queries on the same timetable object.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+
+    Returns:
+        TimetableArrays: The arrays of timetable.
+    """
+    key = id(timetable)
+    with _arrays_lock:
+        entry = _arrays_cache.get(key)
+        if entry is not None and entry[0] is timetable:
+            _arrays_cache.move_to_end(key)
+            return entry[1]
+    arrays = build_timetable_arrays(timetable)
+    with _arrays_lock:
+        _arrays_cache[key] = (timetable, arrays)
+        _arrays_cache.move_to_end(key)
+        while len(_arrays_cache) > ARRAYS_CACHE_SIZE:
+            _arrays_cache.popitem(last=False)
+    return arrays
+
+
+@njit(cache=True)
+def _haversine(lat_a, lon_a, lat_b, lon_b):
+    """Same formula (and operation order) as helper_functions.haversine."""
+    lat_a, lon_a, lat_b, lon_b = (
+        radians(lat_a),
+        radians(lon_a),
+        radians(lat_b),
+        radians(lon_b),
+    )
+    delta_lat = lat_b - lat_a
+    delta_lon = lon_b - lon_a
+    a = sin(delta_lat / 2) ** 2 + sin(delta_lon / 2) ** 2 * cos(lat_a) * cos(lat_b)
+    return 2 * 6371 * 1000 * asin(sqrt(a))
+
+
+@njit(cache=True)
+def _remaining(
+    stop,
+    bound,
+    min_egress,
+    max_speed,
+    stop_lats,
+    stop_lons,
+    target_stops,
+    target_egress,
+):
+    """Lower bound on the time left to the targets (as _target_lower_bound)."""
+    if max_speed <= 0.0:
+        return float(min_egress)
+    if bound[stop] < 0.0:
+        value = np.inf
+        for i in range(target_stops.shape[0]):
+            t = target_stops[i]
+            distance = _haversine(
+                stop_lats[stop], stop_lons[stop], stop_lats[t], stop_lons[t]
+            )
+            value = min(value, distance / max_speed + target_egress[i])
+        bound[stop] = value
+    return bound[stop]
+
+
+@njit(cache=True)
+def _raptor_kernel(
+    route_stop_offsets,
+    route_stops,
+    trip_time_offsets,
+    stop_times,
+    slot_offsets,
+    slot_departures,
+    slot_trips,
+    stop_route_offsets,
+    stop_routes,
+    stop_route_positions,
+    transfer_offsets,
+    transfer_targets,
+    transfer_times,
+    transfer_distances,
+    stop_lats,
+    stop_lons,
+    source_stops,
+    source_times,
+    target_stops,
+    target_egress,
+    max_rounds,
+    prune,
+    max_speed,
+    min_transfer_time,
+    max_walk_dist,
+):
+    """The rounds of _raptor_rounds (single run, debug off) on typed arrays.
+
+    Predecessors are the parallel arrays of PredecessorLayers, one row per round
+    (pred_stop -1 = none, pred_route / pred_trip -1 = footpath).
+    """
+    n = stop_route_offsets.shape[0] - 1
+    num_routes = route_stop_offsets.shape[0] - 1
+
+    best = np.full(n, INF, dtype=np.int64)
+    improved_round = np.full(n, -1, dtype=np.int64)
+    pred_stop = np.full((max_rounds + 1, n), -1, dtype=np.int64)
+    pred_time = np.zeros((max_rounds + 1, n), dtype=np.int64)
+    pred_route = np.full((max_rounds + 1, n), -1, dtype=np.int64)
+    pred_trip = np.full((max_rounds + 1, n), -1, dtype=np.int64)
+    pred_board = np.zeros((max_rounds + 1, n), dtype=np.int64)
+    pred_disembark = np.zeros((max_rounds + 1, n), dtype=np.int64)
+    pred_walk = np.zeros((max_rounds + 1, n), dtype=np.int64)
+
+    # egress walk per stop, -1 if not a target
+    egress = np.full(n, -1, dtype=np.int64)
+    min_egress = INF
+    for i in range(target_stops.shape[0]):
+        egress[target_stops[i]] = target_egress[i]
+        min_egress = min(min_egress, target_egress[i])
+    bound = np.full(n, -1.0)
+    target_arrival = INF
+
+    prev = np.full(n, INF, dtype=np.int64)
+    cur = np.full(n, INF, dtype=np.int64)
+    marked = np.zeros(n, dtype=np.bool_)
+    marked_list = np.empty(n, dtype=np.int64)
+    num_marked = 0
+    for i in range(source_stops.shape[0]):
+        s = source_stops[i]
+        time = source_times[i]
+        if time < best[s]:
+            best[s] = time
+        prev[s] = time
+        cur[s] = time
+        improved_round[s] = 0
+        marked[s] = True
+        marked_list[num_marked] = s
+        num_marked += 1
+
+    # routes to scan in the order they are found (as the dict in _raptor_rounds)
+    queue_start = np.full(num_routes, -1, dtype=np.int64)
+    queue = np.empty(num_routes, dtype=np.int64)
+
+    for k in range(1, max_rounds + 1):
+        improved = False
+
+        # 1: routes serving the stops marked in the previous round
+        num_queued = 0
+        for m in range(num_marked):
+            s = marked_list[m]
+            for j in range(stop_route_offsets[s], stop_route_offsets[s + 1]):
+                r = stop_routes[j]
+                pos = stop_route_positions[j]
+                if queue_start[r] < 0:
+                    queue[num_queued] = r
+                    num_queued += 1
+                    queue_start[r] = pos
+                elif pos < queue_start[r]:
+                    queue_start[r] = pos
+
+        for m in range(num_marked):
+            marked[marked_list[m]] = False
+        num_marked = 0
+
+        # 2: traverse each route
+        for q in range(num_queued):
+            r = queue[q]
+            start_pos = queue_start[r]
+            queue_start[r] = -1
+            first_slot = route_stop_offsets[r]
+            num_stops_in_route = route_stop_offsets[r + 1] - first_slot
+
+            trip = -1
+            trip_base = 0
+            day_offset = 0
+            boarded_at = -1
+            board_stop_idx = -1
+            board_time = INF
+
+            for pos in range(start_pos, num_stops_in_route):
+                stop_idx = route_stops[first_slot + pos]
+
+                # a) ride the current trip to this stop
+                if trip >= 0:
+                    time = stop_times[trip_base + pos]
+                    prev_time_same_trip = stop_times[trip_base + pos - 1]
+                    # (INF + day_offset would overflow int64)
+                    trip_time = time + day_offset if time != INF else INF
+                    if (
+                        time != INF
+                        and trip_time >= board_time
+                        and not (
+                            prev_time_same_trip != INF and time < prev_time_same_trip
+                        )
+                        and trip_time < cur[stop_idx]
+                        and trip_time < best[stop_idx]
+                        and not (
+                            prune
+                            and trip_time
+                            + _remaining(
+                                stop_idx,
+                                bound,
+                                min_egress,
+                                max_speed,
+                                stop_lats,
+                                stop_lons,
+                                target_stops,
+                                target_egress,
+                            )
+                            >= target_arrival
+                        )
+                    ):
+                        pred_stop[k, stop_idx] = board_stop_idx
+                        pred_time[k, stop_idx] = trip_time
+                        pred_route[k, stop_idx] = r
+                        pred_trip[k, stop_idx] = trip
+                        pred_board[k, stop_idx] = boarded_at
+                        pred_disembark[k, stop_idx] = pos
+                        cur[stop_idx] = trip_time
+                        best[stop_idx] = trip_time
+                        improved_round[stop_idx] = k
+                        if not marked[stop_idx]:
+                            marked[stop_idx] = True
+                            marked_list[num_marked] = stop_idx
+                            num_marked += 1
+                            improved = True
+                        if egress[stop_idx] >= 0:
+                            target_arrival = min(
+                                target_arrival, trip_time + egress[stop_idx]
+                            )
+
+                # b) can we catch an earlier trip here?
+                arr_prev = prev[stop_idx]
+                if arr_prev == INF:
+                    continue
+                cur_departure = INF
+                if trip >= 0 and stop_times[trip_base + pos] != INF:
+                    cur_departure = stop_times[trip_base + pos] + day_offset
+                if arr_prev > cur_departure:
+                    continue
+                lo = slot_offsets[first_slot + pos]
+                hi = slot_offsets[first_slot + pos + 1]
+                i = lo + np.searchsorted(slot_departures[lo:hi], arr_prev)
+                if (
+                    i < hi
+                    and slot_departures[i] < cur_departure
+                    and not (
+                        prune
+                        and slot_departures[i]
+                        + _remaining(
+                            stop_idx,
+                            bound,
+                            min_egress,
+                            max_speed,
+                            stop_lats,
+                            stop_lons,
+                            target_stops,
+                            target_egress,
+                        )
+                        >= target_arrival
+                    )
+                ):
+                    trip = slot_trips[i]
+                    trip_base = trip_time_offsets[trip]
+                    day_offset = slot_departures[i] - stop_times[trip_base + pos]
+                    boarded_at = pos
+                    board_stop_idx = stop_idx
+                    board_time = slot_departures[i]
+
+        # 3: footpaths from the stops improved by a trip in this round
+        num_walked_from = num_marked
+        for m in range(num_walked_from):
+            p = marked_list[m]
+            arr_p = cur[p]
+            if arr_p == INF:
+                continue
+            for j in range(transfer_offsets[p], transfer_offsets[p + 1]):
+                # nearest first, so the rest are too long as well
+                if transfer_distances[j] > max_walk_dist:
+                    break
+                v = transfer_targets[j]
+                walk_time = max(transfer_times[j], min_transfer_time)
+                new_arrival = arr_p + walk_time
+                if (
+                    prune
+                    and new_arrival
+                    + _remaining(
+                        v,
+                        bound,
+                        min_egress,
+                        max_speed,
+                        stop_lats,
+                        stop_lons,
+                        target_stops,
+                        target_egress,
+                    )
+                    >= target_arrival
+                ):
+                    continue
+                if new_arrival < cur[v] and new_arrival < best[v]:
+                    pred_stop[k, v] = p
+                    pred_time[k, v] = new_arrival
+                    pred_route[k, v] = -1
+                    pred_trip[k, v] = -1
+                    pred_walk[k, v] = walk_time
+                    cur[v] = new_arrival
+                    best[v] = new_arrival
+                    improved_round[v] = k
+                    if not marked[v]:
+                        marked[v] = True
+                        marked_list[num_marked] = v
+                        num_marked += 1
+                        improved = True
+                    if egress[v] >= 0:
+                        target_arrival = min(target_arrival, new_arrival + egress[v])
+
+        prev[:] = cur
+        cur[:] = INF
+        if not improved:
+            break
+
+    return (
+        best,
+        improved_round,
+        pred_stop,
+        pred_time,
+        pred_route,
+        pred_trip,
+        pred_board,
+        pred_disembark,
+        pred_walk,
+    )
+
+
+def raptor_rounds_compiled(
+    timetable: Timetable,
+    arrays: TimetableArrays,
+    sources: Dict[int, int],
+    targets: Dict[int, int],
+    max_rounds: int,
+    prune: bool,
+    max_speed: float,
+    min_transfer_time: int,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[List[int], PredecessorLayers, List[int]]:
+    """Single RAPTOR run on the compiled kernel, same results as _raptor_single
+    with debug off (trace mode only exists in the Python rounds).
+
+    Args:
+        timetable (Timetable): Compiled timetable (ids for the predecessors).
+        arrays (TimetableArrays): The same timetable as arrays.
+        sources (Dict[int, int]): Source stop indices with the time each is reached.
+        targets (Dict[int, int]): Target stop indices with their egress walk.
+        max_rounds (int): Maximum number of rounds (trips).
+        prune (bool): Target pruning.
+        max_speed (float): Fastest speed for the lower bound (meters per minute),
+            0 to prune with the egress walk only.
+        min_transfer_time (int): Shortest footpath (minutes).
+        max_walk_dist (float, optional): Longest footpath to walk (meters), None
+            for all of them.
+
+    Returns:
+        Tuple of (earliest arrival per stop, predecessor layers, last improved
+        round per stop) as _raptor_single.
+    """
+    (
+        best,
+        improved_round,
+        pred_stop,
+        pred_time,
+        pred_route,
+        pred_trip,
+        pred_board,
+        pred_disembark,
+        pred_walk,
+    ) = _raptor_kernel(
+        arrays.route_stop_offsets,
+        arrays.route_stops,
+        arrays.trip_time_offsets,
+        arrays.stop_times,
+        arrays.slot_offsets,
+        arrays.slot_departures,
+        arrays.slot_trips,
+        arrays.stop_route_offsets,
+        arrays.stop_routes,
+        arrays.stop_route_positions,
+        arrays.transfer_offsets,
+        arrays.transfer_targets,
+        arrays.transfer_times,
+        arrays.transfer_distances,
+        arrays.stop_lats,
+        arrays.stop_lons,
+        np.array(list(sources.keys()), dtype=np.int64),
+        np.array(list(sources.values()), dtype=np.int64),
+        np.array(list(targets.keys()), dtype=np.int64),
+        np.array(list(targets.values()), dtype=np.int64),
+        max_rounds,
+        prune,
+        max_speed,
+        min_transfer_time,
+        np.inf if max_walk_dist is None else float(max_walk_dist),
+    )
+
+    # the kernel's arrays are the rounds (dicts only for the steps read)
+    predecessor_layers = PredecessorLayers(timetable, max_rounds)
+    for k in range(1, max_rounds + 1):
+        predecessor_layers.rounds[k] = (
+            pred_stop[k],
+            pred_time[k],
+            pred_route[k],
+            pred_trip[k],
+            pred_board[k],
+            pred_disembark[k],
+            pred_walk[k],
+        )
+
+    return best.tolist(), predecessor_layers, improved_round.tolist()
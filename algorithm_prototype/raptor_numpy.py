@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from algorithm_prototype.timetable import INF, Timetable, day_offsets
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, the Python route scan is used instead
+    np = None
+
+HAS_NUMPY: bool = np is not None
+
+# stop time of a trip that doesn't serve a stop (INF does not fit in int32)
+HOLE: int = 2**31 - 1
+# routes with fewer trips x stops than this are scanned in Python (the fixed cost
+# of the NumPy calls is higher than the scan itself)
+NUMPY_MIN_ROUTE_CELLS: int = 256
+
+
+@dataclass(frozen=True)
+class RouteMatrices:
+    """NumPy copies of the routes of a Timetable for the vectorized route scan.
+
+    times[r] holds the stop times of route r as a (runs x stops) int32 matrix,
+    one row per day a trip runs (HOLE where a trip doesn't serve a stop, rows in
+    the timetable's trip order), trips[r] the trip index of each row and stops[r]
+    the stop indices along the route. All are None for routes too small to gain
+    from it.
+    """
+
+    times: Tuple[Optional["np.ndarray"], ...]
+    trips: Tuple[Optional["np.ndarray"], ...]
+    stops: Tuple[Optional["np.ndarray"], ...]
+
+
+def build_route_matrices(
+    timetable: Timetable, min_cells: int = NUMPY_MIN_ROUTE_CELLS
+) -> RouteMatrices:
+    """Build the route matrices used by raptor_algo(route_matrices=...). Like the
+    timetable, build once at load and share between queries.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+        min_cells (int, optional): Smallest trips x stops of a route to convert.
+            Defaults to NUMPY_MIN_ROUTE_CELLS.
+
+    Raises:
+        ImportError: NumPy is not installed.
+
+    Returns:
+        RouteMatrices: Matrices per route (None for small routes).
+    """
+    if not HAS_NUMPY:
+        raise ImportError("NumPy is required for the vectorized route scan.")
+
+    times = []
+    trips = []
+    stops = []
+    for r in range(timetable.num_routes):
+        first_slot = timetable.route_stop_offsets[r]
+        num_stops = timetable.route_stop_offsets[r + 1] - first_slot
+        runs = [
+            (t, offset)
+            for t in range(
+                timetable.route_trip_offsets[r], timetable.route_trip_offsets[r + 1]
+            )
+            for offset in day_offsets(timetable.trip_days[t])
+        ]
+        if not runs or len(runs) * num_stops < min_cells:
+            times.append(None)
+            trips.append(None)
+            stops.append(None)
+            continue
+        # times of a route's trips are contiguous in stop_times
+        first_trip = timetable.route_trip_offsets[r]
+        num_trips = timetable.route_trip_offsets[r + 1] - first_trip
+        base = timetable.trip_time_offsets[first_trip]
+        trip_times = np.array(
+            timetable.stop_times[base : base + num_trips * num_stops], dtype=np.int64
+        ).reshape(num_trips, num_stops)
+        rows = np.array([t - first_trip for t, _ in runs], dtype=np.int64)
+        offsets = np.array([offset for _, offset in runs], dtype=np.int64)
+        matrix = trip_times[rows] + offsets[:, None]
+        matrix[trip_times[rows] == INF] = HOLE
+        times.append(matrix.astype(np.int32))
+        trips.append(rows + first_trip)
+        stops.append(
+            np.array(
+                timetable.route_stops[first_slot : first_slot + num_stops],
+                dtype=np.int64,
+            )
+        )
+    return RouteMatrices(tuple(times), tuple(trips), tuple(stops))
+
+
+def scan_route(
+    times: "np.ndarray", labels: "np.ndarray", start_pos: int
+) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Earliest arrival at each stop of a route with one trip, boarding at any
+    earlier stop reached in the previous round, with whole-array operations.
+
+    At every reached stop the earliest trip leaving at or after its label is
+    boarded (as in the Python scan), and each stop further along takes the
+    earliest arrival of those trips. For trips that don't overtake each other
+    this gives the same arrivals as the Python scan in _raptor_rounds. Trip times
+    must not go backwards (checked in debug mode).
+
+    Args:
+        times (np.ndarray): (runs x stops) stop times of the route (HOLE if not served).
+        labels (np.ndarray): Arrival at the route's stops in the previous round
+            (int64, INF if not reached).
+        start_pos (int): First position with a label.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: For positions start_pos onwards:
+            earliest arrival (HOLE if none), trip row giving it and the position
+            that trip is boarded at.
+    """
+    t = times[:, start_pos:]
+    num_pos = t.shape[1]
+    reached = np.flatnonzero(labels[start_pos:] != INF)
+
+    # earliest trip leaving each reached stop at or after its label
+    departures = t[:, reached]
+    departures = np.where(departures >= labels[start_pos:][reached], departures, HOLE)
+    rows = departures.argmin(axis=0)
+    boarded = departures[rows, np.arange(reached.size)] != HOLE
+    reached = reached[boarded]
+    rows = rows[boarded]
+
+    # ride each of them to every later stop, keep the earliest arrival per stop
+    candidates = t[rows, :]
+    later = np.arange(num_pos)[None, :] > reached[:, None]
+    candidates = np.where(later, candidates, HOLE)
+    if reached.size == 0:
+        empty = np.full(num_pos, HOLE, dtype=np.int64)
+        return empty, np.zeros(num_pos, dtype=np.int64), empty
+    best = candidates.argmin(axis=0)
+    arrivals = candidates[best, np.arange(num_pos)]
+    return arrivals, rows[best], reached[best] + start_pos
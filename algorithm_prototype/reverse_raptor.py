@@ -0,0 +1,528 @@
+import sys
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from algorithm_prototype.predecessors import NONE, SuccessorLayers
+from algorithm_prototype.raptor import (
+    Stop,
+    Route,
+    Transfer,
+    INF,
+)
+from algorithm_prototype.timetable import (
+    Timetable,
+    build_timetable,
+    validate_timetable,
+)
+from algorithm_prototype.workspace import QueryWorkspace, query_workspace
+
+# Value used as "cannot reach the target in time" (latest departures go down)
+NEG_INF: int = -sys.maxsize
+# trip left from a source stop: departure, round, the stop it is left at and the
+# arrival there, route and trip indices, boarding and alighting positions
+StartLeg = Tuple[int, int, int, int, int, int, int, int]
+
+
+def reverse_raptor_algo(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    arrival_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    source_pruning: bool = True,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Reverse RAPTOR - latest departure for arrive-by queries.
+
+    RAPTOR run backwards from the target over the same timetable: round k finds
+    the latest time one can leave each stop and still be at the target by
+    arrival_time using at most k trips. Routes are scanned from their last marked
+    stop towards the first, getting off the latest trip that arrives in time, and
+    footpaths are walked in reverse. Journeys have the same shape as forward ones
+    (a trip first, at most one walk after each trip).
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        source_id (str): Origin stop id.
+        target_id (str): Destination stop id.
+        arrival_time (int): Latest arrival time at the destination (minutes).
+        max_rounds (int, optional): Maximum number of trips. Defaults to 10.
+        debug (bool, optional): Trace mode: validate the timetable unless
+            validate_timetable already did at load. Defaults to False.
+        timetable (Timetable, optional): Compiled timetable (see raptor_algo).
+        source_pruning (bool, optional): Don't improve stops at times that can't
+            beat the latest known departure from the source (the mirror of
+            target pruning in raptor_algo). Defaults to True.
+        max_walk_dist (float, optional): Longest footpath to walk in meters (see
+            raptor_algo). Defaults to None (all of them).
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of latest departure times at all stops (NEG_INF if the target
+              can't be reached in time).
+            - List of steps from source to target, same format as raptor_algo.
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    if debug and not timetable.validated:
+        validate_timetable(timetable)
+
+    id_to_idx = timetable.stop_index
+
+    if target_id not in id_to_idx:
+        raise ValueError("Destination not a valid Stop.")
+    target_idx = id_to_idx[target_id]
+    source_idx: Optional[int] = id_to_idx.get(source_id)
+    sources = {} if source_idx is None or source_idx == target_idx else {source_idx: 0}
+
+    return _reverse_query(
+        timetable,
+        sources,
+        {target_idx: arrival_time},
+        max_rounds,
+        source_pruning and source_idx is not None,
+        max_walk_dist,
+    )
+
+
+def reverse_raptor_multi(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    sources: Dict[str, int],
+    targets: Dict[str, int],
+    arrival_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    source_pruning: bool = True,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Reverse RAPTOR from several target stops to several source stops in one
+    run, the arrive-by counterpart of raptor_multi.
+
+    Every target stop must be left in time to walk its egress walk by
+    arrival_time, and the journey returned leaves the origin as late as possible:
+    the latest departure from a source stop minus its access walk. As in
+    raptor_multi journeys start with a trip, and source stops may also be passed
+    on the way.
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        sources (Dict[str, int]): Source stop ids with their access walk (minutes).
+        targets (Dict[str, int]): Target stop ids with their egress walk (minutes).
+            Unknown stops and stops that are also sources are ignored.
+        arrival_time (int): Latest arrival time at the destination (minutes).
+        Others same as reverse_raptor_algo.
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of latest departure times at all stops (access and egress
+              walks not included, a source stop's may be on the way).
+            - Steps of the journey from its source stop to its target stop, same
+              format as reverse_raptor_algo: the start step holds the departure
+              from the source stop. Empty if there is none.
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    if debug and not timetable.validated:
+        validate_timetable(timetable)
+
+    id_to_idx = timetable.stop_index
+    if not sources or any(sid not in id_to_idx for sid in sources):
+        raise ValueError("Origin not a valid Stop.")
+    access = {id_to_idx[sid]: walk for sid, walk in sources.items()}
+    departures = {
+        id_to_idx[sid]: arrival_time - egress
+        for sid, egress in targets.items()
+        if sid in id_to_idx and id_to_idx[sid] not in access
+    }
+
+    return _reverse_query(
+        timetable,
+        access,
+        departures,
+        max_rounds,
+        source_pruning,
+        max_walk_dist,
+        pass_sources=True,
+    )
+
+
+def _reverse_query(
+    timetable: Timetable,
+    sources: Dict[int, int],
+    targets: Dict[int, int],
+    max_rounds: int,
+    prune: bool,
+    max_walk_dist: Optional[float],
+    pass_sources: bool = False,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Backward rounds and the journey from the source stop leaving the origin
+    latest (sources, targets and pass_sources as in _reverse_rounds)."""
+    with query_workspace(timetable, unreached=NEG_INF) as workspace:
+        best, successor_layers, starts = _reverse_rounds(
+            timetable,
+            sources,
+            targets,
+            max_rounds,
+            prune and bool(sources),
+            workspace,
+            max_walk_dist,
+            pass_sources,
+        )
+        result: Dict[str, int] = dict(zip(timetable.stop_ids, best))
+
+        if not targets or not starts:
+            return result, []
+        source_idx = max(starts, key=lambda s: starts[s][0] - sources[s])
+
+        journey = _reconstruct_forward_path(
+            timetable,
+            successor_layers,
+            source_idx,
+            starts[source_idx],
+            targets,
+        )
+        return result, journey
+
+
+def _reverse_rounds(
+    timetable: Timetable,
+    sources: Dict[int, int],
+    targets: Dict[int, int],
+    max_rounds: int,
+    prune: bool,
+    workspace: QueryWorkspace,
+    max_walk_dist: Optional[float] = None,
+    pass_sources: bool = False,
+) -> Tuple[List[int], SuccessorLayers, Dict[int, StartLeg]]:
+    """Run the backward rounds from the targets (see reverse_raptor_algo) in a
+    workspace lent with unreached NEG_INF. Successors go to its layers (read
+    with SuccessorLayers), the round arrays are left clean. Only footpaths at
+    most max_walk_dist meters long are walked (None: all).
+
+    sources maps the source stops to their access walk (minutes), targets the
+    target stops to the latest time they may be left. Journeys start with a
+    trip: the latest trip left from each source stop is kept apart from its
+    label, so with pass_sources source stops may also be passed on the way
+    (walked to) by journeys from other source stops.
+
+    Returns:
+        Tuple[List[int], SuccessorLayers, Dict[int, StartLeg]]: Latest departure
+            per stop (workspace.best), the successors and the first leg of the
+            journey from each source stop left by trip.
+    """
+    # flat timetable arrays (locals for fast access in the loops below)
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    trip_time_offsets = timetable.trip_time_offsets
+    stop_times = timetable.stop_times
+    slot_departures = timetable.slot_departures
+    slot_trips = timetable.slot_trips
+    stop_route_offsets = timetable.stop_route_offsets
+    stop_routes = timetable.stop_routes
+    stop_route_positions = timetable.stop_route_positions
+    transfer_in_offsets = timetable.transfer_in_offsets
+    transfer_in_sources = timetable.transfer_in_sources
+    transfer_in_walks = timetable.transfer_in_walks
+    transfer_in_distances = timetable.transfer_in_distances
+    walk_limit = INF if max_walk_dist is None else max_walk_dist
+
+    # latest departure time for each stop over all rounds
+    best = workspace.best
+    # successor of each stop per round (the next leg towards the target), mirror
+    # of the predecessor layers of raptor_algo
+    successor_layers = SuccessorLayers(timetable, max_rounds, workspace.layers)
+    improved_round = workspace.improved_round  # last round a stop was improved
+    touched = workspace.touched
+
+    # the round arrays are reused: only the entries written are reset (as in
+    # raptor._raptor_rounds)
+    prev = workspace.prev
+    cur = workspace.cur
+    marked = workspace.marked
+
+    marked_list = []
+    for target_idx, departure in targets.items():
+        best[target_idx] = departure
+        cur[target_idx] = departure
+        improved_round[target_idx] = 0
+        marked[target_idx] = True
+        marked_list.append(target_idx)
+
+    # trip left from each source stop (see StartLeg)
+    starts: Dict[int, StartLeg] = {}
+    # source pruning: latest departure from the origin found so far (a source
+    # stop's departure minus its access walk); a stop left at time t gives at
+    # best t minus the shortest access walk
+    min_access = min(sources.values(), default=0)
+    source_bound = NEG_INF
+
+    def walk_back(k: int) -> bool:
+        """Relax incoming footpaths of the stops marked in round k."""
+        next_stop, next_time, next_route, next_trip, _, _, next_walk = (
+            successor_layers.allocate(k)
+        )
+        walked = False
+        for v in list(marked_list):
+            dep_v = cur[v]
+            if dep_v == NEG_INF:
+                continue
+            for j in range(transfer_in_offsets[v], transfer_in_offsets[v + 1]):
+                # nearest first, so the rest are too long as well
+                if transfer_in_distances[j] > walk_limit:
+                    break
+                u = transfer_in_sources[j]
+                # journeys start with a trip
+                if u in sources and not pass_sources:
+                    continue
+                walk_time = transfer_in_walks[j]
+                new_departure = dep_v - walk_time
+                if prune and new_departure - min_access <= source_bound:
+                    continue
+                if new_departure > cur[u] and new_departure > best[u]:
+                    # transfers stay in the same round
+                    next_stop[u] = v
+                    next_time[u] = dep_v
+                    next_route[u] = NONE
+                    next_trip[u] = NONE
+                    next_walk[u] = walk_time
+                    cur[u] = new_departure
+                    best[u] = new_departure
+                    improved_round[u] = k
+                    if not marked[u]:
+                        marked[u] = True
+                        marked_list.append(u)
+                        walked = True
+        return walked
+
+    # the last leg may be a walk to the target
+    walk_back(0)
+    touched.extend(marked_list)
+    # round 0 departures are the previous round of round 1
+    prev_stops: List[int] = list(marked_list)  # stops set in prev
+    cur_stops: List[int] = list(marked_list)  # set in cur, other than marked ones
+    for stop_idx in prev_stops:
+        prev[stop_idx] = cur[stop_idx]
+
+    for k in range(1, max_rounds + 1):
+        improved = False
+        (
+            next_stop,
+            next_time,
+            next_route,
+            next_trip,
+            board_positions,
+            alight_positions,
+            _,
+        ) = successor_layers.allocate(k)
+
+        # 1: routes serving marked stops, keeping the last marked position per route
+        Q: Dict[int, int] = {}  # route idx -> last_marked_stop_index_in_route
+        for stop_idx in marked_list:
+            for j in range(
+                stop_route_offsets[stop_idx], stop_route_offsets[stop_idx + 1]
+            ):
+                r = stop_routes[j]
+                pos = stop_route_positions[j]
+                if pos > Q.get(r, -1):
+                    Q[r] = pos
+
+        for stop_idx in marked_list:
+            marked[stop_idx] = False
+        marked_list = []
+
+        # 2: traverse each route backwards
+        for r, start_pos in Q.items():
+            first_slot = route_stop_offsets[r]
+
+            # single pass back along the route, holding the current (latest) trip
+            trip = -1
+            trip_base = 0
+            day_offset = 0
+            alighted_at = -1
+            alight_stop_idx = -1
+            alight_time = NEG_INF
+
+            for pos in range(start_pos, -1, -1):
+                stop_idx = route_stops[first_slot + pos]
+
+                # a) board the current trip here
+                if trip >= 0:
+                    time = stop_times[trip_base + pos]
+                    trip_time = time + day_offset
+                    next_time_same_trip = stop_times[trip_base + pos + 1]
+                    # same validity rules as the forward scan, mirrored
+                    valid = (
+                        time != INF
+                        and trip_time <= alight_time
+                        and not (
+                            next_time_same_trip != INF and time > next_time_same_trip
+                        )
+                        and not (prune and trip_time - min_access <= source_bound)
+                    )
+                    if (
+                        valid
+                        and trip_time > cur[stop_idx]
+                        and trip_time > best[stop_idx]
+                    ):
+                        next_stop[stop_idx] = alight_stop_idx
+                        next_time[stop_idx] = alight_time
+                        next_route[stop_idx] = r
+                        next_trip[stop_idx] = trip
+                        board_positions[stop_idx] = pos
+                        alight_positions[stop_idx] = alighted_at
+                        cur[stop_idx] = trip_time
+                        best[stop_idx] = trip_time
+                        improved_round[stop_idx] = k
+                        if not marked[stop_idx]:
+                            marked[stop_idx] = True
+                            marked_list.append(stop_idx)
+                            improved = True
+                    # journeys from a source stop leave it by trip, also when its
+                    # label is a walk on the way from another source stop
+                    if (
+                        valid
+                        and stop_idx in sources
+                        and (stop_idx not in starts or trip_time > starts[stop_idx][0])
+                    ):
+                        starts[stop_idx] = (
+                            trip_time,
+                            k,
+                            alight_stop_idx,
+                            alight_time,
+                            r,
+                            trip,
+                            pos,
+                            alighted_at,
+                        )
+                        source_bound = max(source_bound, trip_time - sources[stop_idx])
+
+                # b) can we get off a later trip here? (left from here in previous round)
+                dep_prev = prev[stop_idx]
+                if dep_prev == NEG_INF:
+                    continue
+                cur_arrival = stop_times[trip_base + pos] if trip >= 0 else NEG_INF
+                if cur_arrival == INF:
+                    cur_arrival = NEG_INF  # current trip doesn't serve this stop
+                elif trip >= 0:
+                    cur_arrival += day_offset
+                if dep_prev < cur_arrival:
+                    continue  # current trip already arrives after we must leave
+                arr_times = slot_departures[first_slot + pos]
+                i = bisect_right(arr_times, dep_prev) - 1
+                if (
+                    i >= 0
+                    and arr_times[i] > cur_arrival
+                    and not (prune and arr_times[i] - min_access <= source_bound)
+                ):
+                    trip = slot_trips[first_slot + pos][i]
+                    trip_base = trip_time_offsets[trip]
+                    # the day the trip runs on follows from its arrival here
+                    day_offset = arr_times[i] - stop_times[trip_base + pos]
+                    alighted_at = pos
+                    alight_stop_idx = stop_idx
+                    alight_time = arr_times[i]
+
+        # 3: footpaths (walked backwards) into the stops improved this round
+        if walk_back(k):
+            improved = True
+
+        # this round's departures become prev, the old prev (cleared) cur
+        for stop_idx in prev_stops:
+            prev[stop_idx] = NEG_INF
+        prev, cur = cur, prev
+        prev_stops = cur_stops + marked_list
+        cur_stops = []
+        touched.extend(marked_list)
+        if not improved:
+            break
+
+    # leave the round arrays clean for the next query
+    for stop_idx in marked_list:
+        marked[stop_idx] = False
+    for stop_idx in prev_stops + cur_stops:
+        prev[stop_idx] = NEG_INF
+        cur[stop_idx] = NEG_INF
+    return best, successor_layers, starts
+
+
+def _reconstruct_forward_path(
+    timetable: Timetable,
+    successor_layers: SuccessorLayers,
+    source_idx: int,
+    start: StartLeg,
+    targets: Dict[int, int],
+) -> List[Dict[str, Any]]:
+    """Follow successors from the trip left from the source (start) to a target
+    stop without one, giving the steps in travel order (same format as
+    reconstruct_path in raptor.py)."""
+    idx_to_id = timetable.stop_ids
+    departure, r, next_idx, arrival, route, trip, board_pos, alight_pos = start
+    trips = r  # trips left from the source
+    path: List[Dict[str, Any]] = [
+        {
+            "stop_id": idx_to_id[source_idx],
+            "arrival_time": departure,
+            "mode": "start",
+            "route_id": None,
+            "trip_id": None,
+            "transfer_time": None,
+            "from_stop_id": None,
+        }
+    ]
+    # same fields as SuccessorLayers.step
+    succ: Optional[Dict[str, Any]] = {
+        "next_idx": next_idx,
+        "arrival_time": arrival,
+        "mode": "trip",
+        "route_id": timetable.route_ids[route],
+        "trip_id": timetable.trip_day_id(trip, alight_pos, arrival),
+        "transfer_time": None,
+        "board_pos": board_pos,
+        "disembark_pos": alight_pos,
+        "next_round": r - 1,
+    }
+    current = source_idx
+    visited = set()
+    while True:
+        if succ is None:
+            if current in targets:
+                break
+            return []  # no successor found (shouldn't happen)
+        if (current, r) in visited:
+            raise ValueError(
+                f"Cycle detected during path reconstruction at stop {idx_to_id[current]} in round {r}."
+            )
+        visited.add((current, r))
+
+        step = {
+            "prev_idx": current,
+            "arrival_time": succ["arrival_time"],
+            "mode": succ["mode"],
+            "route_id": succ["route_id"],
+            "trip_id": succ["trip_id"],
+            "transfer_time": succ["transfer_time"],
+            # trips taken so far, as in forward paths
+            "round": trips - r + 1 if succ["mode"] == "trip" else trips - r,
+            "stop_id": idx_to_id[succ["next_idx"]],
+            "from_stop_id": idx_to_id[current],
+        }
+        if succ["mode"] == "trip":
+            step["board_pos"] = succ["board_pos"]
+            step["disembark_pos"] = succ["disembark_pos"]
+        path.append(step)
+        current = succ["next_idx"]
+        r = succ["next_round"]
+        succ = successor_layers[r][current] if r >= 0 else None
+
+    return path
@@ -0,0 +1,68 @@
+import pytest
+
+from algorithm_prototype.raptor import Stop, Route, Trip, Transfer
+
+"""
+-------------------------------------------------------------
+    NETWORKS SHARED BY THE ROUTING TESTS
+-------------------------------------------------------------
+"""
+
+
+@pytest.fixture
+def three_way_network():
+    """
+    S -> T three ways:
+        - R1 to A, walk 10 mins to B, R2 to T: arrive 07:35, 2 trips, 10 mins walking
+        - R1 to A, R3 to T: arrive 07:50, 2 trips, no walking
+        - R4 direct: arrive 08:10, 1 trip, no walking
+    """
+    s = Stop("S", 2, -33.90, 18.40)
+    a = Stop("A", 2, -33.91, 18.41)
+    b = Stop("B", 2, -33.915, 18.415)
+    t = Stop("T", 2, -33.93, 18.43)
+    stops = {x.id: x for x in [s, a, b, t]}
+    r1 = Route("R1", [s, a], [])
+    r1.add_trip(Trip("T1", [420, 430]))
+    r2 = Route("R2", [b, t], [])
+    r2.add_trip(Trip("T2", [445, 455]))
+    r3 = Route("R3", [a, t], [])
+    r3.add_trip(Trip("T3", [440, 470]))
+    r4 = Route("R4", [s, t], [])
+    r4.add_trip(Trip("T4", [420, 490]))
+    routes = {r.id: r for r in [r1, r2, r3, r4]}
+    transfers = [Transfer(a, b, 10)]
+    return stops, routes, transfers
+
+
+def _random_network(rng):
+    """
+    12 stops and 6 routes of 4 FIFO trips each, with 6 footpaths from stops 3-7
+    to stops 8-11. Query from sources 0-2: the footpaths neither chain nor leave
+    a source, where raptor_algo's walks differ from the other algorithms'
+    (see test_trip_based_walks_on_after_returning_to_the_source).
+    """
+    stops = {str(i): Stop(str(i), 2, -33.9 + i / 1000, 18.4) for i in range(12)}
+    stop_list = list(stops.values())
+    routes = {}
+    for r in range(6):
+        route = Route(f"R{r}", rng.sample(stop_list, 5), [])
+        # same running times for every trip: FIFO, like GTFS stop patterns
+        hops = [rng.randrange(2, 12) for _ in range(4)]
+        for k in range(4):
+            times = [400 + rng.randrange(0, 30) + 30 * k]
+            for hop in hops:
+                times.append(times[-1] + hop)
+            route.add_trip(Trip(f"R{r}T{k}", times))
+        routes[route.id] = route
+    transfers = [
+        Transfer(stop_list[rng.randrange(3, 8)], stop_list[rng.randrange(8, 12)], w)
+        for w in (rng.randrange(2, 8) for _ in range(6))
+    ]
+    return stops, routes, transfers
+
+
+@pytest.fixture
+def random_network():
+    """Builds (stops, routes, transfers) of a random network from a random.Random."""
+    return _random_network
@@ -0,0 +1,90 @@
+import random
+
+from algorithm_prototype.raptor import INF, Stop, Route, Trip, raptor_algo
+from algorithm_prototype.timetable import build_timetable
+from algorithm_prototype.csa import build_connections, csa_algo
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR CSA
+-------------------------------------------------------------
+"""
+
+
+def test_build_connections_sorted(three_way_network):
+    stops, routes, transfers = three_way_network
+    timetable = build_timetable(stops, routes, transfers)
+
+    connections = build_connections(timetable)
+
+    assert len(connections) == 4
+    assert list(connections.dep_times) == [420, 420, 440, 445]
+    assert list(connections.arr_times) == [430, 490, 470, 455]
+    assert connections.num_runs == 4
+
+
+def test_csa_matches_raptor(three_way_network):
+    stops, routes, transfers = three_way_network
+
+    result, path = csa_algo(stops, routes, transfers, "S", "T", 415)
+
+    raptor_result, raptor_path = raptor_algo(stops, routes, transfers, "S", "T", 415, 4)
+    assert result["T"] == raptor_result["T"] == 455
+    assert [st["stop_id"] for st in path] == [st["stop_id"] for st in raptor_path]
+    assert [st["mode"] for st in path] == ["start", "trip", "transfer", "trip"]
+    assert path[1]["trip_id"] == "T1" and path[3]["trip_id"] == "T2"
+    assert path[2]["transfer_time"] == 10
+
+    # nothing leaves S after 07:00
+    result, path = csa_algo(stops, routes, transfers, "S", "T", 421)
+    assert result["T"] == INF and path == []
+
+
+def test_csa_takes_overtaking_trip():
+    s = Stop("S", 2, -33.90, 18.40)
+    t = Stop("T", 2, -33.93, 18.43)
+    stops = {"S": s, "T": t}
+    route = Route("R", [s, t], [])
+    route.add_trip(Trip("SLOW", [420, 480]))
+    route.add_trip(Trip("FAST", [425, 440]))
+
+    result, path = csa_algo(stops, {"R": route}, [], "S", "T", 415)
+
+    assert result["T"] == 440
+    assert path[-1]["trip_id"] == "FAST"
+
+
+def test_csa_random_networks(random_network):
+    rng = random.Random(11)
+    for _ in range(20):
+        stops, routes, transfers = random_network(rng)
+        timetable = build_timetable(stops, routes, transfers)
+        connections = build_connections(timetable)
+        for source in ["0", "1", "2"]:
+            for target in stops:
+                if target == source:
+                    continue
+                expected, _ = raptor_algo(
+                    stops,
+                    routes,
+                    transfers,
+                    source,
+                    target,
+                    420,
+                    10,
+                    timetable=timetable,
+                )
+                result, path = csa_algo(
+                    stops,
+                    routes,
+                    transfers,
+                    source,
+                    target,
+                    420,
+                    timetable=timetable,
+                    connections=connections,
+                )
+                assert result[target] == expected[target]
+                if path:
+                    assert path[-1]["stop_id"] == target
+                    assert path[-1]["arrival_time"] == result[target]
@@ -0,0 +1,287 @@
+import random
+
+import pytest
+
+from algorithm_prototype.csa import csa_algo
+from algorithm_prototype.dijkstra import dijkstra_algo
+from algorithm_prototype.footpaths import (
+    PointGrid,
+    build_footpath_index,
+    close_footpaths,
+)
+from algorithm_prototype.mcraptor import mcraptor_algo
+from algorithm_prototype.raptor import (
+    Stop,
+    Route,
+    Trip,
+    INF,
+    helper_functions as hf,
+    raptor_algo,
+)
+from algorithm_prototype.reverse_raptor import reverse_raptor_algo
+from algorithm_prototype.timetable import build_timetable
+from algorithm_prototype.trip_based import build_trip_transfers, trip_based_algo
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR THE FOOTPATH INDEX
+-------------------------------------------------------------
+"""
+
+
+def _scattered_stops(n: int = 60, seed: int = 3):
+    rng = random.Random(seed)
+    return {
+        f"S{i}": Stop(
+            f"S{i}",
+            2,
+            -33.92 + rng.uniform(-0.01, 0.01),
+            18.42 + rng.uniform(-0.01, 0.01),
+        )
+        for i in range(n)
+    }
+
+
+def _as_set(transfers):
+    return {(t.from_stop.id, t.to_stop.id, t.walking_time) for t in transfers}
+
+
+def test_footpath_index_prefix_matches_create_transfers():
+    stops = _scattered_stops()
+    footpaths = build_footpath_index(stops, 1000)
+    for s in range(len(stops)):
+        lo, hi = footpaths.offsets[s], footpaths.offsets[s + 1]
+        assert list(footpaths.distances[lo:hi]) == sorted(footpaths.distances[lo:hi])
+    # every shorter walking distance is the same as a search of its own, and
+    # finds every pair of stops that close
+    for radius in (0, 150, 400, 725, 1000):
+        transfers = _as_set(footpaths.transfers(radius))
+        assert transfers == _as_set(hf.create_transfers(stops, radius))
+        assert {(u, v) for u, v, _ in transfers} == {
+            (s1.id, s2.id)
+            for s1 in stops.values()
+            for s2 in stops.values()
+            if s1 is not s2 and hf.haversine(s1.lat, s1.lon, s2.lat, s2.lon) <= radius
+        }
+
+
+def test_footpath_index_beyond_max_distance_raises():
+    footpaths = build_footpath_index(_scattered_stops(10), 300)
+    with pytest.raises(ValueError):
+        footpaths.transfers(301)
+
+
+def test_timetable_with_shorter_footpaths():
+    a = Stop("A", 2, -33.918, 18.423)
+    b = Stop("B", 2, -33.935, 18.413)
+    # 300 m from B
+    c = Stop("C", 2, -33.9377, 18.413)
+    d = Stop("D", 2, -33.96, 18.40)
+    stops = {"A": a, "B": b, "C": c, "D": d}
+    r1 = Route("R1", [a, b], [])
+    r1.add_trip(Trip("T1", [420, 430]))
+    r2 = Route("R2", [c, d], [])
+    r2.add_trip(Trip("T2", [440, 450]))
+    routes = {"R1": r1, "R2": r2}
+    footpaths = build_footpath_index(stops, 1000)
+    timetable = build_timetable(stops, routes, footpaths.transfers(1000))
+
+    result, _ = raptor_algo(stops, routes, [], "A", "D", 420, timetable=timetable)
+    assert result["D"] == 450
+    # too short to walk from B to C
+    short = timetable.with_transfers(footpaths.transfers(200))
+    result, _ = raptor_algo(stops, routes, [], "A", "D", 420, timetable=short)
+    assert result["D"] == INF
+
+
+def test_max_walk_dist_matches_timetable_of_shorter_footpaths():
+    rng = random.Random(13)
+    stops = _scattered_stops(30, seed=13)
+    stop_list = list(stops.values())
+    routes = {}
+    for r in range(8):
+        route = Route(f"R{r}", rng.sample(stop_list, 5), [])
+        hops = [rng.randrange(2, 8) for _ in range(4)]
+        for k in range(3):
+            times = [410 + rng.randrange(0, 20) + 20 * k]
+            for hop in hops:
+                times.append(times[-1] + hop)
+            route.add_trip(Trip(f"R{r}T{k}", times))
+        routes[route.id] = route
+    footpaths = build_footpath_index(stops, 1000)
+    timetable = build_timetable(stops, routes, footpaths.transfers(1000))
+
+    # walking fewer of the footpaths is the same as compiling only those
+    for radius in (150, 400, 700):
+        short = timetable.with_transfers(footpaths.transfers(radius))
+        short_transfers = build_trip_transfers(short)
+        transfers = build_trip_transfers(timetable, radius)
+        # first stops of routes
+        for source in ("S8", "S4", "S14"):
+            expected, _ = raptor_algo(
+                stops, routes, [], source, "", 400, timetable=short
+            )
+            result, _ = raptor_algo(
+                stops,
+                routes,
+                [],
+                source,
+                "",
+                400,
+                timetable=timetable,
+                max_walk_dist=radius,
+            )
+            assert result == expected
+            assert (
+                result
+                != raptor_algo(stops, routes, [], source, "", 400, timetable=timetable)[
+                    0
+                ]
+            )
+            for target in ("S5", "S19", "S24"):
+                for algo, kwargs, short_kwargs in [
+                    (mcraptor_algo, {}, {}),
+                    (csa_algo, {}, {}),
+                    (dijkstra_algo, {}, {}),
+                    (
+                        trip_based_algo,
+                        {"trip_transfers": transfers},
+                        {"trip_transfers": short_transfers},
+                    ),
+                ]:
+                    expected, _ = algo(
+                        stops,
+                        routes,
+                        [],
+                        source,
+                        target,
+                        400,
+                        timetable=short,
+                        **short_kwargs,
+                    )
+                    result, _ = algo(
+                        stops,
+                        routes,
+                        [],
+                        source,
+                        target,
+                        400,
+                        timetable=timetable,
+                        max_walk_dist=radius,
+                        **kwargs,
+                    )
+                    assert result[target] == expected[target]
+                expected, _ = reverse_raptor_algo(
+                    stops, routes, [], source, target, 480, timetable=short
+                )
+                result, _ = reverse_raptor_algo(
+                    stops,
+                    routes,
+                    [],
+                    source,
+                    target,
+                    480,
+                    timetable=timetable,
+                    max_walk_dist=radius,
+                )
+                assert result == expected
+    # trip transfers are for one walking distance
+    with pytest.raises(ValueError, match="Trip transfers"):
+        trip_based_algo(
+            stops,
+            routes,
+            [],
+            "S0",
+            "S1",
+            400,
+            timetable=timetable,
+            trip_transfers=build_trip_transfers(timetable, 400),
+        )
+
+
+def test_grid_pairs_match_rtree_search(monkeypatch):
+    pytest.importorskip("numpy")
+    pytest.importorskip("rtree")
+    from algorithm_prototype import raptor
+
+    stops = _scattered_stops(200, seed=5)
+    # two stops at the same place
+    stops["Twin"] = Stop("Twin", 2, stops["S0"].lat, stops["S0"].lon)
+    for radius in (0, 90, 500, 1500):
+        grid = hf.walkable_pairs(stops, radius)
+        monkeypatch.setattr(raptor, "HAS_NUMPY", False)
+        rtree = hf.walkable_pairs(stops, radius)
+        monkeypatch.setattr(raptor, "HAS_NUMPY", True)
+        assert grid[:2] == rtree[:2]
+        assert grid[2] == pytest.approx(rtree[2])
+        assert (0, len(stops) - 1) in zip(grid[0], grid[1])
+
+
+def test_point_grid_matches_scan_of_all_stops():
+    stops = _scattered_stops(200, seed=7)
+    grid = PointGrid.from_stops(stops, 500)
+    rng = random.Random(7)
+    for _ in range(50):
+        lat, lon = -33.92 + rng.uniform(-0.05, 0.05), 18.42 + rng.uniform(-0.05, 0.05)
+        radius = rng.uniform(0, 1500)
+        distances = [hf.haversine(lat, lon, s.lat, s.lon) for s in stops.values()]
+        assert grid.within(lat, lon, radius) == [
+            (p, d) for p, d in enumerate(distances) if d <= radius
+        ]
+        nearest = min(range(len(distances)), key=distances.__getitem__)
+        assert grid.nearest(lat, lon) == (nearest, distances[nearest])
+        assert grid.ids[nearest] == f"S{nearest}"
+    # nothing that close
+    assert grid.nearest(-34.5, 18.42, 1000) == (-1, 1000)
+
+
+def _line_network():
+    # stops 0.5 km apart on a line, a trip from the first and one from the last
+    stops = {f"L{i}": Stop(f"L{i}", 2, -33.9, 18.4 + i * 0.0054) for i in range(4)}
+    a, d = Stop("A", 2, -33.95, 18.4), Stop("D", 2, -33.95, 18.46)
+    stops.update({"A": a, "D": d})
+    r1 = Route("R1", [a, stops["L0"]], [])
+    r1.add_trip(Trip("T1", [420, 430]))
+    r2 = Route("R2", [stops["L3"], d], [])
+    r2.add_trip(Trip("T2", [460, 470]))
+    return stops, {"R1": r1, "R2": r2}
+
+
+def test_close_footpaths_chains_within_budget():
+    stops, _ = _line_network()
+    transfers = build_footpath_index(stops, 600).transfers(600)
+    walks = {(t.from_stop.id, t.to_stop.id): t.walking_time for t in transfers}
+    assert ("L0", "L2") not in walks
+
+    closed = close_footpaths(transfers, 13)
+    closed_walks = {(t.from_stop.id, t.to_stop.id): t.walking_time for t in closed}
+    # the given footpaths are kept, chains within 13 minutes added
+    assert walks.items() <= closed_walks.items()
+    assert closed_walks[("L0", "L2")] == walks[("L0", "L1")] + walks[("L1", "L2")]
+    # and as long as the chain
+    lengths = {(t.from_stop.id, t.to_stop.id): t.distance for t in closed}
+    assert lengths[("L0", "L2")] == pytest.approx(
+        lengths[("L0", "L1")] + lengths[("L1", "L2")]
+    )
+    assert ("L0", "L3") not in closed_walks
+    longer = close_footpaths(transfers, 20)
+    assert ("L3", "L0") in {(t.from_stop.id, t.to_stop.id) for t in longer}
+    # quickest first per origin
+    from_l1 = [t.walking_time for t in closed if t.from_stop.id == "L1"]
+    assert from_l1 == sorted(from_l1)
+
+
+def test_raptor_single_walk_over_closed_footpaths():
+    stops, routes = _line_network()
+    # 1 km off the line, only a larger walking distance reaches it
+    stops["X"] = Stop("X", 2, -33.909, 18.408)
+    transfers = build_footpath_index(stops, 600).transfers(600)
+    result, _ = raptor_algo(stops, routes, transfers, "A", "D", 420)
+    assert result["D"] == INF
+    # L0 -> L3 is one footpath once closed, no 1.6 km search needed
+    closed = close_footpaths(transfers, 25)
+    assert len(closed) < len(hf.create_transfers(stops, 1700))
+    result, path = raptor_algo(stops, routes, closed, "A", "D", 420)
+    assert result["D"] == 470
+    walk = next(step for step in path if step["mode"] == "transfer")
+    assert (walk["from_stop_id"], walk["stop_id"]) == ("L0", "L3")
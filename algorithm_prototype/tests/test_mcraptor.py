@@ -0,0 +1,52 @@
+from algorithm_prototype.raptor import raptor_algo
+from algorithm_prototype.mcraptor import mcraptor_algo, pick_journey
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR McRAPTOR
+-------------------------------------------------------------
+"""
+
+
+def test_mcraptor_pareto_front(three_way_network):
+    stops, routes, transfers = three_way_network
+
+    result, journeys = mcraptor_algo(stops, routes, transfers, "S", "T", 415, 4)
+
+    assert [(j["arrival_time"], j["trips"], j["walking_time"]) for j in journeys] == [
+        (455, 2, 10),
+        (470, 2, 0),
+        (490, 1, 0),
+    ]
+    assert result["T"] == 455
+    # the fastest journey is the one plain RAPTOR finds
+    raptor_result, raptor_path = raptor_algo(stops, routes, transfers, "S", "T", 415, 4)
+    assert raptor_result["T"] == 455
+    assert [st["stop_id"] for st in journeys[0]["path"]] == [
+        st["stop_id"] for st in raptor_path
+    ]
+    # paths end at the target with the journey's arrival
+    for j in journeys:
+        assert j["path"][0]["mode"] == "start"
+        assert j["path"][-1]["stop_id"] == "T"
+        assert j["path"][-1]["arrival_time"] == j["arrival_time"]
+    walk = journeys[0]["path"][2]
+    assert walk["mode"] == "transfer" and walk["transfer_time"] == 10
+
+
+def test_mcraptor_max_rounds_limits_trips(three_way_network):
+    stops, routes, transfers = three_way_network
+
+    _, journeys = mcraptor_algo(stops, routes, transfers, "S", "T", 415, 1)
+
+    assert [(j["arrival_time"], j["trips"]) for j in journeys] == [(490, 1)]
+
+
+def test_pick_journey_preferences(three_way_network):
+    stops, routes, transfers = three_way_network
+    _, journeys = mcraptor_algo(stops, routes, transfers, "S", "T", 415, 4)
+
+    assert pick_journey(journeys)["arrival_time"] == 455
+    assert pick_journey(journeys, minimize_walking=True)["arrival_time"] == 470
+    assert pick_journey(journeys, minimize_transfers=True)["arrival_time"] == 490
+    assert pick_journey([]) is None
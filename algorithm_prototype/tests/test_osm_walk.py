@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import pytest
+
+from algorithm_prototype.footpaths import read_footpath_index, write_footpath_index
+from algorithm_prototype.osm_walk import read_osm, snap_to_graph, street_footpaths
+from algorithm_prototype.raptor import Stop, helper_functions as hf
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR STREET NETWORK FOOTPATHS
+-------------------------------------------------------------
+"""
+
+NODES = {
+    1: (-33.900, 18.400),
+    2: (-33.900, 18.402),
+    3: (-33.902, 18.402),
+    4: (-33.9005, 18.4005),
+    5: (-33.9005, 18.4015),
+    6: (-33.9015, 18.400),
+    7: (-33.9025, 18.400),
+}
+# L-shaped street 1-2-3, a motorway 4-5, a path 6-7 only joined to the street
+# by a footway closed to pedestrians
+WAYS = [
+    (10, [1, 2, 3], {"highway": "residential"}),
+    (11, [4, 5], {"highway": "motorway"}),
+    (12, [6, 7], {"highway": "path"}),
+    (13, [3, 6], {"highway": "footway", "foot": "no"}),
+]
+
+
+def _write_osm(path: Path) -> str:
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    for node_id, (lat, lon) in NODES.items():
+        lines.append(f'  <node id="{node_id}" lat="{lat}" lon="{lon}"/>')
+    for way_id, refs, tags in WAYS:
+        lines.append(f'  <way id="{way_id}">')
+        lines.extend(f'    <nd ref="{ref}"/>' for ref in refs)
+        lines.extend(f'    <tag k="{k}" v="{v}"/>' for k, v in tags.items())
+        lines.append("  </way>")
+    lines.append("</osm>")
+    path.write_text("\n".join(lines))
+    return str(path)
+
+
+def _stops():
+    at = {name: Stop(name, 2, *NODES[node]) for name, node in [("A", 1), ("C", 3)]}
+    return {
+        **at,
+        # next to the path
+        "B": Stop("B", 2, -33.9016, 18.4001),
+        "D": Stop("D", 2, *NODES[7]),
+        # far from any street, 100 m apart
+        "E": Stop("E", 2, -33.95, 18.45),
+        "F": Stop("F", 2, -33.9509, 18.45),
+    }
+
+
+def _lengths(footpaths):
+    return {
+        (t.from_stop.id, t.to_stop.id): distance
+        for t, distance in zip(footpaths.footpaths, footpaths.distances)
+    }
+
+
+def test_read_osm_keeps_walkable_ways(tmp_path: Path):
+    graph = read_osm(_write_osm(tmp_path / "extract.osm"))
+    # nodes of the street and the path, no motorway
+    assert graph.num_nodes == 5
+    # 1-2, 2-3 and 6-7 in both directions
+    assert len(graph.targets) == 6
+    assert graph.offsets[-1] == len(graph.lengths)
+
+
+def test_street_footpaths_follow_the_streets(tmp_path: Path):
+    graph = read_osm(_write_osm(tmp_path / "extract.osm"))
+    stops = _stops()
+    snaps = snap_to_graph(graph, stops)
+    assert [node >= 0 for node, _ in snaps] == [True, True, True, True, False, False]
+
+    footpaths = street_footpaths(graph, stops, 1000, processes=1)
+    lengths = _lengths(footpaths)
+    # around the corner, longer than the straight line
+    around = hf.haversine(*NODES[1], *NODES[2]) + hf.haversine(*NODES[2], *NODES[3])
+    assert lengths[("A", "C")] == pytest.approx(around)
+    assert lengths[("C", "A")] == pytest.approx(around)
+    assert lengths[("A", "C")] > hf.haversine(*NODES[1], *NODES[3])
+    assert footpaths.access_detours["A"] > 1
+    # close by, but not connected for pedestrians
+    assert ("A", "D") not in lengths and ("C", "B") not in lengths
+    # stop to street walks included
+    assert lengths[("B", "D")] == pytest.approx(
+        snaps[2][1] + hf.haversine(*NODES[6], *NODES[7])
+    )
+    # off the street graph: straight line
+    assert lengths[("E", "F")] == pytest.approx(
+        hf.haversine(stops["E"].lat, stops["E"].lon, stops["F"].lat, stops["F"].lon)
+    )
+
+    # shorter walking distances cut from the street footpaths
+    assert ("A", "C") not in {
+        (t.from_stop.id, t.to_stop.id) for t in footpaths.transfers(around - 1)
+    }
+
+
+def test_street_footpaths_parallel_and_saved(tmp_path: Path):
+    graph = read_osm(_write_osm(tmp_path / "extract.osm"))
+    stops = _stops()
+    footpaths = street_footpaths(graph, stops, 1000, processes=1)
+    parallel = street_footpaths(graph, stops, 1000, processes=2)
+    assert _lengths(parallel) == _lengths(footpaths)
+
+    path = str(tmp_path / "walk_footpaths.json")
+    write_footpath_index(path, footpaths)
+    saved = read_footpath_index(path, stops)
+    assert saved.max_distance == footpaths.max_distance
+    assert saved.access_detours == footpaths.access_detours
+    assert _lengths(saved) == pytest.approx(_lengths(footpaths), abs=0.01)
+    assert [t.walking_time for t in saved.footpaths] == [
+        t.walking_time for t in footpaths.footpaths
+    ]
@@ -11,6 +11,8 @@ from algorithm_prototype.raptor import (
     MIN_TRANSFER_TIME,
     helper_functions as hf,
     raptor_algo,
+    raptor_pareto,
+    raptor_range,
     reconstruct_path,
     reconstruct_path_objs,
     check_duplicate_stops,
@@ -83,6 +85,336 @@ def test_create_transfers_and_map_min_time():
     assert ("S1", "S2") in tmap and tmap[("S1", "S2")].to_stop.id == "S2"
 
 
+def test_route_sort_trips():
+    a = Stop("A", 2, -33.918, 18.423)
+    b = Stop("B", 2, -33.935, 18.413)
+    route = Route("R1", [a, b], [])
+    route.add_trip(Trip("T2", [500, 510]))
+    route.add_trip(Trip("T1", [INF, 490]))
+    route.add_trip(Trip("T0", [480, 485]))
+
+    route.sort_trips()
+    # ordered by first finite departure
+    assert [t.id for t in route.trips] == ["T0", "T1", "T2"]
+
+
+def test_raptor_hops_to_earlier_trip_along_route():
+    """
+    A is reached late but B (further along the same route) is reached early by a
+    transfer - the single pass along R2 must switch to the earlier trip at B.
+    """
+    s = Stop("S", 2, -33.90, 18.40)
+    a = Stop("A", 2, -33.91, 18.41)
+    b = Stop("B", 2, -33.92, 18.42)
+    c = Stop("C", 2, -33.93, 18.43)
+    stops_dict = {x.id: x for x in [s, a, b, c]}
+
+    # R1: S -> A (arrive 07:20) and S -> B (arrive 07:02) via two routes
+    r1 = Route("R1", [s, a], [])
+    r1.add_trip(Trip("T1", [420, 440]))
+    r3 = Route("R3", [s, b], [])
+    r3.add_trip(Trip("T3", [420, 422]))
+    # R2: A -> B -> C with trips every 15 mins, added out of order
+    r2 = Route("R2", [a, b, c], [])
+    for i, dep in enumerate([450, 405, 435, 420]):
+        r2.add_trip(Trip(f"T2_{i}", [dep, dep + 5, dep + 10]))
+    routes = {r.id: r for r in [r1, r2, r3]}
+
+    result, path = raptor_algo(stops_dict, routes, [], "S", "C", 415, 3)
+
+    # board at B at 07:25 (trip departing A 07:20), arrive C 07:30
+    assert result["C"] == 430
+    assert path[-1]["trip_id"] == "T2_3"
+    assert path[-1]["from_stop_id"] == "B"
+    assert path[-1]["board_pos"] == 1 and path[-1]["disembark_pos"] == 2
+
+
+def _pruning_network():
+    """
+    S -> T (target, 2 km south, arrive 07:10) on R1 and S -> D (1 km north,
+    arrive 07:05) -> X (arrive 07:40) on R2, both at ~200 m/min.
+    """
+    s = Stop("S", 2, -33.900, 18.40)
+    t = Stop("T", 2, -33.918, 18.40)
+    d = Stop("D", 2, -33.891, 18.40)
+    x = Stop("X", 2, -33.880, 18.40)
+    stops_dict = {y.id: y for y in [s, t, d, x]}
+    r1 = Route("R1", [s, t], [])
+    r1.add_trip(Trip("T1", [420, 430]))
+    r2 = Route("R2", [s, d, x], [])
+    r2.add_trip(Trip("T2", [420, 425, 460]))
+    return stops_dict, {r.id: r for r in [r1, r2]}
+
+
+def test_raptor_target_pruning():
+    stops_dict, routes = _pruning_network()
+
+    full, full_path = raptor_algo(stops_dict, routes, [], "S", "T", 415, 3)
+    pruned, pruned_path = raptor_algo(
+        stops_dict, routes, [], "S", "T", 415, 3, target_pruning=True
+    )
+
+    assert full["T"] == pruned["T"] == 430
+    assert full_path == pruned_path
+    # X can only be reached after the target -> not explored
+    assert full["X"] == 460
+    assert pruned["X"] == INF
+    # D is reached before the target, plain target pruning keeps it
+    assert pruned["D"] == 425
+
+
+def test_raptor_lower_bound_pruning():
+    stops_dict, routes = _pruning_network()
+
+    result, path = raptor_algo(
+        stops_dict, routes, [], "S", "T", 415, 3, target_pruning=True, lower_bound=True
+    )
+
+    assert result["T"] == 430
+    assert path[-1]["trip_id"] == "T1"
+    # D is ~3 km from T, at <= 200 m/min it can't get there before 07:10
+    assert result["D"] == INF
+
+
+def test_raptor_one_to_all():
+    stops_dict, routes = _pruning_network()
+
+    arrivals = raptor.raptor_one_to_all(stops_dict, routes, [], {"S": 0}, 415, 3)
+
+    # no target to prune against: every stop gets its earliest arrival
+    full, _ = raptor_algo(stops_dict, routes, [], "S", "T", 415, 3)
+    assert arrivals == full
+    assert arrivals["X"] == 460
+
+    # the access walk delays the departure from the stop
+    arrivals = raptor.raptor_one_to_all(stops_dict, routes, [], {"S": 10}, 415, 3)
+    assert arrivals["S"] == 425
+    assert arrivals["T"] == INF and arrivals["X"] == INF
+
+
+def test_predecessor_layers_allocated_per_round():
+    from algorithm_prototype.timetable import build_timetable
+
+    stops_dict, routes = _pruning_network()
+    timetable = build_timetable(stops_dict, routes, [])
+    s, t, d = (timetable.stop_index[x] for x in "STD")
+
+    _, layers, improved_round = raptor._raptor_single(
+        timetable, {s: 415}, {t: 0}, 5, False, True, False
+    )
+
+    # round 1 reaches T and D, round 2 finds nothing new and ends the search
+    assert [arrays is not None for arrays in layers.rounds] == [
+        False,
+        True,
+        True,
+        False,
+        False,
+        False,
+    ]
+    assert improved_round[t] == improved_round[d] == 1
+    assert layers[1][t] == {
+        "prev_idx": s,
+        "arrival_time": 430,
+        "mode": "trip",
+        "route_id": "R1",
+        "trip_id": "T1",
+        "transfer_time": None,
+        "board_pos": 0,
+        "disembark_pos": 1,
+        "round": 1,
+        "prev_round": 0,
+    }
+    assert layers[2][t] is None and layers[4][t] is None
+    assert layers[1][s] is None
+
+
+def test_raptor_numpy_route_scan_matches_python():
+    pytest.importorskip("numpy")
+    from algorithm_prototype.raptor_numpy import build_route_matrices
+    from algorithm_prototype.timetable import build_timetable
+
+    stops_dict = make_stops(["S", "A", "B", "C", "D", "E"])
+    s, a, b, c, d, e = (stops_dict[x] for x in "SABCDE")
+    r1 = Route("R1", [s, a, b, c], [])
+    for dep in range(420, 500, 15):
+        r1.add_trip(Trip(f"T1_{dep}", [dep, dep + 6, dep + 14, dep + 25]))
+    r2 = Route("R2", [b, d, e], [])
+    for dep in range(430, 520, 20):
+        r2.add_trip(Trip(f"T2_{dep}", [dep, INF, dep + 18]))
+        r2.add_trip(Trip(f"T2x_{dep}", [dep + 5, dep + 9, dep + 30]))
+    r3 = Route("R3", [a, d], [])
+    r3.add_trip(Trip("T3", [440, 470]))
+    routes = {r.id: r for r in [r1, r2, r3]}
+    transfers = [Transfer(c, e, 4), Transfer(a, b, 3)]
+    timetable = build_timetable(stops_dict, routes, transfers)
+    # convert every route, however small
+    matrices = build_route_matrices(timetable, min_cells=0)
+
+    for dep in range(415, 480, 7):
+        expected = raptor.raptor_one_to_all(
+            stops_dict, routes, transfers, {"S": 0}, dep, 4, timetable=timetable
+        )
+        arrivals = raptor.raptor_one_to_all(
+            stops_dict,
+            routes,
+            transfers,
+            {"S": 0},
+            dep,
+            4,
+            timetable=timetable,
+            route_matrices=matrices,
+        )
+        assert arrivals == expected
+        expected = raptor_algo(
+            stops_dict, routes, transfers, "S", "E", dep, 4, timetable=timetable
+        )
+        assert (
+            raptor_algo(
+                stops_dict,
+                routes,
+                transfers,
+                "S",
+                "E",
+                dep,
+                4,
+                timetable=timetable,
+                route_matrices=matrices,
+            )
+            == expected
+        )
+
+
+def test_raptor_range_profile():
+    """
+    R1 runs S -> C every 20 mins (30 min ride), R2 is an express at 07:25 (10 min
+    ride). Leaving at 07:20 is dominated by waiting for the express.
+    """
+    s = Stop("S", 2, -33.90, 18.40)
+    c = Stop("C", 2, -33.93, 18.43)
+    stops_dict = {"S": s, "C": c}
+    r1 = Route("R1", [s, c], [])
+    for dep in [420, 440, 460]:
+        r1.add_trip(Trip(f"T1_{dep}", [dep, dep + 30]))
+    r2 = Route("R2", [s, c], [])
+    r2.add_trip(Trip("E", [445, 455]))
+    routes = {"R1": r1, "R2": r2}
+
+    profile = raptor_range(stops_dict, routes, [], "S", "C", 415, 470, 3)
+
+    assert [(j["departure_time"], j["arrival_time"]) for j in profile] == [
+        (420, 450),
+        (445, 455),
+        (460, 490),
+    ]
+    for journey in profile:
+        # same journey as a single query at that departure
+        result, path = raptor_algo(
+            stops_dict, routes, [], "S", "C", journey["departure_time"], 3
+        )
+        assert result["C"] == journey["arrival_time"]
+        assert path == journey["path"]
+
+    # window excludes the 07:00 departure
+    profile = raptor_range(stops_dict, routes, [], "S", "C", 430, 470, 3)
+    assert [j["departure_time"] for j in profile] == [445, 460]
+
+
+def test_raptor_pareto_trips_vs_arrival():
+    """
+    Direct S -> T arrives 08:10, changing at A arrives 07:50, changing at A and B
+    arrives 07:40 - one run gives all three options.
+    """
+    s = Stop("S", 2, -33.90, 18.40)
+    a = Stop("A", 2, -33.91, 18.41)
+    b = Stop("B", 2, -33.92, 18.42)
+    t = Stop("T", 2, -33.93, 18.43)
+    stops_dict = {x.id: x for x in [s, a, b, t]}
+    r1 = Route("R1", [s, a], [])
+    r1.add_trip(Trip("T1", [420, 430]))
+    r2 = Route("R2", [a, t], [])
+    r2.add_trip(Trip("T2", [435, 470]))
+    r3 = Route("R3", [a, b], [])
+    r3.add_trip(Trip("T3", [432, 440]))
+    r4 = Route("R4", [b, t], [])
+    r4.add_trip(Trip("T4", [445, 460]))
+    r5 = Route("R5", [s, t], [])
+    r5.add_trip(Trip("T5", [420, 490]))
+    routes = {r.id: r for r in [r1, r2, r3, r4, r5]}
+
+    result, journeys = raptor_pareto(stops_dict, routes, [], "S", "T", 415, 5)
+
+    assert [(j["trips"], j["arrival_time"]) for j in journeys] == [
+        (1, 490),
+        (2, 470),
+        (3, 460),
+    ]
+    assert [st["trip_id"] for st in journeys[1]["path"][1:]] == ["T1", "T2"]
+    assert all(j["walking_time"] == 0 for j in journeys)
+    # the fastest option is what raptor_algo returns
+    fastest_result, fastest_path = raptor_algo(stops_dict, routes, [], "S", "T", 415, 5)
+    assert result == fastest_result
+    assert journeys[-1]["path"] == fastest_path
+
+
+def test_raptor_multi_sources_and_targets():
+    """
+    Near the origin: S1 (1 min walk) and S2 (6 min walk), near the destination:
+    T1 (2 min walk) and T2 (8 min walk). R1 S1 -> T1 arrives 08:00, R2 S2 -> T2
+    arrives 07:40, R3 S1 -> T2 arrives 07:45.
+    """
+    s1 = Stop("S1", 2, -33.900, 18.400)
+    s2 = Stop("S2", 2, -33.901, 18.401)
+    t1 = Stop("T1", 2, -33.930, 18.430)
+    t2 = Stop("T2", 2, -33.931, 18.431)
+    stops_dict = {x.id: x for x in [s1, s2, t1, t2]}
+    r1 = Route("R1", [s1, t1], [])
+    r1.add_trip(Trip("T_R1", [425, 480]))
+    r2 = Route("R2", [s2, t2], [])
+    r2.add_trip(Trip("T_R2", [430, 460]))
+    r3 = Route("R3", [s1, t2], [])
+    r3.add_trip(Trip("T_R3", [425, 465]))
+    routes = {r.id: r for r in [r1, r2, r3]}
+    sources = {"S1": 1, "S2": 6}
+    targets = {"T1": 2, "T2": 8}
+
+    result, journeys = raptor.raptor_multi(
+        stops_dict, routes, [], sources, targets, 420, 3
+    )
+
+    # S2 -> T2 is the fastest door to door (07:40 + 8 min walk)
+    assert [(j["source_id"], j["target_id"], j["arrival_time"]) for j in journeys] == [
+        ("S2", "T2", 468)
+    ]
+    assert journeys[0]["walking_time"] == 6 + 8
+    assert journeys[0]["path"][0] == {
+        "stop_id": "S2",
+        "arrival_time": 426,
+        "mode": "start",
+        "route_id": None,
+        "trip_id": None,
+        "transfer_time": None,
+        "from_stop_id": None,
+    }
+    assert result["S1"] == 421 and result["T1"] == 480
+    # same as the best of one query per (source, target) pair
+    pairs = [
+        raptor_algo(stops_dict, routes, [], s, t, 420 + access, 3)[0][t] + egress
+        for s, access in sources.items()
+        for t, egress in targets.items()
+    ]
+    assert min(pairs) == 468
+
+    # a long walk from T2 makes the slower R1 the better option
+    _, journeys = raptor.raptor_multi(
+        stops_dict, routes, [], sources, {"T1": 2, "T2": 25}, 420, 3
+    )
+    assert [(j["target_id"], j["arrival_time"]) for j in journeys] == [("T1", 482)]
+
+    with pytest.raises(ValueError):
+        raptor.raptor_multi(stops_dict, routes, [], {"X": 0}, targets, 420, 3)
+
+
 def test_safe_set_predecessor_detects_2cycle_in_debug():
     # Build a small predecessor layer and force a 2-cycle
     predecessor = [None] * 5
@@ -798,8 +1130,8 @@ def test_gtfs_reader_raptor_reconstruct_objs(minimal_gtfs: str, tmp_path: Path):
     route = reader.routes["ga_1-0"]
     # canonical sequence should match trip (2 occurrences)
     assert [s.id for s in route.stops] == ["GABS001", "GABS006"]
-    # at least one expanded trip (svc1 on Monday -> _day0)
-    assert any(t.id.startswith("ga_29_day0") for t in route.trips)
+    # the trip is stored once, running on Mondays (svc1 -> bit 0)
+    assert [(t.id, t.service_days) for t in route.trips] == [("ga_29", 1)]
 
     # 2) Build transfers map (empty is fine; no walking needed)
     transfers = []  # no transfers needed for this simple test
@@ -1071,6 +1403,210 @@ def test_week_wrap_formatting_and_raptor(tmp_path: Path):
     assert GTFSReader.mins_to_str(seven_days_plus) == "Mon 01:02"
 
 
+def test_gtfs_reader_splits_routes_into_fifo_patterns(tmp_path: Path):
+    """
+    One GTFS route with a short turn (S1-S2), a trip skipping S2 (N/A) and an
+    express overtaking the regular trip: each becomes its own dense, FIFO route.
+    """
+    from algorithm_prototype.timetable import build_timetable
+
+    gtfs_root = tmp_path / "gtfs_patterns"
+    _write_csv(
+        gtfs_root / "stops.txt",
+        ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+        [
+            ["S1", "Stop 1", "-33.90", "18.62"],
+            ["S2", "Stop 2", "-33.91", "18.57"],
+            ["S3", "Stop 3", "-33.92", "18.52"],
+        ],
+    )
+    _write_csv(
+        gtfs_root / "routes.txt",
+        ["route_id", "agency_id", "route_short_name"],
+        [["ga_1-0", "GABS", "1"]],
+    )
+    _write_csv(
+        gtfs_root / "trips.txt",
+        [
+            "route_id",
+            "service_id",
+            "trip_id",
+            "trip_headsign",
+            "direction_id",
+            "block_id",
+            "shape_id",
+        ],
+        [
+            ["ga_1-0", "svc1", trip_id, "Test", "0", "", ""]
+            for trip_id in ("regular", "short", "express", "skip")
+        ],
+    )
+    _write_csv(
+        gtfs_root / "stop_times.txt",
+        ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"],
+        [
+            ["regular", "08:00:00", "08:00:00", "S1", "1"],
+            ["regular", "08:10:00", "08:10:00", "S2", "2"],
+            ["regular", "08:20:00", "08:20:00", "S3", "3"],
+            ["short", "08:05:00", "08:05:00", "S1", "1"],
+            ["short", "08:15:00", "08:15:00", "S2", "2"],
+            # leaves after the regular trip, arrives before it
+            ["express", "08:02:00", "08:02:00", "S1", "1"],
+            ["express", "08:06:00", "08:06:00", "S2", "2"],
+            ["express", "08:12:00", "08:12:00", "S3", "3"],
+            ["skip", "09:00:00", "09:00:00", "S1", "1"],
+            ["skip", "N/A", "N/A", "S2", "2"],
+            ["skip", "09:20:00", "09:20:00", "S3", "3"],
+        ],
+    )
+    _write_csv(
+        gtfs_root / "calendar.txt",
+        [
+            "service_id",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+            "sunday",
+        ],
+        [["svc1", "1", "0", "0", "0", "0", "0", "0"]],
+    )
+
+    reader = GTFSReader(gtfs_folder=str(gtfs_root) + "/")
+    patterns = {
+        route_id: ([s.id for s in route.stops], [t.id for t in route.trips])
+        for route_id, route in reader.routes.items()
+    }
+    assert patterns == {
+        "ga_1-0_p0": (["S1", "S2", "S3"], ["regular"]),
+        "ga_1-0_p1": (["S1", "S2", "S3"], ["express"]),
+        "ga_1-0_p2": (["S1", "S2"], ["short"]),
+        "ga_1-0_p3": (["S1", "S3"], ["skip"]),
+    }
+    assert all(r.name == "1" for r in reader.routes.values())
+    assert build_timetable(reader.stops, reader.routes, []).fifo
+
+    # the express is found although it leaves after the regular trip
+    result, path = raptor_algo(
+        stops=reader.stops,
+        routes=reader.routes,
+        transfers=[],
+        source_id="S1",
+        target_id="S3",
+        departure_time=8 * 60,
+        max_rounds=2,
+    )
+    assert result["S3"] == 8 * 60 + 12
+    assert path[-1]["route_id"] == "ga_1-0_p1"
+
+
+def test_gtfs_reader_routes_on_service_date(tmp_path: Path):
+    """
+    calendar.txt start/end dates and calendar_dates.txt exceptions: the regular
+    Monday service is removed on a holiday, a holiday service only runs on the
+    dates it is added on.
+    """
+    from datetime import date
+
+    from algorithm_prototype.timetable import DAY_MINS, build_timetable
+
+    gtfs_root = tmp_path / "gtfs_dates"
+    _write_csv(
+        gtfs_root / "stops.txt",
+        ["stop_id", "stop_name", "stop_lat", "stop_lon"],
+        [["S1", "Stop 1", "-33.90", "18.62"], ["S2", "Stop 2", "-33.91", "18.57"]],
+    )
+    _write_csv(
+        gtfs_root / "routes.txt",
+        ["route_id", "agency_id", "route_short_name"],
+        [["ga_1-0", "GABS", "1"]],
+    )
+    _write_csv(
+        gtfs_root / "trips.txt",
+        [
+            "route_id",
+            "service_id",
+            "trip_id",
+            "trip_headsign",
+            "direction_id",
+            "block_id",
+            "shape_id",
+        ],
+        [
+            ["ga_1-0", "weekday", "regular", "Test", "0", "", ""],
+            ["ga_1-0", "holiday", "holiday", "Test", "0", "", ""],
+        ],
+    )
+    _write_csv(
+        gtfs_root / "stop_times.txt",
+        ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"],
+        [
+            ["regular", "08:00:00", "08:00:00", "S1", "1"],
+            ["regular", "08:10:00", "08:10:00", "S2", "2"],
+            ["holiday", "10:00:00", "10:00:00", "S1", "1"],
+            ["holiday", "10:10:00", "10:10:00", "S2", "2"],
+        ],
+    )
+    _write_csv(
+        gtfs_root / "calendar.txt",
+        [
+            "service_id",
+            "monday",
+            "tuesday",
+            "wednesday",
+            "thursday",
+            "friday",
+            "saturday",
+            "sunday",
+            "start_date",
+            "end_date",
+        ],
+        [["weekday", "1", "0", "0", "0", "0", "0", "0", "20240101", "20241231"]],
+    )
+    _write_csv(
+        gtfs_root / "calendar_dates.txt",
+        ["service_id", "date", "exception_type"],
+        [["weekday", "20240101", "2"], ["holiday", "20240101", "1"]],
+    )
+
+    reader = GTFSReader(gtfs_folder=str(gtfs_root) + "/")
+    # the weekly timetable has no dates: only the regular trip
+    assert [t.id for t in reader.routes["ga_1-0"].trips] == ["regular"]
+
+    def trips_on(day: date):
+        return [
+            (t.id, t.departure_times)
+            for route in reader.routes_on(day).values()
+            for t in route.trips
+        ]
+
+    # Monday 1 January 2024 (holiday), Monday 8 January, Monday after end_date
+    assert trips_on(date(2024, 1, 1)) == [("holiday_20240101", [600, 610])]
+    assert trips_on(date(2024, 1, 8)) == [("regular_20240108", [480, 490])]
+    assert trips_on(date(2025, 1, 6)) == []
+    assert trips_on(date(2024, 1, 9)) == []
+    # Sunday's timetable has the runs of the Monday after (times in its week)
+    assert trips_on(date(2024, 1, 7)) == [
+        ("regular_20240108", [DAY_MINS * 7 + 480, DAY_MINS * 7 + 490])
+    ]
+
+    routes = reader.routes_on(date(2024, 1, 1))
+    result, path = raptor_algo(
+        stops=reader.stops,
+        routes=routes,
+        transfers=[],
+        source_id="S1",
+        target_id="S2",
+        departure_time=7 * 60,
+        max_rounds=2,
+        timetable=build_timetable(reader.stops, routes, []),
+    )
+    assert result["S2"] == 610
+    assert path[-1]["trip_id"] == "holiday_20240101"
+
+
 def hm(s: str) -> int:
     """Convert 'HH:MM' to minutes since midnight."""
     h, m = map(int, s.split(":"))
@@ -1294,3 +1830,107 @@ def _any_route_can_cover_after(
                     if a != INF and b != INF and b >= a and a >= late_departure:
                         return True
     return False
+
+
+"""
+-------------------------------------------------------------
+    PARITY OF THE COMPILED RAPTOR CORE (raptor_numba)
+-------------------------------------------------------------
+"""
+
+
+def _with_compiled_parity(func):
+    """Wrap a RAPTOR entry point: run it as given on the Python rounds, then
+    again on the compiled kernel (debug off) and check both give the same
+    result."""
+    import inspect
+    from unittest import mock
+
+    from algorithm_prototype.raptor_numba import build_timetable_arrays
+    from algorithm_prototype.timetable import build_timetable
+
+    signature = inspect.signature(func)
+
+    def run_both(*args, **kwargs):
+        with mock.patch.object(raptor, "HAS_NUMBA", False):
+            expected = func(*args, **kwargs)
+        call = signature.bind(*args, **kwargs)
+        timetable = call.arguments.get("timetable") or build_timetable(
+            call.arguments["stops"],
+            call.arguments["routes"],
+            call.arguments["transfers"],
+        )
+        call.arguments.update(
+            debug=False,
+            timetable=timetable,
+            timetable_arrays=build_timetable_arrays(timetable),
+        )
+        assert func(*call.args, **call.kwargs) == expected
+        return expected
+
+    return run_both
+
+
+@pytest.mark.parametrize(
+    "scenario",
+    [
+        test_raptor_hops_to_earlier_trip_along_route,
+        test_raptor_target_pruning,
+        test_raptor_lower_bound_pruning,
+        test_raptor_one_to_all,
+        test_raptor_numpy_route_scan_matches_python,
+        test_raptor_pareto_trips_vs_arrival,
+        test_raptor_multi_sources_and_targets,
+        test_minimal_raptor_direct_trip_sets_board_and_disembark,
+        test_simple_route,
+        test_route_with_simple_transfer,
+        test_transfer_time_edge_case,
+        test_multiple_competing_routes,
+        test_simple_path_reconstruction,
+        test_full_path_reconstruction_with_transfer,
+        test_path_object_creation_with_transfer_object,
+        test_raptor_chooses_earliest_arrival_among_trips,
+        test_raptor_cannot_board_if_after_departure_at_source,
+    ],
+)
+def test_compiled_raptor_core_matches_python(scenario, monkeypatch):
+    """Re-run the scenarios above with every RAPTOR query also run on the
+    compiled core (plain Python when Numba is not installed)."""
+    pytest.importorskip("numpy")
+    for name in ("raptor_algo", "raptor_pareto"):
+        monkeypatch.setitem(
+            globals(), name, _with_compiled_parity(getattr(raptor, name))
+        )
+    for name in ("raptor_multi", "raptor_one_to_all"):
+        monkeypatch.setattr(raptor, name, _with_compiled_parity(getattr(raptor, name)))
+
+    scenario()
+
+
+def test_compiled_arrays_built_once_per_timetable(monkeypatch):
+    pytest.importorskip("numpy")
+    from algorithm_prototype import raptor_numba
+    from algorithm_prototype.timetable import build_timetable
+
+    stops_dict, routes = _pruning_network()
+    timetable = build_timetable(stops_dict, routes, [])
+    built = []
+    build = raptor_numba.build_timetable_arrays
+    monkeypatch.setattr(
+        raptor_numba,
+        "build_timetable_arrays",
+        lambda tt: built.append(tt) or build(tt),
+    )
+    monkeypatch.setattr(raptor, "HAS_NUMBA", True)
+    for _ in range(3):
+        result, _ = raptor_algo(
+            stops_dict, routes, [], "S", "T", 415, 3, timetable=timetable
+        )
+        assert result["T"] == 430
+    assert built == [timetable]
+    # another timetable gets arrays of its own
+    other = build_timetable(stops_dict, routes, [])
+    assert raptor_numba.cached_timetable_arrays(other) is not (
+        raptor_numba.cached_timetable_arrays(timetable)
+    )
+    assert built == [timetable, other]
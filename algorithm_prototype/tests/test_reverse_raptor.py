@@ -0,0 +1,143 @@
+from algorithm_prototype.raptor import Stop, Route, Trip, Transfer, raptor_algo
+from algorithm_prototype.reverse_raptor import (
+    NEG_INF,
+    reverse_raptor_algo,
+    reverse_raptor_multi,
+)
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR REVERSE RAPTOR (ARRIVE-BY)
+-------------------------------------------------------------
+"""
+
+
+def _arrive_by_network():
+    """
+    S -> T:
+        - R1 to A (every 20 mins), walk 5 mins to B, R2 to T at 08:00
+        - R3 direct, arriving 07:40 and 08:10
+    """
+    s = Stop("S", 2, -33.90, 18.40)
+    a = Stop("A", 2, -33.91, 18.41)
+    b = Stop("B", 2, -33.912, 18.412)
+    t = Stop("T", 2, -33.93, 18.43)
+    stops = {x.id: x for x in [s, a, b, t]}
+    r1 = Route("R1", [s, a], [])
+    for dep in [420, 440, 460]:
+        r1.add_trip(Trip(f"T1_{dep}", [dep, dep + 10]))
+    r2 = Route("R2", [b, t], [])
+    r2.add_trip(Trip("T2", [465, 480]))
+    r3 = Route("R3", [s, t], [])
+    r3.add_trip(Trip("T3_early", [430, 460]))
+    r3.add_trip(Trip("T3_late", [450, 490]))
+    routes = {r.id: r for r in [r1, r2, r3]}
+    transfers = [Transfer(a, b, 5)]
+    return stops, routes, transfers
+
+
+def test_reverse_raptor_latest_departure():
+    stops, routes, transfers = _arrive_by_network()
+
+    result, path = reverse_raptor_algo(stops, routes, transfers, "S", "T", 485, 4)
+
+    # R1 at 07:40 + walk + R2 beats the direct trip leaving 07:10
+    assert result["S"] == 440
+    assert result["B"] == 465
+    assert [(st["stop_id"], st["mode"], st["arrival_time"]) for st in path] == [
+        ("S", "start", 440),
+        ("A", "trip", 450),
+        ("B", "transfer", 465),
+        ("T", "trip", 480),
+    ]
+    assert path[1]["trip_id"] == "T1_440" and path[3]["trip_id"] == "T2"
+    assert [st.get("round") for st in path] == [None, 1, 1, 2]
+    # leaving at that time forward RAPTOR gets there in time
+    forward, _ = raptor_algo(stops, routes, transfers, "S", "T", 440, 4)
+    assert forward["T"] <= 485
+
+    # one trip only: the direct service
+    result, path = reverse_raptor_algo(stops, routes, transfers, "S", "T", 485, 1)
+    assert result["S"] == 430
+    assert [st["trip_id"] for st in path] == [None, "T3_early"]
+
+    # later deadline: the later direct trip
+    result, _ = reverse_raptor_algo(stops, routes, transfers, "S", "T", 495, 4)
+    assert result["S"] == 450
+
+
+def test_reverse_raptor_deadline_too_early():
+    stops, routes, transfers = _arrive_by_network()
+
+    result, path = reverse_raptor_algo(stops, routes, transfers, "S", "T", 450, 4)
+
+    assert result["S"] == NEG_INF
+    assert result["T"] == 450
+    assert path == []
+
+
+def test_reverse_raptor_multi_sources_and_targets():
+    stops, routes, transfers = _arrive_by_network()
+    # S and A near the origin, T and B near the destination
+    sources = {"S": 1, "A": 4}
+    targets = {"T": 2, "B": 6}
+
+    result, path = reverse_raptor_multi(stops, routes, transfers, sources, targets, 485)
+    # R1 at 07:40 to A and the walk to B beat R2 to T, A is passed on the way
+    assert [(st["stop_id"], st["mode"]) for st in path] == [
+        ("S", "start"),
+        ("A", "trip"),
+        ("B", "transfer"),
+    ]
+    assert path[0]["arrival_time"] == result["S"] == 460
+    # A's label walks to B, journeys from A would have to take a trip
+    assert result["A"] == 485 - 6 - 5
+
+    # the latest departure from the origin of one query per (source, target) pair
+    for deadline in range(450, 500, 5):
+        result, path = reverse_raptor_multi(
+            stops, routes, transfers, sources, targets, deadline
+        )
+        pairs = [
+            reverse_raptor_algo(stops, routes, transfers, s, t, deadline - egress)[0][s]
+            - access
+            for s, access in sources.items()
+            for t, egress in targets.items()
+            if s != t
+        ]
+        latest = max(t for t in pairs if t > NEG_INF // 2) if path else None
+        assert (
+            path[0]["arrival_time"] - sources[path[0]["stop_id"]] if path else None
+        ) == latest
+        if path:
+            assert path[-1]["stop_id"] in targets
+            assert path[-1]["arrival_time"] + targets[path[-1]["stop_id"]] <= deadline
+
+
+def test_reverse_raptor_reuses_a_clean_workspace():
+    from algorithm_prototype.predecessors import NONE
+    from algorithm_prototype.timetable import build_timetable
+    from algorithm_prototype.workspace import query_workspace
+
+    stops, routes, transfers = _arrive_by_network()
+    tt = build_timetable(stops, routes, transfers)
+    with query_workspace(tt, unreached=NEG_INF) as workspace:
+        pass
+
+    runs = [
+        reverse_raptor_algo(stops, routes, transfers, "S", "T", t, 4, timetable=tt)
+        for t in (485, 450, 495, 485)
+    ]
+    assert [result["S"] for result, _ in runs] == [440, NEG_INF, 450, 440]
+    assert runs[3] == runs[0]
+
+    # handed back with every array unreached again, forward queries get their own
+    with query_workspace(tt, unreached=NEG_INF) as again:
+        assert again is workspace
+        assert all(t == NEG_INF for t in again.best + again.prev + again.cur)
+        assert not any(again.marked)
+        assert all(k == -1 for k in again.improved_round)
+        for arrays in again.layers:
+            assert arrays is None or all(s == NONE for s in arrays[0])
+    with query_workspace(tt) as forward:
+        assert forward is not workspace
@@ -0,0 +1,267 @@
+import pytest
+
+from algorithm_prototype.raptor import Stop, Route, Trip, Transfer, INF, raptor_algo
+from algorithm_prototype.timetable import (
+    DAY_MINS,
+    MIN_TRANSFER_TIME,
+    build_timetable,
+    day_offsets,
+    validate_timetable,
+)
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR COMPILED TIMETABLE
+-------------------------------------------------------------
+"""
+
+
+def _loop_network():
+    a = Stop("A", 2, -33.918, 18.423)
+    b = Stop("B", 2, -33.935, 18.413)
+    c = Stop("C", 2, -34.05, 18.35)
+    stops = {"A": a, "B": b, "C": c}
+    # R2 visits A twice (loop route)
+    r1 = Route("R1", [a, b], [])
+    r1.add_trip(Trip("T1", [420, 430]))
+    r2 = Route("R2", [b, a, c, a], [])
+    r2.add_trip(Trip("T3", [460, 465, 470, INF]))
+    r2.add_trip(Trip("T2", [440, 445, 450, 455]))
+    routes = {"R1": r1, "R2": r2}
+    transfers = [Transfer(a, b, 3), Transfer(c, a, 4), Transfer(a, c, 2)]
+    return stops, routes, transfers
+
+
+def _served_by(tt, stop_id):
+    s = tt.stop_index[stop_id]
+    lo, hi = tt.stop_route_offsets[s], tt.stop_route_offsets[s + 1]
+    return [
+        (tt.route_ids[tt.stop_routes[j]], tt.stop_route_positions[j])
+        for j in range(lo, hi)
+    ]
+
+
+def test_timetable_routes_and_stop_route_index():
+    stops, routes, transfers = _loop_network()
+    tt = build_timetable(stops, routes, transfers)
+
+    assert tt.num_stops == 3 and tt.num_routes == 2
+    r2 = tt.route_index["R2"]
+    lo, hi = tt.route_stop_offsets[r2], tt.route_stop_offsets[r2 + 1]
+    assert [tt.stop_ids[s] for s in tt.route_stops[lo:hi]] == ["B", "A", "C", "A"]
+
+    # every position of a stop is kept, also for loops
+    assert _served_by(tt, "A") == [("R1", 0), ("R2", 1), ("R2", 3)]
+    assert _served_by(tt, "B") == [("R1", 1), ("R2", 0)]
+    assert _served_by(tt, "C") == [("R2", 2)]
+
+
+def test_timetable_stop_times_and_slot_departures():
+    stops, routes, transfers = _loop_network()
+    tt = build_timetable(stops, routes, transfers)
+
+    r2 = tt.route_index["R2"]
+    first_trip = tt.route_trip_offsets[r2]
+    assert tt.trip_ids[first_trip : tt.route_trip_offsets[r2 + 1]] == ("T3", "T2")
+    t3 = first_trip
+    base = tt.trip_time_offsets[t3]
+    assert tt.stop_times[base : base + 4] == (460, 465, 470, INF)
+
+    # departures per route-stop slot are sorted, INF left out
+    slot = tt.route_stop_offsets[r2]
+    assert list(tt.slot_departures[slot]) == [440, 460]
+    assert [tt.trip_ids[t] for t in tt.slot_trips[slot]] == ["T2", "T3"]
+    assert list(tt.slot_departures[slot + 3]) == [455]
+
+
+def test_timetable_slot_trips_point_into_stop_times():
+    stops, routes, transfers = _loop_network()
+    tt = build_timetable(stops, routes, transfers)
+
+    # every slot holds the finite times of its route's trips, each with its trip
+    for r in range(tt.num_routes):
+        lo, hi = tt.route_stop_offsets[r], tt.route_stop_offsets[r + 1]
+        trips = range(tt.route_trip_offsets[r], tt.route_trip_offsets[r + 1])
+        for p, slot in enumerate(range(lo, hi)):
+            times = [tt.stop_times[tt.trip_time_offsets[t] + p] for t in trips]
+            assert list(tt.slot_departures[slot]) == sorted(
+                x for x in times if x != INF
+            )
+            assert [
+                tt.stop_times[tt.trip_time_offsets[t] + p] for t in tt.slot_trips[slot]
+            ] == list(tt.slot_departures[slot])
+
+    # a trip added to a route is in the next timetable built
+    routes["R2"].add_trip(Trip("T0", [400, 405, 410, 415]))
+    tt2 = build_timetable(stops, routes, transfers)
+    slot = tt2.route_stop_offsets[tt2.route_index["R2"]] + 1
+    assert list(tt2.slot_departures[slot]) == [405, 445, 465]
+    assert tt2.trip_ids[tt2.slot_trips[slot][0]] == "T0"
+    result, _ = raptor_algo(stops, routes, transfers, "A", "C", 400, timetable=tt2)
+    assert result["C"] == 410
+
+
+def test_timetable_transfers_csr_and_with_transfers():
+    stops, routes, transfers = _loop_network()
+    tt = build_timetable(stops, routes, transfers)
+
+    a = tt.stop_index["A"]
+    lo, hi = tt.transfer_offsets[a], tt.transfer_offsets[a + 1]
+    walks = {
+        (tt.stop_ids[tt.transfer_targets[j]], tt.transfer_times[j])
+        for j in range(lo, hi)
+    }
+    assert walks == {("B", 3), ("C", 2)}
+    # incoming footpaths of A
+    lo, hi = tt.transfer_in_offsets[a], tt.transfer_in_offsets[a + 1]
+    assert [
+        (tt.stop_ids[tt.transfer_in_sources[j]], tt.transfer_in_times[j])
+        for j in range(lo, hi)
+    ] == [("C", 4)]
+
+    # swapping footpaths keeps the route/trip arrays
+    tt2 = tt.with_transfers([transfers[0]])
+    assert tt2.stop_times is tt.stop_times
+    assert tt2.transfer_targets == (tt.stop_index["B"],)
+    assert tt.transfer_targets != tt2.transfer_targets
+    assert tt2.transfer_in_sources == (a,)
+
+
+def test_timetable_transfers_nearest_first():
+    stops, routes, transfers = _loop_network()
+    a, b, c = stops["A"], stops["B"], stops["C"]
+    # given distances are kept, the others are the straight line
+    tt = build_timetable(
+        stops, routes, [Transfer(a, c, 2, 900.0), Transfer(a, b, 3, 1200.0)]
+    )
+    i = tt.stop_index["A"]
+    lo, hi = tt.transfer_offsets[i], tt.transfer_offsets[i + 1]
+    assert [tt.stop_ids[tt.transfer_targets[j]] for j in range(lo, hi)] == ["C", "B"]
+    assert tt.transfer_distances == (900.0, 1200.0)
+
+    tt = build_timetable(stops, routes, [Transfer(a, c, 2), Transfer(a, b, 3)])
+    assert tt.transfer_targets == (tt.stop_index["B"], tt.stop_index["C"])
+    assert tt.transfer_distances[0] == pytest.approx(tt.distance(i, tt.stop_index["B"]))
+    assert tt.transfer_in_distances == tuple(sorted(tt.transfer_distances))
+
+
+def test_timetable_with_footpaths_of_another():
+    stops, routes, transfers = _loop_network()
+    weekly = build_timetable(stops, routes, transfers)
+    # fewer trips, same footpaths
+    del routes["R1"]
+    tt = build_timetable(stops, routes, []).with_footpaths_of(weekly)
+    assert tt.route_ids == ("R2",)
+    assert tt.transfer_targets is weekly.transfer_targets
+    assert tt.transfer_in_distances is weekly.transfer_in_distances
+    assert tt.max_walk_speed == weekly.max_walk_speed
+    assert not tt.validated
+
+    other = build_timetable({"A": stops["A"]}, {}, [])
+    with pytest.raises(ValueError):
+        tt.with_footpaths_of(other)
+
+
+def test_timetable_transfer_walks_have_minimum():
+    stops, routes, transfers = _loop_network()
+    # a footpath of 0 minutes is still charged MIN_TRANSFER_TIME
+    tt = build_timetable(
+        stops, routes, transfers + [Transfer(stops["B"], stops["C"], 0)]
+    )
+
+    assert tt.transfer_times == (3, 2, 0, 4)
+    assert tt.transfer_walks == (3, 2, MIN_TRANSFER_TIME, 4)
+    b = tt.stop_index["B"]
+    c = tt.stop_index["C"]
+    lo, hi = tt.transfer_in_offsets[c], tt.transfer_in_offsets[c + 1]
+    # nearest first: B is closer to C than A is
+    assert [
+        (tt.transfer_in_sources[j], tt.transfer_in_walks[j]) for j in range(lo, hi)
+    ] == [(b, MIN_TRANSFER_TIME), (tt.stop_index["A"], 2)]
+
+
+def test_raptor_with_prebuilt_timetable_matches_per_query_build():
+    stops, routes, transfers = _loop_network()
+    tt = build_timetable(stops, routes, transfers)
+
+    with_tt = raptor_algo(stops, routes, transfers, "A", "C", 415, 3, timetable=tt)
+    without_tt = raptor_algo(stops, routes, transfers, "A", "C", 415, 3)
+    assert with_tt == without_tt
+    # board R2 at A (T2 departs 07:25), arrive C 07:30
+    assert with_tt[0]["C"] == 450
+
+
+def test_validate_timetable_marks_timetable_validated():
+    stops, routes, transfers = _loop_network()
+    tt = build_timetable(stops, routes, transfers)
+    assert not tt.validated
+
+    checked = validate_timetable(tt)
+    assert checked.validated
+    assert checked.stop_times is tt.stop_times
+    # new footpaths have not been checked
+    assert not checked.with_transfers(transfers[:1]).validated
+
+
+def test_validate_timetable_rejects_bad_trips_and_transfers():
+    stops, routes, transfers = _loop_network()
+    routes["R1"].add_trip(Trip("T_back", [430, 425]))
+    with pytest.raises(ValueError, match="T_back"):
+        validate_timetable(build_timetable(stops, routes, transfers))
+
+    stops, routes, transfers = _loop_network()
+    transfers.append(Transfer(stops["B"], stops["B"], 1))
+    with pytest.raises(ValueError, match="Transfer loop detected at stop B"):
+        validate_timetable(build_timetable(stops, routes, transfers))
+
+
+def test_debug_mode_validates_unchecked_timetable():
+    stops, routes, transfers = _loop_network()
+    routes["R1"].add_trip(Trip("T_back", [430, 425]))
+    tt = build_timetable(stops, routes, transfers)
+
+    # queries don't check by default ...
+    raptor_algo(stops, routes, transfers, "A", "C", 415, 3, timetable=tt)
+    # ... trace mode does
+    with pytest.raises(ValueError, match="T_back"):
+        raptor_algo(
+            stops, routes, transfers, "A", "C", 415, 3, timetable=tt, debug=True
+        )
+
+
+def test_timetable_fifo_flag():
+    stops, routes, transfers = _loop_network()
+    # T3 doesn't serve the last stop (INF)
+    assert not build_timetable(stops, routes, transfers).fifo
+
+    a, b = stops["A"], stops["B"]
+    route = Route("R", [a, b], [])
+    route.add_trip(Trip("T1", [420, 430]))
+    route.add_trip(Trip("T2", [425, 440]))
+    assert build_timetable(stops, {"R": route}, transfers).fifo
+
+    # T3 leaves after T2 but arrives before it
+    route.add_trip(Trip("T3", [426, 435]))
+    assert not build_timetable(stops, {"R": route}, transfers).fifo
+
+
+def test_service_day_trips_run_on_each_day():
+    a, b = Stop("A", 1, -33.918, 18.423), Stop("B", 1, -33.935, 18.413)
+    stops = {"A": a, "B": b}
+    # Mondays and Wednesdays, past midnight into the next day
+    route = Route("R", [a, b], [])
+    route.add_trip(Trip("T", [23 * 60 + 50, 24 * 60 + 10], service_days=0b101))
+    tt = build_timetable(stops, {"R": route}, [])
+
+    assert day_offsets(0b101) == (0, 2 * DAY_MINS, 7 * DAY_MINS)
+    # stored once, one departure per day in the index
+    assert tt.trip_ids == ("T",) and len(tt.stop_times) == 2
+    monday, wednesday, next_monday = (1430 + offset for offset in day_offsets(0b101))
+    assert list(tt.slot_departures[0]) == [monday, wednesday, next_monday]
+    assert tt.trip_day_id(0, 1, wednesday + 20) == "T_day2"
+    assert tt.trip_day_id(0, 0, next_monday) == "T_day0_nextweek"
+
+    # Tuesday noon: next run is Wednesday's, arriving Thursday 00:10
+    result, path = raptor_algo(stops, {"R": route}, [], "A", "B", DAY_MINS + 720, 2)
+    assert result["B"] == wednesday + 20
+    assert path[-1]["trip_id"] == "T_day2"
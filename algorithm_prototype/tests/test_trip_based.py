@@ -0,0 +1,127 @@
+import random
+
+from algorithm_prototype.raptor import Stop, Route, Trip, Transfer, raptor_algo
+from algorithm_prototype.timetable import build_timetable
+from algorithm_prototype.trip_based import build_trip_transfers, trip_based_algo
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR TRIP-BASED ROUTING
+-------------------------------------------------------------
+"""
+
+
+def _transfers_from(trip_transfers, timetable, trip_id, pos):
+    """(trip id, position, walk) of each transfer off trip_id's first run at pos."""
+    trip_ids = timetable.trip_ids
+    run = trip_transfers.trip_run_offsets[trip_ids.index(trip_id)]
+    i = trip_transfers.run_event_offsets[run] + pos
+    return sorted(
+        (
+            trip_ids[trip_transfers.run_trips[trip_transfers.transfer_runs[j]]],
+            trip_transfers.transfer_positions[j],
+            trip_transfers.transfer_walks[j],
+        )
+        for j in range(
+            trip_transfers.transfer_offsets[i], trip_transfers.transfer_offsets[i + 1]
+        )
+    )
+
+
+def test_trip_based_matches_raptor(three_way_network):
+    stops, routes, transfers = three_way_network
+
+    result, path = trip_based_algo(stops, routes, transfers, "S", "T", 415, 4)
+
+    assert result["T"] == 455
+    raptor_result, raptor_path = raptor_algo(stops, routes, transfers, "S", "T", 415, 4)
+    assert result["T"] == raptor_result["T"]
+    assert [st["stop_id"] for st in path] == [st["stop_id"] for st in raptor_path]
+    assert [st["mode"] for st in path] == ["start", "trip", "transfer", "trip"]
+    assert path[2]["transfer_time"] == 10
+    assert path[-1]["trip_id"] == raptor_path[-1]["trip_id"]
+
+    # one trip only: the direct route
+    result, path = trip_based_algo(stops, routes, transfers, "S", "T", 415, 1)
+    assert result["T"] == 490
+    assert [st["route_id"] for st in path] == [None, "R4"]
+
+
+def test_trip_transfers_drop_useless_changes(three_way_network):
+    stops, routes, transfers = three_way_network
+    timetable = build_timetable(stops, routes, transfers)
+
+    trip_transfers = build_trip_transfers(timetable)
+
+    # off T1 at A: R3 at the same stop, R2 after walking to B
+    assert _transfers_from(trip_transfers, timetable, "T1", 1) == [
+        ("T2", 0, 10),
+        ("T3", 0, 0),
+    ]
+    # changing to R4 at S, where T1 starts, arrives nowhere earlier
+    assert _transfers_from(trip_transfers, timetable, "T1", 0) == []
+
+
+def test_trip_based_walks_on_after_returning_to_the_source():
+    s = Stop("S", 2, -33.90, 18.40)
+    a = Stop("A", 2, -33.91, 18.41)
+    w = Stop("W", 2, -33.902, 18.402)
+    t = Stop("T", 2, -33.93, 18.43)
+    stops = {x.id: x for x in [s, a, w, t]}
+    # R1 loops back to S, from where R2 is a walk away
+    r1 = Route("R1", [s, a, s], [])
+    r1.add_trip(Trip("T1", [420, 425, 430]))
+    r2 = Route("R2", [w, t], [])
+    r2.add_trip(Trip("T2", [440, 450]))
+    r3 = Route("R3", [a, t], [])
+    r3.add_trip(Trip("T3", [426, 460]))
+    routes = {r.id: r for r in [r1, r2, r3]}
+    transfers = [Transfer(s, w, 5)]
+
+    result, path = trip_based_algo(stops, routes, transfers, "S", "T", 415, 4)
+    assert result["T"] == 450
+    assert [(st["stop_id"], st["mode"]) for st in path] == [
+        ("S", "start"),
+        ("S", "trip"),
+        ("W", "transfer"),
+        ("T", "trip"),
+    ]
+    # RAPTOR's label at S is the departure, the trip back doesn't improve it and
+    # the walk is not taken: an intended difference (see trip_based_algo)
+    raptor_result, _ = raptor_algo(stops, routes, transfers, "S", "T", 415, 4)
+    assert raptor_result["T"] == 460
+
+
+def _check_against_raptor(stops, routes, transfers):
+    timetable = build_timetable(stops, routes, transfers)
+    trip_transfers = build_trip_transfers(timetable)
+    for source in ["0", "1", "2"]:
+        for target in stops:
+            if target == source:
+                continue
+            expected, _ = raptor_algo(
+                stops, routes, transfers, source, target, 420, 5, timetable=timetable
+            )
+            result, path = trip_based_algo(
+                stops,
+                routes,
+                transfers,
+                source,
+                target,
+                420,
+                5,
+                timetable=timetable,
+                trip_transfers=trip_transfers,
+            )
+            assert result[target] == expected[target]
+            if path:
+                assert path[-1]["stop_id"] == target
+                assert path[-1]["arrival_time"] == result[target]
+
+
+def test_trip_based_random_networks(random_network):
+    rng = random.Random(7)
+    for _ in range(20):
+        stops, routes, transfers = random_network(rng)
+        _check_against_raptor(stops, routes, [])
+        _check_against_raptor(stops, routes, transfers)
@@ -0,0 +1,166 @@
+import threading
+
+import pytest
+
+from algorithm_prototype import raptor
+from algorithm_prototype.raptor import (
+    Stop,
+    Route,
+    Trip,
+    Transfer,
+    INF,
+    raptor_algo,
+    raptor_range,
+)
+from algorithm_prototype.predecessors import NONE
+from algorithm_prototype.timetable import build_timetable
+from algorithm_prototype.workspace import query_workspace
+
+"""
+-------------------------------------------------------------
+    UNIT TESTS FOR QUERY WORKSPACES
+-------------------------------------------------------------
+"""
+
+
+def _network():
+    """A -R1-> B, walk to C, C -R2-> D (hourly trips from 07:00)."""
+    a = Stop("A", 2, -33.90, 18.40)
+    b = Stop("B", 2, -33.91, 18.41)
+    c = Stop("C", 2, -33.915, 18.415)
+    d = Stop("D", 2, -33.93, 18.43)
+    stops = {x.id: x for x in [a, b, c, d]}
+    r1 = Route("R1", [a, b], [])
+    r2 = Route("R2", [c, d], [])
+    for h in range(4):
+        r1.add_trip(Trip(f"T1_{h}", [420 + 60 * h, 430 + 60 * h]))
+        r2.add_trip(Trip(f"T2_{h}", [445 + 60 * h, 455 + 60 * h]))
+    routes = {"R1": r1, "R2": r2}
+    transfers = [Transfer(b, c, 5)]
+    return stops, routes, transfers
+
+
+def _assert_clean(workspace):
+    assert all(t == INF for t in workspace.best)
+    assert all(t == INF for t in workspace.prev + workspace.cur)
+    assert not any(workspace.marked)
+    assert all(k == -1 for k in workspace.improved_round)
+    for arrays in workspace.layers:
+        assert arrays is None or all(s == NONE for s in arrays[0])
+    if workspace.prev_array is not None:
+        assert (workspace.prev_array == INF).all()
+        assert (workspace.best_array == INF).all()
+
+
+def test_workspace_reused_and_left_clean(monkeypatch):
+    # the Python rounds use the workspace, not the compiled kernel
+    monkeypatch.setattr(raptor, "HAS_NUMBA", False)
+    stops, routes, transfers = _network()
+    tt = build_timetable(stops, routes, transfers)
+
+    with query_workspace(tt) as workspace:
+        pass
+    first = [
+        raptor_algo(stops, routes, transfers, "A", "D", t, timetable=tt)
+        for t in (415, 475, 535)
+    ]
+    raptor_range(stops, routes, transfers, "A", "D", 400, 600, timetable=tt)
+
+    # the same (clean) workspace comes back, queries give the same results
+    with query_workspace(tt) as again:
+        assert again is workspace
+        _assert_clean(again)
+        assert len(again.layers) > 1
+    assert [r["D"] for r, _ in first] == [455, 515, 575]
+    assert [
+        raptor_algo(stops, routes, transfers, "A", "D", t, timetable=tt)
+        for t in (415, 475, 535)
+    ] == first
+
+
+def test_workspace_numpy_labels_kept_across_queries(monkeypatch):
+    pytest.importorskip("numpy")
+    from algorithm_prototype.raptor_numpy import build_route_matrices
+
+    monkeypatch.setattr(raptor, "HAS_NUMBA", False)
+    stops, routes, transfers = _network()
+    tt = build_timetable(stops, routes, transfers)
+    matrices = build_route_matrices(tt, min_cells=0)
+
+    expected = [
+        raptor_algo(stops, routes, transfers, "A", "D", t, timetable=tt)
+        for t in (415, 475, 535)
+    ]
+    with query_workspace(tt) as workspace:
+        pass
+    for _ in range(2):
+        assert [
+            raptor_algo(
+                stops,
+                routes,
+                transfers,
+                "A",
+                "D",
+                t,
+                timetable=tt,
+                route_matrices=matrices,
+            )
+            for t in (415, 475, 535)
+        ] == expected
+        assert raptor_range(
+            stops, routes, transfers, "A", "D", 400, 600, timetable=tt
+        ) == raptor_range(
+            stops,
+            routes,
+            transfers,
+            "A",
+            "D",
+            400,
+            600,
+            timetable=tt,
+            route_matrices=matrices,
+        )
+    # the NumPy copies are allocated once and handed back clean
+    with query_workspace(tt) as again:
+        assert again is workspace
+        prev_array = again.prev_array
+        assert prev_array is not None
+        _assert_clean(again)
+    raptor_algo(
+        stops, routes, transfers, "A", "D", 415, timetable=tt, route_matrices=matrices
+    )
+    with query_workspace(tt) as again:
+        assert again.prev_array is prev_array
+
+
+def test_workspace_dropped_after_error():
+    stops, routes, transfers = _network()
+    tt = build_timetable(stops, routes, transfers)
+
+    with pytest.raises(RuntimeError):
+        with query_workspace(tt) as workspace:
+            workspace.best[0] = 1
+            raise RuntimeError
+    with query_workspace(tt) as other:
+        assert other is not workspace
+        _assert_clean(other)
+
+
+def test_workspace_per_thread():
+    stops, routes, transfers = _network()
+    tt = build_timetable(stops, routes, transfers)
+    with query_workspace(tt) as main_workspace:
+        pass
+    seen = []
+
+    def query():
+        with query_workspace(tt) as workspace:
+            seen.append(workspace)
+        seen.append(raptor_algo(stops, routes, transfers, "A", "D", 415, timetable=tt))
+
+    thread = threading.Thread(target=query)
+    thread.start()
+    thread.join()
+
+    assert seen[0] is not main_workspace
+    assert seen[1][0]["D"] == 455
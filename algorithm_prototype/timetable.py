@@ -0,0 +1,550 @@
+import sys
+from array import array
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from algorithm_prototype.raptor import Route, Stop, Transfer
+
+# Value used as INFINITY (same as raptor.INF)
+INF: int = sys.maxsize
+DAY_MINS: int = 24 * 60
+# shortest walk charged for a footpath, in minutes (see Timetable.transfer_walks)
+MIN_TRANSFER_TIME: int = 1
+# days of the week in a trip's service_days bitmask (bit d = day d, 0=Monday)
+WEEK_DAYS: int = 7
+# Timetable fields compiled from the footpaths (see Timetable.with_footpaths_of)
+FOOTPATH_FIELDS: Tuple[str, ...] = (
+    "transfer_offsets",
+    "transfer_targets",
+    "transfer_times",
+    "transfer_walks",
+    "transfer_distances",
+    "transfer_in_offsets",
+    "transfer_in_sources",
+    "transfer_in_times",
+    "transfer_in_walks",
+    "transfer_in_distances",
+    "max_walk_speed",
+)
+
+
+@dataclass(frozen=True)
+class Timetable:
+    """Compiled, read-only view of the network used by the routing engines.
+
+    Everything is indexed by integers and stored in flat (CSR style) tuples, so a
+    query does not need to build any lookup structures of its own. Compile once
+    (e.g. in RaptorEngine.load) with build_timetable and share between queries.
+
+    Layout:
+        - stop s: stop_ids[s]
+        - route r visits route_stops[route_stop_offsets[r]:route_stop_offsets[r + 1]]
+        - route r owns trips route_trip_offsets[r] .. route_trip_offsets[r + 1] - 1
+        - trip t at position p of its route: stop_times[trip_time_offsets[t] + p]
+          (times of a route's trips are contiguous). A trip is stored once: it
+          runs at these times plus each of day_offsets(trip_days[t])
+        - route-stop slot i = route_stop_offsets[r] + p: slot_departures[i] holds
+          the departure times at that stop of every day a trip runs, in ascending
+          order (INF left out), and slot_trips[i] the matching trip indices. The
+          day a boarded trip runs on is its departure minus its stop time
+        - stop s is served by routes stop_routes[stop_route_offsets[s]:stop_route_offsets[s + 1]]
+          at positions stop_route_positions[...] (same slice)
+        - stop s has footpaths to transfer_targets[transfer_offsets[s]:transfer_offsets[s + 1]]
+          taking transfer_times[...] minutes. transfer_walks[...] is the walk the
+          engines charge for it (at least MIN_TRANSFER_TIME), so no query has to
+          set up its footpaths. They are transfer_distances[...] meters long,
+          nearest first: a query with a shorter maximum walking distance stops
+          at the first footpath beyond it instead of needing its own timetable
+        - incoming footpaths (for backward searches) likewise: stop s is reached from
+          transfer_in_sources[transfer_in_offsets[s]:transfer_in_offsets[s + 1]]
+          taking transfer_in_times[...] (charged transfer_in_walks[...]) minutes,
+          transfer_in_distances[...] meters long, nearest first
+        - max_trip_speed / max_walk_speed: fastest straight-line speed (meters per
+          minute) of any trip segment / footpath, used for lower bounds
+        - fifo: every trip has a time at every stop of its route (no INF) that
+          never goes backwards, and each route's trips are in the same order at
+          every stop (no overtaking), as GTFSReader's stop patterns are. The route
+          scan then needs no checks on the times
+        - validated: passed validate_timetable (queries then skip all checks)
+    """
+
+    stop_ids: Tuple[str, ...]
+    stop_index: Dict[str, int]
+    stop_lats: Tuple[float, ...]
+    stop_lons: Tuple[float, ...]
+
+    route_ids: Tuple[str, ...]
+    route_index: Dict[str, int]
+    route_stop_offsets: Tuple[int, ...]
+    route_stops: Tuple[int, ...]
+
+    route_trip_offsets: Tuple[int, ...]
+    trip_ids: Tuple[str, ...]
+    trip_time_offsets: Tuple[int, ...]
+    trip_days: Tuple[int, ...]
+    stop_times: Tuple[int, ...]
+
+    slot_departures: Tuple[Sequence[int], ...]
+    slot_trips: Tuple[Sequence[int], ...]
+
+    stop_route_offsets: Tuple[int, ...]
+    stop_routes: Tuple[int, ...]
+    stop_route_positions: Tuple[int, ...]
+
+    transfer_offsets: Tuple[int, ...]
+    transfer_targets: Tuple[int, ...]
+    transfer_times: Tuple[int, ...]
+    transfer_walks: Tuple[int, ...]
+    transfer_distances: Tuple[float, ...]
+    transfer_in_offsets: Tuple[int, ...]
+    transfer_in_sources: Tuple[int, ...]
+    transfer_in_times: Tuple[int, ...]
+    transfer_in_walks: Tuple[int, ...]
+    transfer_in_distances: Tuple[float, ...]
+
+    max_trip_speed: float
+    max_walk_speed: float
+
+    fifo: bool = False
+    validated: bool = False
+
+    @property
+    def num_stops(self) -> int:
+        return len(self.stop_ids)
+
+    @property
+    def num_routes(self) -> int:
+        return len(self.route_ids)
+
+    @property
+    def max_speed(self) -> float:
+        """Fastest straight-line speed (meters per minute) anywhere in the network.
+        INF (float) if some trip or footpath covers distance in no time, in which
+        case no useful lower bound exists."""
+        return max(self.max_trip_speed, self.max_walk_speed)
+
+    def trip_day_id(self, trip: int, pos: int, time: int) -> str:
+        """Id of the day's run of trip (index) that is at position pos of its
+        route at time, as in the paths (see format_trip_day)."""
+        offset = time - self.stop_times[self.trip_time_offsets[trip] + pos]
+        return format_trip_day(self.trip_ids[trip], self.trip_days[trip], offset)
+
+    def distance(self, a: int, b: int) -> float:
+        """Straight-line distance in meters between stops a and b (indices)."""
+        return _haversine(
+            self.stop_lats[a], self.stop_lons[a], self.stop_lats[b], self.stop_lons[b]
+        )
+
+    def with_transfers(self, transfers: List["Transfer"]) -> "Timetable":
+        """Return a copy of this timetable with a different set of footpaths.
+        Route and trip arrays are shared, only the transfer arrays are rebuilt.
+        The copy is not validated (see validate_timetable).
+
+        Args:
+            transfers (List[Transfer]): New walking transfers.
+
+        Returns:
+            Timetable: Timetable using the given transfers.
+        """
+        offsets, targets, times, walks, distances = _compile_transfers(
+            self.stop_index, transfers
+        )
+        in_offsets, in_sources, in_times, in_walks, in_distances = _compile_transfers(
+            self.stop_index, transfers, incoming=True
+        )
+        return replace(
+            self,
+            transfer_offsets=offsets,
+            transfer_targets=targets,
+            transfer_times=times,
+            transfer_walks=walks,
+            transfer_distances=distances,
+            transfer_in_offsets=in_offsets,
+            transfer_in_sources=in_sources,
+            transfer_in_times=in_times,
+            transfer_in_walks=in_walks,
+            transfer_in_distances=in_distances,
+            max_walk_speed=_max_walk_speed(
+                self.stop_lats, self.stop_lons, offsets, targets, times
+            ),
+            validated=False,
+        )
+
+    def with_footpaths_of(self, other: "Timetable") -> "Timetable":
+        """Return a copy of this timetable with the footpaths of other, a
+        timetable of the same stops (e.g. the weekly one, for the trips of a
+        date). The footpath arrays are shared instead of compiled again. The
+        copy is not validated (see validate_timetable).
+
+        Args:
+            other (Timetable): Timetable whose footpaths to use.
+
+        Raises:
+            ValueError: other has different stops.
+
+        Returns:
+            Timetable: Timetable using the footpaths of other.
+        """
+        if other.stop_ids != self.stop_ids:
+            raise ValueError("Footpaths of a timetable with different stops.")
+        return replace(
+            self,
+            **{name: getattr(other, name) for name in FOOTPATH_FIELDS},
+            validated=False,
+        )
+
+
+@lru_cache(maxsize=None)
+def day_offsets(service_days: int) -> Tuple[int, ...]:
+    """Minutes added to the times of a trip for each day it runs.
+
+    Every day d in the service_days bitmask gives d * DAY_MINS, and Monday again
+    after Sunday (so late queries in the week can reach Monday morning). A trip
+    without service days (0) runs once at its own times.
+
+    Args:
+        service_days (int): Bitmask of the days a trip runs (bit d = day d).
+
+    Returns:
+        Tuple[int, ...]: Offsets in ascending order.
+    """
+    if not service_days:
+        return (0,)
+    offsets = tuple(d * DAY_MINS for d in range(WEEK_DAYS) if service_days >> d & 1)
+    if service_days & 1:
+        offsets += (WEEK_DAYS * DAY_MINS,)
+    return offsets
+
+
+def format_trip_day(trip_id: str, service_days: int, offset: int) -> str:
+    """Id of a trip's run on one day: trip_id_day<d> (trip_id_day0_nextweek for
+    the next Monday), just trip_id for a trip without service days."""
+    if not service_days:
+        return trip_id
+    day = offset // DAY_MINS
+    if day == WEEK_DAYS:
+        return f"{trip_id}_day0_nextweek"
+    return f"{trip_id}_day{day}"
+
+
+def _haversine(lat_a: float, lon_a: float, lat_b: float, lon_b: float) -> float:
+    # raptor imports this module, so import its helpers lazily
+    from algorithm_prototype.raptor import helper_functions
+
+    return helper_functions.haversine(lat_a, lon_a, lat_b, lon_b)
+
+
+def _speed(distance: float, minutes: int) -> float:
+    """Meters per minute, INF (float) if distance is covered in no time."""
+    if distance <= 0:
+        return 0.0
+    return distance / minutes if minutes > 0 else float("inf")
+
+
+def _max_walk_speed(
+    lats: Tuple[float, ...],
+    lons: Tuple[float, ...],
+    offsets: Tuple[int, ...],
+    targets: Tuple[int, ...],
+    times: Tuple[int, ...],
+) -> float:
+    """Fastest footpath in the transfer CSR arrays (meters per minute)."""
+    fastest = 0.0
+    for u in range(len(offsets) - 1):
+        for j in range(offsets[u], offsets[u + 1]):
+            v = targets[j]
+            fastest = max(
+                fastest,
+                _speed(_haversine(lats[u], lons[u], lats[v], lons[v]), times[j]),
+            )
+    return fastest
+
+
+def _compile_transfers(
+    stop_index: Dict[str, int], transfers: List["Transfer"], incoming: bool = False
+) -> Tuple[
+    Tuple[int, ...],
+    Tuple[int, ...],
+    Tuple[int, ...],
+    Tuple[int, ...],
+    Tuple[float, ...],
+]:
+    """Group transfers by origin stop into CSR arrays (offsets, targets, times,
+    walks, distances), walks being the times raised to MIN_TRANSFER_TIME and
+    distances the walking distances (straight line for a transfer without
+    one). Each stop's footpaths are nearest first (ties in the given order). With
+    incoming=True group by destination stop instead (offsets, sources, ...).
+    """
+    adj: List[List[Tuple[float, int, int]]] = [[] for _ in range(len(stop_index))]
+    for t in transfers:
+        u, v = stop_index[t.from_stop.id], stop_index[t.to_stop.id]
+        if incoming:
+            u, v = v, u
+        distance = t.distance
+        if distance is None:
+            distance = _haversine(
+                t.from_stop.lat, t.from_stop.lon, t.to_stop.lat, t.to_stop.lon
+            )
+        adj[u].append((distance, v, t.walking_time))
+    offsets = [0]
+    targets: List[int] = []
+    times: List[int] = []
+    distances: List[float] = []
+    for edges in adj:
+        # stable, so equal distances keep their order
+        for distance, v, walk_time in sorted(edges, key=itemgetter(0)):
+            targets.append(v)
+            times.append(walk_time)
+            distances.append(distance)
+        offsets.append(len(targets))
+    walks = tuple(max(walk_time, MIN_TRANSFER_TIME) for walk_time in times)
+    return tuple(offsets), tuple(targets), tuple(times), walks, tuple(distances)
+
+
+def build_timetable(
+    stops: Dict[str, "Stop"],
+    routes: Dict[str, "Route"],
+    transfers: List["Transfer"],
+) -> Timetable:
+    """Compile stops, routes (with their trips) and transfers into a Timetable.
+
+    Stop indices follow the order of stops, route indices the order of routes and
+    trips keep their order within each route.
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+
+    Returns:
+        Timetable: The compiled timetable.
+    """
+    stop_ids = tuple(stops.keys())
+    stop_index = {sid: i for i, sid in enumerate(stop_ids)}
+    route_ids = tuple(routes.keys())
+    route_index = {rid: i for i, rid in enumerate(route_ids)}
+
+    route_stop_offsets = [0]
+    route_stops: List[int] = []
+    route_trip_offsets = [0]
+    trip_ids: List[str] = []
+    trip_time_offsets: List[int] = []
+    trip_days: List[int] = []
+    stop_times: List[int] = []
+    slot_departures: List[Sequence[int]] = []
+    slot_trips: List[Sequence[int]] = []
+    served_by: List[List[Tuple[int, int]]] = [[] for _ in stop_ids]
+    stop_lats = tuple(stop.lat for stop in stops.values())
+    stop_lons = tuple(stop.lon for stop in stops.values())
+    max_trip_speed = 0.0
+    fifo = True
+
+    for r, route in enumerate(routes.values()):
+        first_trip = len(trip_ids)
+        for pos, stop in enumerate(route.stops):
+            s = stop_index[stop.id]
+            route_stops.append(s)
+            # routes may visit a stop more than once (loops) -> keep every position
+            served_by[s].append((r, pos))
+        route_stop_offsets.append(len(route_stops))
+
+        for trip in route.trips:
+            trip_ids.append(trip.id)
+            trip_time_offsets.append(len(stop_times))
+            trip_days.append(trip.service_days)
+            stop_times.extend(trip.departure_times)
+        route_trip_offsets.append(len(trip_ids))
+
+        # fifo: no INF, times never go backwards along a trip and each run of a
+        # trip (one per day it runs) is at or after the one before it everywhere
+        fifo = fifo and all(
+            INF not in trip.departure_times
+            and all(
+                a <= b for a, b in zip(trip.departure_times, trip.departure_times[1:])
+            )
+            for trip in route.trips
+        )
+        if fifo:
+            runs = sorted(
+                [t + offset for t in trip.departure_times]
+                for trip in route.trips
+                for offset in day_offsets(trip.service_days)
+            )
+            fifo = all(
+                all(a <= b for a, b in zip(earlier, later))
+                for earlier, later in zip(runs, runs[1:])
+            )
+
+        # fastest ride between consecutive served stops (INF holes skipped) - the
+        # shortest time per stop pair is enough, distances are computed once per pair
+        quickest: Dict[Tuple[int, int], int] = {}
+        for t in range(first_trip, len(trip_ids)):
+            base = trip_time_offsets[t]
+            last_pos = -1
+            for pos in range(len(route.stops)):
+                time = stop_times[base + pos]
+                if time == INF:
+                    continue
+                if last_pos >= 0:
+                    dt = time - stop_times[base + last_pos]
+                    key = (last_pos, pos)
+                    if dt < quickest.get(key, INF):
+                        quickest[key] = dt
+                last_pos = pos
+        for (pos_a, pos_b), dt in quickest.items():
+            a = route_stops[route_stop_offsets[r] + pos_a]
+            b = route_stops[route_stop_offsets[r] + pos_b]
+            distance = _haversine(
+                stop_lats[a], stop_lons[a], stop_lats[b], stop_lons[b]
+            )
+            max_trip_speed = max(max_trip_speed, _speed(distance, dt))
+
+        # per position departures of every day a trip runs, in ascending order
+        # for the earliest trip search. This index has an entry per stop and day
+        # of each trip (the bulk of the timetable), so it is kept in int32 arrays
+        runs = [
+            (t, offset)
+            for t in range(first_trip, len(trip_ids))
+            for offset in day_offsets(trip_days[t])
+        ]
+        for pos in range(len(route.stops)):
+            served = [
+                (stop_times[trip_time_offsets[t] + pos] + offset, t)
+                for t, offset in runs
+                if stop_times[trip_time_offsets[t] + pos] != INF
+            ]
+            # stable sort: equal departures stay in trip order
+            served.sort(key=itemgetter(0))
+            slot_departures.append(array("i", [p[0] for p in served]))
+            slot_trips.append(array("i", [p[1] for p in served]))
+
+    stop_route_offsets = [0]
+    stop_routes: List[int] = []
+    stop_route_positions: List[int] = []
+    for entries in served_by:
+        for r, pos in entries:
+            stop_routes.append(r)
+            stop_route_positions.append(pos)
+        stop_route_offsets.append(len(stop_routes))
+
+    (
+        transfer_offsets,
+        transfer_targets,
+        transfer_times,
+        transfer_walks,
+        transfer_distances,
+    ) = _compile_transfers(stop_index, transfers)
+    (
+        transfer_in_offsets,
+        transfer_in_sources,
+        transfer_in_times,
+        transfer_in_walks,
+        transfer_in_distances,
+    ) = _compile_transfers(stop_index, transfers, incoming=True)
+
+    return Timetable(
+        stop_ids=stop_ids,
+        stop_index=stop_index,
+        stop_lats=stop_lats,
+        stop_lons=stop_lons,
+        route_ids=route_ids,
+        route_index=route_index,
+        route_stop_offsets=tuple(route_stop_offsets),
+        route_stops=tuple(route_stops),
+        route_trip_offsets=tuple(route_trip_offsets),
+        trip_ids=tuple(trip_ids),
+        trip_time_offsets=tuple(trip_time_offsets),
+        trip_days=tuple(trip_days),
+        stop_times=tuple(stop_times),
+        slot_departures=tuple(slot_departures),
+        slot_trips=tuple(slot_trips),
+        stop_route_offsets=tuple(stop_route_offsets),
+        stop_routes=tuple(stop_routes),
+        stop_route_positions=tuple(stop_route_positions),
+        transfer_offsets=transfer_offsets,
+        transfer_targets=transfer_targets,
+        transfer_times=transfer_times,
+        transfer_walks=transfer_walks,
+        transfer_distances=transfer_distances,
+        transfer_in_offsets=transfer_in_offsets,
+        transfer_in_sources=transfer_in_sources,
+        transfer_in_times=transfer_in_times,
+        transfer_in_walks=transfer_in_walks,
+        transfer_in_distances=transfer_in_distances,
+        max_trip_speed=max_trip_speed,
+        max_walk_speed=_max_walk_speed(
+            stop_lats, stop_lons, transfer_offsets, transfer_targets, transfer_times
+        ),
+        fifo=fifo,
+    )
+
+
+def validate_timetable(timetable: Timetable, trips: bool = True) -> Timetable:
+    """Structural checks of a compiled timetable, run once at load so queries
+    don't have to (they only check in trace mode, see raptor_algo(debug=...)).
+
+    Checks that every trip has a time for each stop of its route, that trip times
+    never go backwards (INF holes skipped) and that footpaths don't loop back to
+    their own stop or take negative time.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+        trips (bool, optional): Also check the trips. Turn off for a copy of a
+            validated timetable with other footpaths (see with_transfers), whose
+            trips were checked already. Defaults to True.
+
+    Raises:
+        ValueError: The first problem found.
+
+    Returns:
+        Timetable: The same timetable marked as validated.
+    """
+    num_times = len(timetable.stop_times)
+    for r in range(timetable.num_routes if trips else 0):
+        num_stops = (
+            timetable.route_stop_offsets[r + 1] - timetable.route_stop_offsets[r]
+        )
+        for t in range(
+            timetable.route_trip_offsets[r], timetable.route_trip_offsets[r + 1]
+        ):
+            base = timetable.trip_time_offsets[t]
+            end = (
+                timetable.trip_time_offsets[t + 1]
+                if t + 1 < len(timetable.trip_ids)
+                else num_times
+            )
+            where = (
+                f"In route_id '{timetable.route_ids[r]}', "
+                f"trip_id '{timetable.trip_ids[t]}'"
+            )
+            if end - base != num_stops:
+                raise ValueError(f"{where}: {end - base} times for {num_stops} stops.")
+            last_time = INF
+            for pos in range(num_stops):
+                time = timetable.stop_times[base + pos]
+                if time == INF:
+                    continue
+                if last_time != INF and time < last_time:
+                    raise ValueError(
+                        f"{where}: Trip times must be non-decreasing (position {pos})."
+                    )
+                last_time = time
+
+    for u in range(timetable.num_stops):
+        for j in range(
+            timetable.transfer_offsets[u], timetable.transfer_offsets[u + 1]
+        ):
+            if timetable.transfer_targets[j] == u:
+                raise ValueError(
+                    f"Transfer loop detected at stop {timetable.stop_ids[u]}"
+                )
+            if timetable.transfer_times[j] < 0:
+                raise ValueError(
+                    f"Negative transfer time from stop {timetable.stop_ids[u]} "
+                    f"to stop {timetable.stop_ids[timetable.transfer_targets[j]]}"
+                )
+
+    return replace(timetable, validated=True)
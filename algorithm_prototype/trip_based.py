@@ -0,0 +1,580 @@
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from algorithm_prototype.raptor import (
+    Stop,
+    Route,
+    Transfer,
+    INF,
+)
+from algorithm_prototype.timetable import (
+    Timetable,
+    build_timetable,
+    day_offsets,
+    validate_timetable,
+)
+
+
+@dataclass(frozen=True)
+class TripTransfers:
+    """Trip-to-trip transfers of a Timetable, the preprocessing of Trip-Based
+    routing (see build_trip_transfers). Depends on the timetable's trips and
+    footpaths: build once per timetable and share between queries.
+
+    Trip-Based routing works on runs: a trip on one of the days it runs.
+
+    Layout:
+        - run u is trip run_trips[u] (of route run_routes[u]) at its times plus
+          run_days[u] minutes
+        - trip t has runs trip_run_offsets[t] .. trip_run_offsets[t + 1] - 1, in
+          day_offsets order
+        - route r has runs route_runs[route_run_offsets[r]:route_run_offsets[r + 1]]
+          ordered by departure, run u being at run_ranks[u] in that list
+        - getting off run u at position p (event i = run_event_offsets[u] + p)
+          one can change to run transfer_runs[j] at its position
+          transfer_positions[j], after walking transfer_walks[j] minutes (0: same
+          stop), for j in transfer_offsets[i] .. transfer_offsets[i + 1] - 1
+        - max_walk_dist: longest footpath (meters) the transfers walk, None for
+          all of the timetable's. Queries must walk the same ones
+    """
+
+    run_trips: Sequence[int]
+    run_days: Sequence[int]
+    run_routes: Sequence[int]
+    trip_run_offsets: Sequence[int]
+    route_run_offsets: Sequence[int]
+    route_runs: Sequence[int]
+    run_ranks: Sequence[int]
+    run_event_offsets: Sequence[int]
+    transfer_offsets: Sequence[int]
+    transfer_runs: Sequence[int]
+    transfer_positions: Sequence[int]
+    transfer_walks: Sequence[int]
+    max_walk_dist: Optional[float] = None
+
+    @property
+    def num_runs(self) -> int:
+        return len(self.run_trips)
+
+    @property
+    def num_transfers(self) -> int:
+        return len(self.transfer_runs)
+
+
+def build_trip_transfers(
+    timetable: Timetable, max_walk_dist: Optional[float] = None
+) -> TripTransfers:
+    """Compute the trip-to-trip transfers for Trip-Based routing.
+
+    Getting off a run at a stop, the candidate transfers are to the earliest run
+    of every route at the same stop or at the end of one of its footpaths (same
+    walking times as raptor_algo). Changing to a later stop of the same route
+    is never needed (staying on is as fast). A candidate is then only kept if it
+    gets to some stop (or one walk from it) earlier than staying on the run or
+    than the transfers kept from its later stops (scanned last to first), which
+    also drops U-turns. This keeps every earliest arrival reachable with the
+    remaining transfers.
+
+    The reduction depends on the footpaths (a transfer may only be dropped for
+    one walking further), so the transfers are for one maximum walking distance:
+    with max_walk_dist only the timetable's footpaths at most that long are
+    walked.
+
+    Args:
+        timetable (Timetable): Compiled timetable.
+        max_walk_dist (float, optional): Longest footpath to walk in meters.
+            Defaults to None (all of them).
+
+    Returns:
+        TripTransfers: The reduced transfers.
+    """
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    route_trip_offsets = timetable.route_trip_offsets
+    trip_time_offsets = timetable.trip_time_offsets
+    trip_days = timetable.trip_days
+    stop_times = timetable.stop_times
+    slot_departures = timetable.slot_departures
+    slot_trips = timetable.slot_trips
+
+    # runs, by trip
+    run_trips = array("i")
+    run_days = array("i")
+    trip_run_offsets = array("i", [0])
+    for trip in range(len(timetable.trip_ids)):
+        for offset in day_offsets(trip_days[trip]):
+            run_trips.append(trip)
+            run_days.append(offset)
+        trip_run_offsets.append(len(run_trips))
+
+    # runs by route, ordered by departure
+    route_run_offsets = array("i", [0])
+    route_runs = array("i")
+    run_ranks = array("i", [0]) * len(run_trips)
+    run_routes = array("i", [0]) * len(run_trips)
+    for r in range(timetable.num_routes):
+        num_stops_in_route = route_stop_offsets[r + 1] - route_stop_offsets[r]
+
+        def departure(run: int) -> int:
+            base = trip_time_offsets[run_trips[run]]
+            times = stop_times[base : base + num_stops_in_route]
+            return next((t + run_days[run] for t in times if t != INF), INF)
+
+        runs = sorted(
+            range(
+                trip_run_offsets[route_trip_offsets[r]],
+                trip_run_offsets[route_trip_offsets[r + 1]],
+            ),
+            key=lambda u: (departure(u), u),
+        )
+        for u in runs:
+            run_ranks[u] = len(route_runs) - route_run_offsets[r]
+            run_routes[u] = r
+            route_runs.append(u)
+        route_run_offsets.append(len(route_runs))
+
+    # boarding options at each stop: (walk, route, position, slot), the stop's
+    # own routes first, then those at the end of its footpaths
+    walk_limit = INF if max_walk_dist is None else max_walk_dist
+    walks: List[List[Tuple[int, int]]] = [
+        [
+            (timetable.transfer_walks[j], timetable.transfer_targets[j])
+            for j in range(
+                timetable.transfer_offsets[s], timetable.transfer_offsets[s + 1]
+            )
+            if timetable.transfer_distances[j] <= walk_limit
+        ]
+        for s in range(timetable.num_stops)
+    ]
+    boardings: List[List[Tuple[int, int, int, int]]] = []
+    for s in range(timetable.num_stops):
+        stop_options = []
+        for walk, v in [(0, s)] + walks[s]:
+            for j in range(
+                timetable.stop_route_offsets[v], timetable.stop_route_offsets[v + 1]
+            ):
+                u = timetable.stop_routes[j]
+                pos = timetable.stop_route_positions[j]
+                # nothing to ride from a route's last stop
+                if pos < route_stop_offsets[u + 1] - route_stop_offsets[u] - 1:
+                    stop_options.append((walk, u, pos, route_stop_offsets[u] + pos))
+        boardings.append(stop_options)
+
+    run_event_offsets = array("i", [0])
+    transfer_offsets = array("i", [0])
+    transfer_runs = array("i")
+    transfer_positions = array("i")
+    transfer_walks = array("i")
+
+    # earliest arrival at the stops reachable from the current run (by a trip and
+    # at most one walk after it), reset after each run
+    arrivals = [INF] * timetable.num_stops
+    touched: List[int] = []
+
+    def reach(stop_idx: int, time: int) -> bool:
+        """Lower the arrivals at stop_idx and one walk from it."""
+        improved = False
+        if time < arrivals[stop_idx]:
+            if arrivals[stop_idx] == INF:
+                touched.append(stop_idx)
+            arrivals[stop_idx] = time
+            improved = True
+        for walk, v in walks[stop_idx]:
+            if time + walk < arrivals[v]:
+                if arrivals[v] == INF:
+                    touched.append(v)
+                arrivals[v] = time + walk
+                improved = True
+        return improved
+
+    for run in range(len(run_trips)):
+        trip = run_trips[run]
+        r = run_routes[run]
+        first_slot = route_stop_offsets[r]
+        num_stops_in_route = route_stop_offsets[r + 1] - first_slot
+        base = trip_time_offsets[trip]
+        day = run_days[run]
+
+        # arrivals that count for the reduction: only times that never go back
+        # along the run (stricter than the scans' rule, which keeps it safe)
+        times = stop_times[base : base + num_stops_in_route]
+        valid = []
+        latest = -INF
+        for time in times:
+            valid.append(time != INF and time >= latest)
+            if valid[-1]:
+                latest = time
+
+        kept_by_pos: List[List[Tuple[int, int, int]]] = [
+            [] for _ in range(num_stops_in_route)
+        ]
+        for pos in range(num_stops_in_route - 1, 0, -1):
+            if times[pos] == INF:
+                continue
+            stop_idx = route_stops[first_slot + pos]
+            time = times[pos] + day
+            if valid[pos]:
+                reach(stop_idx, time)
+
+            kept = kept_by_pos[pos]
+            for walk, u, board_pos, slot in boardings[stop_idx]:
+                if u == r and board_pos >= pos:
+                    continue  # staying on is as fast
+                dep_times = slot_departures[slot]
+                i = bisect_left(dep_times, time + walk)
+                if i == len(dep_times):
+                    continue
+                trip2 = slot_trips[slot][i]
+                base2 = trip_time_offsets[trip2]
+                day2 = dep_times[i] - stop_times[base2 + board_pos]
+                first_slot2 = route_stop_offsets[u]
+                useful = False
+                latest = stop_times[base2 + board_pos]
+                for pos2 in range(
+                    board_pos + 1, route_stop_offsets[u + 1] - first_slot2
+                ):
+                    time2 = stop_times[base2 + pos2]
+                    if time2 == INF or time2 < latest:
+                        continue
+                    latest = time2
+                    if reach(route_stops[first_slot2 + pos2], time2 + day2):
+                        useful = True
+                if useful:
+                    run2 = trip_run_offsets[trip2] + day_offsets(
+                        trip_days[trip2]
+                    ).index(day2)
+                    kept.append((run2, board_pos, walk))
+
+        for stop_idx in touched:
+            arrivals[stop_idx] = INF
+        touched.clear()
+
+        for kept in kept_by_pos:
+            for run2, board_pos, walk in kept:
+                transfer_runs.append(run2)
+                transfer_positions.append(board_pos)
+                transfer_walks.append(walk)
+            transfer_offsets.append(len(transfer_runs))
+        run_event_offsets.append(run_event_offsets[-1] + num_stops_in_route)
+
+    return TripTransfers(
+        run_trips=run_trips,
+        run_days=run_days,
+        run_routes=run_routes,
+        trip_run_offsets=trip_run_offsets,
+        route_run_offsets=route_run_offsets,
+        route_runs=route_runs,
+        run_ranks=run_ranks,
+        run_event_offsets=run_event_offsets,
+        transfer_offsets=transfer_offsets,
+        transfer_runs=transfer_runs,
+        transfer_positions=transfer_positions,
+        transfer_walks=transfer_walks,
+        max_walk_dist=max_walk_dist,
+    )
+
+
+def _segment_path(
+    segments: List[Tuple[int, int, int, int, int]],
+    segment: int,
+    alight_pos: int,
+    target_walk: int,
+    timetable: Timetable,
+    trip_transfers: TripTransfers,
+    source_idx: int,
+    target_idx: int,
+    departure_time: int,
+) -> List[Dict[str, Any]]:
+    """Steps from the source to the target, same format as raptor_algo paths:
+    the trip segments ending at alight_pos of segment, each followed by the walk
+    to the next one (and to the target)."""
+    idx_to_id = timetable.stop_ids
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    stop_times = timetable.stop_times
+
+    path: List[Dict[str, Any]] = []
+    walk, walk_to = target_walk, target_idx
+    rounds = 0
+    s = segment
+    while s >= 0:
+        rounds += 1
+        s = segments[s][2]
+    while segment >= 0:
+        run, board_pos, parent, parent_alight_pos, parent_walk = segments[segment]
+        trip = trip_transfers.run_trips[run]
+        first_slot = route_stop_offsets[trip_transfers.run_routes[run]]
+        stop_idx = route_stops[first_slot + alight_pos]
+        board_stop_idx = route_stops[first_slot + board_pos]
+        arrival = (
+            stop_times[timetable.trip_time_offsets[trip] + alight_pos]
+            + trip_transfers.run_days[run]
+        )
+        if walk_to != stop_idx:
+            path.append(
+                {
+                    "prev_idx": stop_idx,
+                    "arrival_time": arrival + walk,
+                    "mode": "transfer",
+                    "route_id": None,
+                    "trip_id": None,
+                    "transfer_time": walk,
+                    "round": rounds,
+                    "stop_id": idx_to_id[walk_to],
+                    "from_stop_id": idx_to_id[stop_idx],
+                }
+            )
+        path.append(
+            {
+                "prev_idx": board_stop_idx,
+                "arrival_time": arrival,
+                "mode": "trip",
+                "route_id": timetable.route_ids[trip_transfers.run_routes[run]],
+                "trip_id": timetable.trip_day_id(trip, alight_pos, arrival),
+                "transfer_time": None,
+                "board_pos": board_pos,
+                "disembark_pos": alight_pos,
+                "round": rounds,
+                "stop_id": idx_to_id[stop_idx],
+                "from_stop_id": idx_to_id[board_stop_idx],
+            }
+        )
+        # the walk to this trip, from where the previous one was left
+        walk, walk_to = parent_walk, board_stop_idx
+        segment, alight_pos = parent, parent_alight_pos
+        rounds -= 1
+
+    path.append(
+        {
+            "stop_id": idx_to_id[source_idx],
+            "arrival_time": departure_time,
+            "mode": "start",
+            "route_id": None,
+            "trip_id": None,
+            "transfer_time": None,
+            "from_stop_id": None,
+        }
+    )
+    path.reverse()
+    return path
+
+
+def trip_based_algo(
+    stops: Dict[str, Stop],
+    routes: Dict[str, Route],
+    transfers: List[Transfer],
+    source_id: str,
+    target_id: str,
+    departure_time: int,
+    max_rounds: int = 10,
+    debug: bool = False,
+    timetable: Optional[Timetable] = None,
+    trip_transfers: Optional[TripTransfers] = None,
+    max_walk_dist: Optional[float] = None,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """Trip-Based routing - earliest arrival by a breadth first search over trip
+    segments and the precomputed trip-to-trip transfers (see
+    build_trip_transfers), instead of scanning routes round by round.
+
+    Round n holds the segments of runs (from where one boards to where the run
+    was first reached) with n trips. A run reached at some position makes
+    every later run of its route reached there too (FIFO timetables), so each
+    stop event is scanned at most once. Journeys have the shape of raptor_algo's:
+    at most max_rounds trips, one walk after each trip and none before the first.
+
+    The arrival can be earlier than raptor_algo's: a walk may follow any trip
+    arrival, while RAPTOR only walks from stops whose label the trip improved
+    (not from a trip back at the source, or one beaten by an earlier walk to the
+    stop). RAPTOR may in turn chain footpaths that are not transitively closed.
+
+    Args:
+        stops (Dict[str, Stop]): All stops.
+        routes (Dict[str, Route]): All routes with their trips.
+        transfers (List[Transfer]): Walking transfers between stops.
+        source_id (str): Origin stop id.
+        target_id (str): Destination stop id.
+        departure_time (int): Departure time at the origin (minutes).
+        max_rounds (int, optional): Maximum number of trips. Defaults to 10.
+        debug (bool, optional): Trace mode: validate the timetable unless
+            validate_timetable already did at load. Defaults to False.
+        timetable (Timetable, optional): Compiled timetable (see raptor_algo).
+        trip_transfers (TripTransfers, optional): Transfers of the timetable
+            for max_walk_dist. Should be built once at load - computed here
+            (slow) if not given.
+        max_walk_dist (float, optional): Longest footpath to walk in meters (see
+            raptor_algo). Defaults to None (all of them).
+
+    Returns:
+        Tuple[Dict[str, int], List[Dict[str, Any]]]:
+            - Dict of arrival times at the stops reached on the way (only upper
+              bounds, segments that can't beat the target aren't scanned) and
+              the earliest arrival at the target.
+            - List of steps (fastest path from source to target, as raptor_algo).
+    """
+    if timetable is None:
+        timetable = build_timetable(stops, routes, transfers)
+    if debug and not timetable.validated:
+        validate_timetable(timetable)
+    if trip_transfers is None:
+        trip_transfers = build_trip_transfers(timetable, max_walk_dist)
+    elif trip_transfers.max_walk_dist != max_walk_dist:
+        raise ValueError(
+            f"Trip transfers walk footpaths up to {trip_transfers.max_walk_dist} m, "
+            f"not {max_walk_dist} m."
+        )
+
+    id_to_idx = timetable.stop_index
+    if source_id not in id_to_idx:
+        raise ValueError("Origin not a valid Stop.")
+    source_idx = id_to_idx[source_id]
+    target_idx: Optional[int] = id_to_idx.get(target_id)
+
+    route_stop_offsets = timetable.route_stop_offsets
+    route_stops = timetable.route_stops
+    trip_time_offsets = timetable.trip_time_offsets
+    trip_days = timetable.trip_days
+    stop_times = timetable.stop_times
+    fifo = timetable.fifo
+    run_trips = trip_transfers.run_trips
+    run_days = trip_transfers.run_days
+    run_routes = trip_transfers.run_routes
+    trip_run_offsets = trip_transfers.trip_run_offsets
+    route_run_offsets = trip_transfers.route_run_offsets
+    route_runs = trip_transfers.route_runs
+    run_ranks = trip_transfers.run_ranks
+    run_event_offsets = trip_transfers.run_event_offsets
+    transfer_offsets = trip_transfers.transfer_offsets
+    transfer_runs = trip_transfers.transfer_runs
+    transfer_positions = trip_transfers.transfer_positions
+    transfer_walks = trip_transfers.transfer_walks
+
+    # walk to the target from the stops with a footpath to it (0 from itself)
+    target_walks: Dict[int, int] = {}
+    if target_idx is not None:
+        walk_limit = INF if max_walk_dist is None else max_walk_dist
+        for j in range(
+            timetable.transfer_in_offsets[target_idx],
+            timetable.transfer_in_offsets[target_idx + 1],
+        ):
+            # nearest first, so the rest are too long as well
+            if timetable.transfer_in_distances[j] > walk_limit:
+                break
+            s = timetable.transfer_in_sources[j]
+            walk = timetable.transfer_in_walks[j]
+            target_walks[s] = min(target_walks.get(s, INF), walk)
+        target_walks[target_idx] = 0
+
+    arrivals = [INF] * timetable.num_stops
+    # first position each run is reached at (INF: not reached)
+    reached = [INF] * trip_transfers.num_runs
+    # (run, board position, parent segment, its alight position, walk between)
+    segments: List[Tuple[int, int, int, int, int]] = []
+    queue: List[Tuple[int, int]] = []  # segments of the round, with their end
+
+    def enqueue(run: int, pos: int, parent: int, alight_pos: int, walk: int) -> None:
+        r = run_routes[run]
+        end = min(reached[run], route_stop_offsets[r + 1] - route_stop_offsets[r] - 1)
+        if pos >= end:
+            return
+        queue.append((len(segments), end))
+        segments.append((run, pos, parent, alight_pos, walk))
+        if not fifo:
+            reached[run] = pos
+            return
+        # later runs of the route are reached there too (and need no scan)
+        for rank in range(
+            route_run_offsets[r] + run_ranks[run], route_run_offsets[r + 1]
+        ):
+            later = route_runs[rank]
+            if reached[later] <= pos:
+                break
+            reached[later] = pos
+
+    # round 1: the earliest run of every route at the source
+    for j in range(
+        timetable.stop_route_offsets[source_idx],
+        timetable.stop_route_offsets[source_idx + 1],
+    ):
+        r = timetable.stop_routes[j]
+        pos = timetable.stop_route_positions[j]
+        slot = route_stop_offsets[r] + pos
+        dep_times = timetable.slot_departures[slot]
+        i = bisect_left(dep_times, departure_time)
+        if i == len(dep_times):
+            continue
+        trip = timetable.slot_trips[slot][i]
+        day = dep_times[i] - stop_times[trip_time_offsets[trip] + pos]
+        run = trip_run_offsets[trip] + day_offsets(trip_days[trip]).index(day)
+        enqueue(run, pos, -1, -1, 0)
+
+    target_arrival = INF
+    best: Tuple[int, int, int] = (-1, -1, 0)  # segment, alight position, walk
+    for _ in range(max_rounds):
+        if not queue:
+            break
+        round_queue, queue = queue, []
+        for segment, end in round_queue:
+            run, board_pos = segments[segment][:2]
+            first_slot = route_stop_offsets[run_routes[run]]
+            base = trip_time_offsets[run_trips[run]]
+            day = run_days[run]
+            board_time = stop_times[base + board_pos]
+            events = run_event_offsets[run]
+            for pos in range(board_pos + 1, end + 1):
+                time = stop_times[base + pos]
+                # same rules as raptor_algo off FIFO timetables
+                if not fifo and (
+                    time == INF
+                    or time < board_time
+                    or (
+                        stop_times[base + pos - 1] != INF
+                        and time < stop_times[base + pos - 1]
+                    )
+                ):
+                    continue
+                time += day
+                if time >= target_arrival:
+                    if fifo:
+                        break  # nor are the later stops
+                    continue
+                stop_idx = route_stops[first_slot + pos]
+                if time < arrivals[stop_idx]:
+                    arrivals[stop_idx] = time
+                walk = target_walks.get(stop_idx)
+                if walk is not None and time + walk < target_arrival:
+                    target_arrival = time + walk
+                    best = (segment, pos, walk)
+                for j in range(
+                    transfer_offsets[events + pos], transfer_offsets[events + pos + 1]
+                ):
+                    # most runs are already reached, skip them without a call
+                    if transfer_positions[j] < reached[transfer_runs[j]]:
+                        enqueue(
+                            transfer_runs[j],
+                            transfer_positions[j],
+                            segment,
+                            pos,
+                            transfer_walks[j],
+                        )
+
+    idx_to_id = timetable.stop_ids
+    result: Dict[str, int] = dict(zip(idx_to_id, arrivals))
+    result[source_id] = departure_time
+    if target_idx is None or target_idx == source_idx or best[0] < 0:
+        return result, []
+    result[target_id] = target_arrival
+
+    path = _segment_path(
+        segments,
+        best[0],
+        best[1],
+        best[2],
+        timetable,
+        trip_transfers,
+        source_idx,
+        target_idx,
+        departure_time,
+    )
+    return result, path
@@ -0,0 +1,110 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from algorithm_prototype.predecessors import NONE, LayerArrays
+from algorithm_prototype.raptor_numpy import np
+from algorithm_prototype.timetable import INF, Timetable
+
+# idle workspaces kept per thread (one per network size in use, e.g. the weekly
+# and a date timetable)
+WORKSPACE_POOL_SIZE: int = 4
+
+_local = threading.local()
+
+
+class QueryWorkspace:
+    """Per stop scratch arrays of a RAPTOR query, reused by the following queries
+    of the same thread instead of being allocated for each (see query_workspace).
+
+    Arrays are all unreached (INF, NEG_INF for backward searches, see
+    query_workspace) / False / -1 / NONE between queries. A query records the
+    stops it writes (touched, and the marked lists of its rounds), so handing
+    the workspace back only resets those entries.
+
+    Layout:
+        - prev, cur, marked: round arrays of _raptor_rounds (left clean by it)
+        - best, improved_round: results of a single run (see _raptor_single),
+          the stops they were set for in touched
+        - layers[k]: predecessor arrays of round k (see PredecessorLayers),
+          allocated by the first query that reaches round k
+        - prev_array, best_array: NumPy copies of prev and best for the
+          vectorized route scan (see raptor_numpy), kept in step by the rounds.
+          Allocated by the first query that uses it (see label_arrays)
+    """
+
+    def __init__(self, num_stops: int, unreached: int = INF):
+        self.num_stops = num_stops
+        self.unreached = unreached
+        self.prev: List[int] = [unreached] * num_stops
+        self.cur: List[int] = [unreached] * num_stops
+        self.marked: List[bool] = [False] * num_stops
+        self.best: List[int] = [unreached] * num_stops
+        self.improved_round: List[int] = [-1] * num_stops
+        self.touched: List[int] = []
+        self.layers: List[Optional[LayerArrays]] = []
+        self.prev_array: Optional["np.ndarray"] = None
+        self.best_array: Optional["np.ndarray"] = None
+
+    def label_arrays(self) -> Tuple["np.ndarray", "np.ndarray"]:
+        """prev_array and best_array, allocated (all INF) on first use."""
+        if self.prev_array is None:
+            self.prev_array = np.full(self.num_stops, INF, dtype=np.int64)
+            self.best_array = np.full(self.num_stops, INF, dtype=np.int64)
+        return self.prev_array, self.best_array
+
+    def reset(self) -> None:
+        """Clear what the last query wrote: best, improved_round and the
+        predecessors of the touched stops."""
+        best = self.best
+        unreached = self.unreached
+        improved_round = self.improved_round
+        prev_stops = [arrays[0] for arrays in self.layers if arrays is not None]
+        for stop_idx in self.touched:
+            best[stop_idx] = unreached
+            improved_round[stop_idx] = -1
+            # an entry with prev_stop NONE is never read (see PredecessorLayers)
+            for prev_stop in prev_stops:
+                prev_stop[stop_idx] = NONE
+        if self.best_array is not None and self.touched:
+            self.best_array[self.touched] = INF
+        self.touched.clear()
+
+
+@contextmanager
+def query_workspace(
+    timetable: Timetable, unreached: int = INF
+) -> Iterator[QueryWorkspace]:
+    """Lend a clean workspace for timetable's size from this thread's pool (a
+    new one if none is idle) for the duration of a query.
+
+    Results read from the workspace (best, the predecessor layers) are only
+    valid inside the with block. A query that raises leaves its workspace
+    half written, so it is dropped instead of going back to the pool.
+
+    Args:
+        timetable (Timetable): Timetable of the query.
+        unreached (int, optional): Time of a stop not reached yet: INF for
+            earliest arrivals, NEG_INF for latest departures (see
+            reverse_raptor). Defaults to INF.
+
+    Yields:
+        QueryWorkspace: Workspace with arrays for timetable.num_stops stops.
+    """
+    pool: Optional[List[QueryWorkspace]] = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = []
+    num_stops = timetable.num_stops
+    for i, workspace in enumerate(pool):
+        if workspace.num_stops == num_stops and workspace.unreached == unreached:
+            del pool[i]
+            break
+    else:
+        workspace = QueryWorkspace(num_stops, unreached)
+
+    yield workspace
+
+    workspace.reset()
+    pool.append(workspace)
+    if len(pool) > WORKSPACE_POOL_SIZE:
+        del pool[0]
@@ -0,0 +1,65 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from algorithm_prototype.footpaths import WALK_FOOTPATHS_FILE, write_footpath_index
+from algorithm_prototype.gtfs_reader import GTFSReader
+from algorithm_prototype.osm_walk import MAX_SNAP_DIST, read_osm, street_footpaths
+from algorithm_prototype.raptor import MAX_WALK_DIST
+
+
+class Command(BaseCommand):
+    help = "Compute street network walking footpaths between GTFS stops from a local OpenStreetMap extract (.osm or .osm.pbf)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("osm_path", type=str, help="Path to the OpenStreetMap extract")
+        parser.add_argument(
+            "--gtfs-folder",
+            type=str,
+            default=getattr(settings, "GTFS_FOLDER", None),
+            help="GTFS folder whose stops to connect (the footpaths are saved there)",
+        )
+        parser.add_argument(
+            "--max-walk-dist",
+            type=float,
+            default=MAX_WALK_DIST,
+            help="Longest footpath in meters",
+        )
+        parser.add_argument(
+            "--max-snap-dist",
+            type=float,
+            default=MAX_SNAP_DIST,
+            help="Furthest a stop may be from the street graph in meters",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=None,
+            help="Worker processes (default: one per CPU)",
+        )
+
+    def handle(self, *args, **options):
+        osm_path = options["osm_path"]
+        if not os.path.isfile(osm_path):
+            self.stderr.write(self.style.ERROR(f"File not found: {osm_path}"))
+            return
+
+        gtfs_folder = os.path.join(options["gtfs_folder"], "")
+        stops = GTFSReader(gtfs_folder=gtfs_folder).stops
+        self.stdout.write(f"Reading street graph from: {osm_path}")
+        graph = read_osm(osm_path)
+        self.stdout.write(f"{graph.num_nodes} street nodes, {len(stops)} stops")
+
+        footpaths = street_footpaths(
+            graph,
+            stops,
+            max_walking_dist=options["max_walk_dist"],
+            max_snap_dist=options["max_snap_dist"],
+            processes=options["processes"],
+        )
+        out_path = gtfs_folder + WALK_FOOTPATHS_FILE
+        write_footpath_index(out_path, footpaths)
+        self.stdout.write(
+            self.style.SUCCESS(f"Saved {len(footpaths)} footpaths to {out_path}")
+        )
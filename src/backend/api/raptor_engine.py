@@ -1,24 +1,63 @@
 from __future__ import annotations
 
 import math
+import os
 import threading
+from functools import lru_cache
 from typing import Any, List, Dict, Tuple, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from django.conf import settings
 
 from algorithm_prototype.gtfs_reader import GTFSReader, INF
 from algorithm_prototype.raptor import (
     helper_functions as hf,
-    raptor_algo,
+    raptor_multi,
+    raptor_one_to_all,
+    raptor_range,
     reconstruct_path_objs,
     Stop,
     Route,
     Trip,
     Transfer,
     MAX_WALK_DIST,
+    METERS_PER_DEG_LAT,
+    WALKING_SPEED,
 )
+from algorithm_prototype.csa import Connections, build_connections, csa_algo
 from algorithm_prototype.dijkstra import dijkstra_algo, _reconstruct_dijkstra_path
+from algorithm_prototype.footpaths import (
+    WALK_FOOTPATHS_FILE,
+    FootpathIndex,
+    PointGrid,
+    build_footpath_index,
+    close_footpaths,
+    read_footpath_index,
+)
+from algorithm_prototype.mcraptor import mcraptor_algo, pick_journey
+from algorithm_prototype.raptor_numba import (
+    HAS_NUMBA,
+    TimetableArrays,
+    build_timetable_arrays,
+)
+from algorithm_prototype.reverse_raptor import reverse_raptor_multi
+from algorithm_prototype.timetable import (
+    Timetable,
+    build_timetable,
+    validate_timetable,
+)
+from algorithm_prototype.trip_based import (
+    TripTransfers,
+    build_trip_transfers,
+    trip_based_algo,
+)
+
+# service date timetables kept (see RaptorEngine.network)
+DATE_CACHE_SIZE = 16
+# longest walk between two trips in meters: footpaths are found up to it at load
+# (street footpaths saved for less are closed up to it), longer walking distances
+# are rejected (see RaptorEngine.walk_distance)
+MAX_CLOSED_WALK_DIST = 2 * MAX_WALK_DIST
 
 
 def to_mins(day: int, time_str: str) -> int:
@@ -58,7 +97,10 @@ def to_mins(day: int, time_str: str) -> int:
 
 
 def find_closest_stop(
-    lat: float, lon: float, stops: Dict[str, Stop]
+    lat: float,
+    lon: float,
+    stops: Dict[str, Stop],
+    grid: Optional[PointGrid] = None,
 ) -> Tuple[str, float]:
     """
     Find the closest stop to (lat, lon) using a divide and conquer closest pair algorithm.
@@ -67,12 +109,17 @@ def find_closest_stop(
         lat: Target latitude
         lon: Target longitude
         stops: Dictionary of {stop_id: Stop} where Stop has .lat and .lon
+        grid: Grid of the stops (see PointGrid.from_stops), searched around
+            (lat, lon) instead of going through every stop
 
     Returns:
         Tuple of (stop_id, distance_meters)
     """
     if not stops:
         raise ValueError("No stops provided")
+    if grid is not None:
+        p, distance_m = grid.nearest(lat, lon)
+        return grid.ids[p], distance_m
 
     # Helper: haversine distance in meters
 
@@ -116,6 +163,60 @@ def find_closest_stop(
     return closest_pair_recursive(points_sorted)
 
 
+def find_access_stops(
+    lat: float,
+    lon: float,
+    stops: Dict[str, Stop],
+    max_walk_dist: float,
+    footpaths: Optional[FootpathIndex] = None,
+    grid: Optional[PointGrid] = None,
+) -> Dict[str, int]:
+    """
+    Find all stops within walking distance of (lat, lon) with their walking time.
+    Falls back to the closest stop if none is within max_walk_dist.
+
+    Args:
+        lat: Latitude of the location
+        lon: Longitude of the location
+        stops: Dictionary of stops
+        max_walk_dist: Maximum walking distance in meters
+        footpaths: Footpath store whose access detours turn straight-line
+            distances into walking distances (straight line if None)
+        grid: Grid of the stops (see PointGrid.from_stops), built here if None.
+            Should be built once at load
+
+    Returns:
+        Dictionary of {stop_id: walking minutes}
+    """
+    if grid is None:
+        grid = PointGrid.from_stops(stops, max_walk_dist)
+    access = {}
+    # a walk is never shorter than the straight line, so only stops within
+    # max_walk_dist of it can be in reach
+    for p, distance_m in grid.within(lat, lon, max_walk_dist):
+        stop_id = grid.ids[p]
+        if footpaths is not None:
+            distance_m = footpaths.access_distance(stop_id, distance_m)
+        if distance_m <= max_walk_dist:
+            access[stop_id] = _walk_minutes(distance_m)
+    if not access:
+        stop_id, distance_m = find_closest_stop(lat, lon, stops, grid)
+        if footpaths is not None:
+            distance_m = footpaths.access_distance(stop_id, distance_m)
+        access[stop_id] = _walk_minutes(distance_m)
+    return access
+
+
+def _stop_distance(lat: float, lon: float, stop: Stop) -> float:
+    """Straight-line distance in meters from (lat, lon) to stop."""
+    return hf.haversine(float(lat), float(lon), stop.lat, stop.lon)
+
+
+def _walk_minutes(distance_m: float) -> int:
+    """Minutes to walk distance_m meters to or from a stop, at least 1."""
+    return max(1, int(distance_m / WALKING_SPEED))
+
+
 def _create_walk_transfer_step(
     from_lat: float,
     from_lon: float,
@@ -123,6 +224,7 @@ def _create_walk_transfer_step(
     stops: Dict[str, Stop],
     departure_time: int,
     virtual_stop_id: str = None,
+    footpaths: Optional[FootpathIndex] = None,
 ) -> Dict[str, Any]:
     """
     Create a walk transfer step for the path.
@@ -134,15 +236,17 @@ def _create_walk_transfer_step(
         stops: Dictionary of stops
         departure_time: Time when the walk starts
         virtual_stop_id: ID for the virtual starting location
+        footpaths: Footpath store for the walking distance (see find_access_stops)
 
     Returns:
         Dictionary representing the walk transfer step
     """
     to_stop = stops[to_stop_id]
     distance_m = hf.haversine(from_lat, from_lon, to_stop.lat, to_stop.lon)
+    if footpaths is not None:
+        distance_m = footpaths.access_distance(to_stop_id, distance_m)
 
-    # Assume walking speed of 5 km/h (83.33 m/min)
-    walk_time_minutes = max(1, int(distance_m / 83.33))
+    walk_time_minutes = _walk_minutes(distance_m)
 
     # Create virtual stop for the start/end location
     if virtual_stop_id is None:
@@ -158,6 +262,25 @@ def _create_walk_transfer_step(
     }
 
 
+def _walk_buffer(
+    lat: float, lon: float, radius_m: float, segments: int = 16
+) -> Dict[str, Any]:
+    """
+    GeoJSON polygon approximating a circle of radius_m meters around (lat, lon).
+    """
+    dlat = radius_m / METERS_PER_DEG_LAT
+    dlon = radius_m / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+    ring = [
+        [
+            lon + dlon * math.cos(2 * math.pi * i / segments),
+            lat + dlat * math.sin(2 * math.pi * i / segments),
+        ]
+        for i in range(segments)
+    ]
+    ring.append(ring[0])  # GeoJSON rings are closed
+    return {"type": "Polygon", "coordinates": [ring]}
+
+
 def _serialize_stop(s: Stop) -> Dict[str, Any]:
     return {
         "id": s.id,
@@ -218,27 +341,154 @@ class RaptorEngine:
         self.routes: Dict[str, Route] = {}
         self.transfers: List[Transfer] = []
         self.transfer_map: Dict[Tuple[str, str], Transfer] = {}
-        self.last_max_walk_distance: int = MAX_WALK_DIST
+        # footpaths out to the largest walking distance, nearest first
+        self.footpaths: Optional[FootpathIndex] = None
+        # grid of the stops for the walks to and from a location
+        self.stop_grid: Optional[PointGrid] = None
+        self.timetable: Optional[Timetable] = None
+        # typed arrays for the compiled RAPTOR kernel (only with Numba installed)
+        self.timetable_arrays: Optional[TimetableArrays] = None
+        # CSA connections of the timetable
+        self.timetable_connections: Optional[Connections] = None
+        # walking distance of queries that do not set one
+        self.max_walk_distance: int = MAX_WALK_DIST
+        # walking distance the footpaths are found or closed up to (see load)
+        self.closed_walk_distance: float = MAX_CLOSED_WALK_DIST
+        self.reader: Optional[GTFSReader] = None
+        # (routes, timetable, timetable arrays) per date, every walking distance
+        # walks the same timetable
+        self._networks = lru_cache(maxsize=DATE_CACHE_SIZE)(self._build_network)
+        # Trip-Based transfers per timetable (date None: the weekly one) and
+        # walking distance, see trip_transfers
+        self._trip_transfers = lru_cache(maxsize=DATE_CACHE_SIZE + 1)(
+            self._build_trip_transfers
+        )
+        # CSA connections per date (they do not depend on the footpaths), see
+        # connections
+        self._connections = lru_cache(maxsize=DATE_CACHE_SIZE)(self._build_connections)
 
     def load(self, custom_max_walk_dist: Optional[int] = None) -> None:
         with self._lock:
             if self._loaded:
                 return
             reader = GTFSReader(gtfs_folder=self._gtfs_folder)
+            self.reader = reader
             self.stops = reader.stops
             self.routes = reader.routes
-            # build walk transfers (if non-default max_walk_distance is used, transfers need to be
-            # created in the planner call)
-            if custom_max_walk_dist is not None:
-                self.last_max_walk_distance = custom_max_walk_dist
+            # footpaths up to MAX_CLOSED_WALK_DIST found once and compiled
+            # nearest first: queries stop at their walking distance (see
+            # walk_distance)
+            walk_footpaths = reader.gtfs_folder + WALK_FOOTPATHS_FILE
+            if os.path.exists(walk_footpaths):
+                # street network footpaths (see the build_walk_footpaths command)
+                self.footpaths = read_footpath_index(walk_footpaths, self.stops)
             else:
-                self.last_max_walk_distance = MAX_WALK_DIST
-            self.transfers = hf.create_transfers(
-                self.stops, self.last_max_walk_distance
+                self.footpaths = build_footpath_index(self.stops, MAX_CLOSED_WALK_DIST)
+            self.stop_grid = PointGrid.from_stops(self.stops, MAX_WALK_DIST)
+            self.closed_walk_distance = max(
+                MAX_CLOSED_WALK_DIST, self.footpaths.max_distance
             )
+            if self.footpaths.max_distance < self.closed_walk_distance:
+                # street footpaths saved for a shorter distance: longer walks are
+                # chains of them. Shorter chains are never quicker than the
+                # footpaths found, so the index alone needs no closing
+                self.transfers = close_footpaths(
+                    self.footpaths.footpaths,
+                    math.ceil(self.closed_walk_distance / WALKING_SPEED),
+                )
+            else:
+                self.transfers = list(self.footpaths.footpaths)
+            self.max_walk_distance = self.walk_distance(
+                custom_max_walk_dist
+                if custom_max_walk_dist is not None
+                else MAX_WALK_DIST
+            )
+            # every footpath path steps can use, whatever the walking distance
             self.transfer_map = hf.create_transfer_map(self.transfers)
+            # compile and validate once - queries use the flat arrays instead of
+            # rebuilding indices and run no checks
+            self.timetable = validate_timetable(
+                build_timetable(self.stops, self.routes, self.transfers)
+            )
+            if HAS_NUMBA:
+                self.timetable_arrays = build_timetable_arrays(self.timetable)
+            self.timetable_connections = build_connections(self.timetable)
             self._loaded = True
 
+    def walk_distance(self, max_walk_dist: Optional[int] = None) -> int:
+        """Walking distance a query uses: max_walk_dist, the engine's default if
+        not given. No footpaths are computed per query, so it is at most the
+        distance the footpaths were found or closed up to at load.
+
+        Raises ValueError for a longer max_walk_dist.
+        """
+        if max_walk_dist is None:
+            return self.max_walk_distance
+        if max_walk_dist > self.closed_walk_distance:
+            raise ValueError(
+                f"Maximum walking distance {max_walk_dist} m is beyond the "
+                f"{self.closed_walk_distance} m the footpaths were built for."
+            )
+        return max_walk_dist
+
+    def network(
+        self, service_date: Optional[date] = None
+    ) -> Tuple[Dict[str, Route], Timetable, Optional[TimetableArrays]]:
+        """Routes and compiled timetable to query: the weekly ones, or with a
+        service_date only the trips running on that date (calendar_dates.txt
+        exceptions included, see GTFSReader.routes_on). Every walking distance
+        shares the timetable of the date, whose footpaths are nearest first:
+        queries pass walk_distance(...) to the engines, which stop at the first
+        footpath beyond it. Date timetables are built and validated on first use
+        and kept in an LRU cache keyed by date.
+
+        Returns:
+            Tuple of (routes, timetable, timetable arrays or None)
+        """
+        if service_date is None:
+            return self.routes, self.timetable, self.timetable_arrays
+        return self._networks(service_date)
+
+    def _build_network(
+        self, service_date: date
+    ) -> Tuple[Dict[str, Route], Timetable, Optional[TimetableArrays]]:
+        routes = self.reader.routes_on(service_date)
+        # the footpaths are the same every day, only the trips are compiled
+        timetable = validate_timetable(
+            build_timetable(self.stops, routes, []).with_footpaths_of(self.timetable)
+        )
+        timetable_arrays = build_timetable_arrays(timetable) if HAS_NUMBA else None
+        return routes, timetable, timetable_arrays
+
+    def trip_transfers(
+        self, service_date: Optional[date] = None, max_walk_dist: Optional[int] = None
+    ) -> TripTransfers:
+        """Trip-to-trip transfers of the timetable of network(service_date) for
+        Trip-Based queries, walking the footpaths of max_walk_dist (see
+        build_trip_transfers). The preprocessing is slow on a large feed (minutes
+        for thousands of trips) and only Trip-Based queries need it, so it runs
+        on the first such query and is cached.
+        """
+        return self._trip_transfers(service_date, self.walk_distance(max_walk_dist))
+
+    def _build_trip_transfers(
+        self, service_date: Optional[date], max_walk_dist: int
+    ) -> TripTransfers:
+        return build_trip_transfers(self.network(service_date)[1], max_walk_dist)
+
+    def connections(self, service_date: Optional[date] = None) -> Connections:
+        """Connections of the timetable of network(service_date) for CSA queries:
+        the weekly timetable's are built at load, a date's on the first such
+        query and cached. They only depend on the trips, so every walking
+        distance shares them.
+        """
+        if service_date is None:
+            return self.timetable_connections
+        return self._connections(service_date)
+
+    def _build_connections(self, service_date: date) -> Connections:
+        return build_connections(self.network(service_date)[1])
+
     def plan(
         self,
         source_lat: float,
@@ -250,29 +500,37 @@ class RaptorEngine:
         custom_max_walk_dist: Optional[int] = None,
         debug: bool = False,
         use_dijkstra: bool = False,
+        use_trip_based: bool = False,
+        use_csa: bool = False,
         minimize_walking: bool = False,
         minimize_stops: bool = False,
+        arrive_by: bool = False,
+        service_date: Optional[date] = None,
     ) -> Dict[str, Any]:
+        """Plan a journey between two locations. With arrive_by, departure_minutes
+        is the latest arrival at the target location and the journey leaving as
+        late as possible is returned (reverse RAPTOR between the same stops
+        within walking distance as the default RAPTOR query). With service_date,
+        only trips running on that date are used, with custom_max_walk_dist only
+        footpaths at most that long (see walk_distance, longer ones are an error).
+        """
         if not self._loaded:
-            self.load(custom_max_walk_dist=custom_max_walk_dist)
-        else:
-            # if max_walk_distance changed, rebuild transfers
-            if (custom_max_walk_dist is not None) and (
-                custom_max_walk_dist != self.last_max_walk_distance
-            ):
-                self.transfers = hf.create_transfers(
-                    self.stops, custom_max_walk_dist or MAX_WALK_DIST
-                )
-                self.transfer_map = hf.create_transfer_map(self.transfers)
-                self.last_max_walk_distance = custom_max_walk_dist or MAX_WALK_DIST
+            self.load()
+        # a different walking distance walks fewer of the timetable's footpaths,
+        # the shared state is left alone
+        try:
+            max_walk_dist = self.walk_distance(custom_max_walk_dist)
+        except ValueError as e:
+            return {"error": str(e), "result": {}, "path": [], "path_objs": []}
+        routes, timetable, timetable_arrays = self.network(service_date)
 
         # Find closest stops to source and target coordinates
         try:
             source_id, source_dist = find_closest_stop(
-                float(source_lat), float(source_lon), self.stops
+                float(source_lat), float(source_lon), self.stops, self.stop_grid
             )
             target_id, target_dist = find_closest_stop(
-                float(target_lat), float(target_lon), self.stops
+                float(target_lat), float(target_lon), self.stops, self.stop_grid
             )
 
             if debug:
@@ -301,39 +559,382 @@ class RaptorEngine:
             }
 
         # Choose algorithm
-        if minimize_walking:
-            self.transfers = hf.create_transfers(self.stops, 200)
-            self.transfer_map = hf.create_transfer_map(self.transfers)
-        if minimize_stops:
-            # minimize number of transfers by setting max_rounds to a low value
-            max_rounds = 3
-
-        if use_dijkstra:
+        alternatives: List[Dict[str, Any]] = []
+        start_minutes = departure_minutes
+        latest_departure = None
+        if arrive_by:
+            algorithm = "Reverse RAPTOR"
+            # the same stops within walking distance as a depart-at query: every
+            # target stop is left early enough to walk to the target location
+            sources = find_access_stops(
+                float(source_lat),
+                float(source_lon),
+                self.stops,
+                max_walk_dist,
+                self.footpaths,
+                self.stop_grid,
+            )
+            result, path = reverse_raptor_multi(
+                stops=self.stops,
+                routes=routes,
+                transfers=self.transfers,
+                sources=sources,
+                targets=find_access_stops(
+                    float(target_lat),
+                    float(target_lon),
+                    self.stops,
+                    max_walk_dist,
+                    self.footpaths,
+                    self.stop_grid,
+                ),
+                arrival_time=departure_minutes,
+                max_rounds=max_rounds,
+                debug=debug,
+                timetable=timetable,
+                max_walk_dist=max_walk_dist,
+            )
+            earliest_arrival = path[-1]["arrival_time"] if path else INF
+            if path:
+                # stops the journey actually uses
+                source_id = path[0]["stop_id"]
+                target_id = path[-1]["stop_id"]
+                source_dist = _stop_distance(
+                    source_lat, source_lon, self.stops[source_id]
+                )
+                target_dist = _stop_distance(
+                    target_lat, target_lon, self.stops[target_id]
+                )
+                latest_departure = path[0]["arrival_time"] - sources[source_id]
+                start_minutes = latest_departure
+        elif use_dijkstra:
+            algorithm = "Dijkstra"
             result, path = dijkstra_algo(
                 stops=self.stops,
-                routes=self.routes,
+                routes=routes,
                 transfers=self.transfers,
                 source_id=source_id,
                 target_id=target_id,
                 departure_time=departure_minutes,
                 max_rounds=max_rounds,
                 debug=debug,
+                timetable=timetable,
+                max_walk_dist=max_walk_dist,
             )
-        else:
-            result, path = raptor_algo(
+            earliest_arrival = result.get(target_id, INF)
+        elif use_trip_based:
+            algorithm = "Trip-Based"
+            result, path = trip_based_algo(
+                stops=self.stops,
+                routes=routes,
+                transfers=self.transfers,
+                source_id=source_id,
+                target_id=target_id,
+                departure_time=departure_minutes,
+                max_rounds=max_rounds,
+                debug=debug,
+                timetable=timetable,
+                trip_transfers=self.trip_transfers(service_date, max_walk_dist),
+                max_walk_dist=max_walk_dist,
+            )
+            earliest_arrival = result.get(target_id, INF)
+        elif use_csa:
+            algorithm = "CSA"
+            result, path = csa_algo(
                 stops=self.stops,
-                routes=self.routes,
+                routes=routes,
                 transfers=self.transfers,
                 source_id=source_id,
                 target_id=target_id,
                 departure_time=departure_minutes,
                 max_rounds=max_rounds,
                 debug=debug,
+                timetable=timetable,
+                connections=self.connections(service_date),
+                max_walk_dist=max_walk_dist,
+            )
+            earliest_arrival = result.get(target_id, INF)
+        elif minimize_walking or minimize_stops:
+            # one McRAPTOR query gives the whole trade-off, preferences pick from it
+            algorithm = "McRAPTOR"
+            result, alternatives = mcraptor_algo(
+                stops=self.stops,
+                routes=routes,
+                transfers=self.transfers,
+                source_id=source_id,
+                target_id=target_id,
+                departure_time=departure_minutes,
+                max_rounds=max_rounds,
+                debug=debug,
+                timetable=timetable,
+                max_walk_dist=max_walk_dist,
+            )
+            chosen = pick_journey(
+                alternatives,
+                minimize_walking=minimize_walking,
+                minimize_transfers=minimize_stops,
+            )
+            path = chosen["path"] if chosen else []
+            earliest_arrival = chosen["arrival_time"] if chosen else INF
+        else:
+            algorithm = "RAPTOR"
+            # one search from every stop within walking distance of the origin to
+            # every stop within walking distance of the destination; the fastest
+            # journey plus the fewer-trips options from the same run
+            result, alternatives = raptor_multi(
+                stops=self.stops,
+                routes=routes,
+                transfers=self.transfers,
+                sources=find_access_stops(
+                    float(source_lat),
+                    float(source_lon),
+                    self.stops,
+                    max_walk_dist,
+                    self.footpaths,
+                    self.stop_grid,
+                ),
+                targets=find_access_stops(
+                    float(target_lat),
+                    float(target_lon),
+                    self.stops,
+                    max_walk_dist,
+                    self.footpaths,
+                    self.stop_grid,
+                ),
+                departure_time=departure_minutes,
+                max_rounds=max_rounds,
+                debug=debug,
+                timetable=timetable,
+                target_pruning=True,
+                lower_bound=True,
+                timetable_arrays=timetable_arrays,
+                max_walk_dist=max_walk_dist,
             )
+            path = alternatives[-1]["path"] if alternatives else []
+            if path:
+                # stops the fastest journey actually uses
+                source_id = alternatives[-1]["source_id"]
+                target_id = alternatives[-1]["target_id"]
+                source_dist = _stop_distance(
+                    source_lat, source_lon, self.stops[source_id]
+                )
+                target_dist = _stop_distance(
+                    target_lat, target_lon, self.stops[target_id]
+                )
+            # no journey, also when every stop near the destination is near the
+            # origin too (targets that are sources are left out)
+            earliest_arrival = result[target_id] if path else INF
+
+        earliest_arrival, path_objs = self._path_with_walks(
+            path,
+            source_id,
+            target_id,
+            source_lat,
+            source_lon,
+            target_lat,
+            target_lon,
+            start_minutes,
+            earliest_arrival,
+            routes,
+        )
+
+        return {
+            "earliest_arrival": earliest_arrival if earliest_arrival != INF else None,
+            # time to leave the source location (arrive-by queries only)
+            "latest_departure": latest_departure,
+            "source_stop": {"id": source_id, "distance_m": source_dist},
+            "target_stop": {"id": target_id, "distance_m": target_dist},
+            "result": result,
+            "path": path,
+            "path_objs": path_objs,
+            "algorithm_used": algorithm,
+            # Pareto options: (trips, arrival) for RAPTOR, (arrival, trips,
+            # walking) for McRAPTOR, none for Dijkstra
+            "alternatives": alternatives,
+        }
+
+    def plan_range(
+        self,
+        source_lat: float,
+        source_lon: float,
+        target_lat: float,
+        target_lon: float,
+        earliest_departure_minutes: int,
+        latest_departure_minutes: int,
+        max_rounds: int = 5,
+        debug: bool = False,
+        service_date: Optional[date] = None,
+    ) -> Dict[str, Any]:
+        """Profile query: all Pareto optimal (departure, arrival) journeys for
+        departures in [earliest_departure_minutes, latest_departure_minutes],
+        computed in one rRAPTOR run instead of one plan() call per minute.
+        """
+        if not self._loaded:
+            self.load()
+        routes, timetable, _ = self.network(service_date)
+
+        try:
+            source_id, source_dist = find_closest_stop(
+                float(source_lat), float(source_lon), self.stops, self.stop_grid
+            )
+            target_id, target_dist = find_closest_stop(
+                float(target_lat), float(target_lon), self.stops, self.stop_grid
+            )
+        except ValueError as e:
+            return {
+                "error": f"Failed to find closest stops: {str(e)}",
+                "journeys": [],
+            }
 
-        # Get earliest arrival at target
-        earliest_arrival = result.get(target_id, INF)
+        profile = raptor_range(
+            stops=self.stops,
+            routes=routes,
+            transfers=self.transfers,
+            source_id=source_id,
+            target_id=target_id,
+            earliest_departure=earliest_departure_minutes,
+            latest_departure=latest_departure_minutes,
+            max_rounds=max_rounds,
+            debug=debug,
+            timetable=timetable,
+            lower_bound=True,
+            max_walk_dist=self.max_walk_distance,
+        )
 
+        journeys = []
+        for journey in profile:
+            arrival, path_objs = self._path_with_walks(
+                journey["path"],
+                source_id,
+                target_id,
+                source_lat,
+                source_lon,
+                target_lat,
+                target_lon,
+                journey["departure_time"],
+                journey["arrival_time"],
+                routes,
+            )
+            journeys.append(
+                {
+                    "departure_time": journey["departure_time"],
+                    "earliest_arrival": arrival,
+                    "path": journey["path"],
+                    "path_objs": path_objs,
+                }
+            )
+
+        return {
+            "source_stop": {"id": source_id, "distance_m": source_dist},
+            "target_stop": {"id": target_id, "distance_m": target_dist},
+            "journeys": journeys,
+        }
+
+    def isochrone(
+        self,
+        lat: float,
+        lon: float,
+        departure_minutes: int,
+        max_minutes: int,
+        max_rounds: int = 5,
+        geojson: bool = False,
+        debug: bool = False,
+        service_date: Optional[date] = None,
+    ) -> Dict[str, Any]:
+        """Stops reachable within max_minutes of leaving (lat, lon) at
+        departure_minutes, from one one-to-all RAPTOR run. With geojson, also a
+        FeatureCollection of the area walkable from each stop in the time left
+        (capped at the maximum walking distance).
+        """
+        if not self._loaded:
+            self.load()
+        routes, timetable, timetable_arrays = self.network(service_date)
+
+        sources = find_access_stops(
+            float(lat),
+            float(lon),
+            self.stops,
+            self.max_walk_distance,
+            self.footpaths,
+            self.stop_grid,
+        )
+        arrivals = raptor_one_to_all(
+            stops=self.stops,
+            routes=routes,
+            transfers=self.transfers,
+            sources=sources,
+            departure_time=departure_minutes,
+            max_rounds=max_rounds,
+            debug=debug,
+            timetable=timetable,
+            timetable_arrays=timetable_arrays,
+            max_walk_dist=self.max_walk_distance,
+        )
+
+        deadline = departure_minutes + max_minutes
+        reachable = []
+        for stop_id, arrival in arrivals.items():
+            if arrival > deadline:
+                continue
+            stop = self.stops[stop_id]
+            reachable.append(
+                {
+                    "id": stop_id,
+                    "name": stop.name,
+                    "lat": stop.lat,
+                    "lon": stop.lon,
+                    "arrival_time": arrival,
+                    "travel_minutes": arrival - departure_minutes,
+                }
+            )
+        reachable.sort(key=lambda r: (r["arrival_time"], r["id"]))
+
+        out: Dict[str, Any] = {
+            "departure_minutes": departure_minutes,
+            "max_minutes": max_minutes,
+            "stops": reachable,
+        }
+        if geojson:
+            features = []
+            for r in reachable:
+                radius_m = min(
+                    (deadline - r["arrival_time"]) * WALKING_SPEED,
+                    self.max_walk_distance,
+                )
+                if radius_m <= 0:
+                    continue
+                features.append(
+                    {
+                        "type": "Feature",
+                        "geometry": _walk_buffer(r["lat"], r["lon"], radius_m),
+                        "properties": {
+                            "stop_id": r["id"],
+                            "arrival_time": r["arrival_time"],
+                            "radius_m": radius_m,
+                        },
+                    }
+                )
+            out["geojson"] = {"type": "FeatureCollection", "features": features}
+        return out
+
+    def _path_with_walks(
+        self,
+        path: List[Dict[str, Any]],
+        source_id: str,
+        target_id: str,
+        source_lat: float,
+        source_lon: float,
+        target_lat: float,
+        target_lon: float,
+        departure_minutes: int,
+        earliest_arrival: int,
+        routes: Dict[str, Route],
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Add the walks from the source location to the first stop and from the
+        last stop to the target location, and enrich the path with objects.
+
+        Returns:
+            Tuple of (arrival at the target location, JSON-safe path objects)
+        """
         # Create enhanced path with walk transfers
         enhanced_path = []
 
@@ -346,6 +947,7 @@ class RaptorEngine:
                 self.stops,
                 departure_minutes,
                 "virtual_start",
+                self.footpaths,
             )
             enhanced_path.append(initial_walk_step)
 
@@ -361,6 +963,7 @@ class RaptorEngine:
                     self.stops,
                     earliest_arrival,
                     "virtual_end",
+                    self.footpaths,
                 )
                 # Reverse the direction for final walk (from stop to destination)
                 final_walk_step["from_stop_id"] = target_id
@@ -395,21 +998,14 @@ class RaptorEngine:
         path_objs = reconstruct_path_objs(
             path=enhanced_path,
             stops_dict=enhanced_stops,
-            routes_dict=self.routes,
+            routes_dict=routes,
             transfers_dict=self.transfer_map,
         )
 
         # Add virtual stop information to path objects
         # path_objs = _add_virtual_stop_info_to_path_objs(path_objs, virtual_stops)
 
-        return {
-            "earliest_arrival": earliest_arrival if earliest_arrival != INF else None,
-            "source_stop": {"id": source_id, "distance_m": source_dist},
-            "target_stop": {"id": target_id, "distance_m": target_dist},
-            "result": result,
-            "path": path,
-            "path_objs": _path_objs_to_json_safe(path_objs),
-        }
+        return earliest_arrival, _path_objs_to_json_safe(path_objs)
 
 
 # Singleton with lazy load (pre-warmed in AppConfig.ready)
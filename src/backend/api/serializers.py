@@ -69,27 +69,64 @@ class StopTimeSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class PlanRequestSerializer(serializers.Serializer):
+class DepartureTimeMixin:
+    """Validation of a departure given as departure_minutes, or as day (or date)
+    and time, for request serializers with those fields."""
+
+    def validate(self, attrs):
+        if "departure_minutes" not in attrs and (
+            ("day" not in attrs and "date" not in attrs) or "time" not in attrs
+        ):
+            raise serializers.ValidationError(
+                "Provide either departure_minutes or day (or date) and time (HH:MM)."
+            )
+        # latest_time is a time of the day, it needs one
+        if "latest_time" in attrs and "day" not in attrs and "date" not in attrs:
+            raise serializers.ValidationError(
+                "Provide day (or date) with latest_time, or latest_departure_minutes."
+            )
+        return attrs
+
+
+class PlanRequestSerializer(DepartureTimeMixin, serializers.Serializer):
     source_lat = FloatField(required=True)
     source_lon = FloatField(required=True)
     target_lat = FloatField(required=True)
     target_lon = FloatField(required=True)
-    day = IntegerField(required=True)
-    time = CharField(required=True)
+    # either day or date with time, or departure_minutes (see DepartureTimeMixin)
+    day = IntegerField(required=False)
+    time = CharField(required=False)
     max_rounds = IntegerField(required=False, default=5)
     departure_minutes = IntegerField(required=False)
+    # profile (range) query: all journeys departing between time and latest_time
+    latest_time = CharField(required=False)
+    latest_departure_minutes = IntegerField(required=False)
     debug = serializers.BooleanField(required=False, default=False)
     use_dijkstra = serializers.BooleanField(required=False, default=False)
+    use_trip_based = serializers.BooleanField(required=False, default=False)
+    use_csa = serializers.BooleanField(required=False, default=False)
     minimize_walking = serializers.BooleanField(required=False, default=False)
     minimize_number_of_transfers = serializers.BooleanField(
         required=False, default=False
     )
-
-    def validate(self, attrs):
-        if "departure_minutes" not in attrs and (
-            "day" not in attrs or "time" not in attrs
-        ):
-            raise serializers.ValidationError(
-                "Provide either departure_minutes or both day and time (HH:MM)."
-            )
-        return attrs
+    # sent by the frontend, picks the journey with the fewest trips
+    minimize_stops = serializers.BooleanField(required=False, default=False)
+    # time is the latest arrival, find the journey leaving as late as possible
+    arrive_by = serializers.BooleanField(required=False, default=False)
+    # service date (calendar exceptions apply), its weekday overrides day
+    date = serializers.DateField(required=False)
+
+
+class IsochroneRequestSerializer(DepartureTimeMixin, serializers.Serializer):
+    lat = FloatField(required=True)
+    lon = FloatField(required=True)
+    day = IntegerField(required=False)
+    time = CharField(required=False)
+    departure_minutes = IntegerField(required=False)
+    # travel time budget
+    max_minutes = IntegerField(required=True, min_value=1)
+    max_rounds = IntegerField(required=False, default=5)
+    # also return walkable areas around reached stops as GeoJSON
+    geojson = serializers.BooleanField(required=False, default=False)
+    # service date (calendar exceptions apply), its weekday overrides day
+    date = serializers.DateField(required=False)
@@ -1,3 +1,228 @@
+import json
+import os
+import tempfile
+from datetime import date
+from unittest import mock
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from algorithm_prototype.footpaths import WALK_FOOTPATHS_FILE
+from algorithm_prototype.trip_based import build_trip_transfers
+
+from .raptor_engine import MAX_CLOSED_WALK_DIST, RaptorEngine
+from .serializers import IsochroneRequestSerializer, PlanRequestSerializer
+
+PLAN = {
+    "source_lat": -33.918,
+    "source_lon": 18.423,
+    "target_lat": -33.935,
+    "target_lon": 18.413,
+}
+NO_JOURNEY = {"earliest_arrival": None, "path": [], "path_objs": []}
+
+
+class PlanJourneyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @mock.patch("api.views.get_engine")
+    def test_plan_with_date_and_time_only(self, get_engine):
+        get_engine.return_value.plan.return_value = NO_JOURNEY
+        response = self.client.post(
+            "/api/plan/", {**PLAN, "date": "2026-10-21", "time": "08:00"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        kwargs = get_engine.return_value.plan.call_args.kwargs
+        self.assertEqual(kwargs["service_date"], date(2026, 10, 21))
+        # a Wednesday: the date gives the day of the week
+        self.assertEqual(kwargs["departure_minutes"], 2 * 24 * 60 + 8 * 60)
+
+    def test_plan_needs_a_day_or_date_with_time(self):
+        self.assertFalse(
+            PlanRequestSerializer(data={**PLAN, "time": "08:00"}).is_valid()
+        )
+        self.assertFalse(PlanRequestSerializer(data={**PLAN, "day": 2}).is_valid())
+        self.assertTrue(
+            PlanRequestSerializer(data={**PLAN, "day": 2, "time": "08:00"}).is_valid()
+        )
+        self.assertTrue(
+            PlanRequestSerializer(data={**PLAN, "departure_minutes": 480}).is_valid()
+        )
+
+    def test_plan_latest_time_needs_a_day(self):
+        response = self.client.post(
+            "/api/plan/",
+            {**PLAN, "departure_minutes": 480, "latest_time": "09:00"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(
+            PlanRequestSerializer(
+                data={**PLAN, "day": 0, "time": "08:00", "latest_time": "09:00"}
+            ).is_valid()
+        )
+
+    def test_isochrone_needs_a_day_or_date_with_time(self):
+        origin = {"lat": -33.918, "lon": 18.423, "max_minutes": 30}
+        # same rules as a plan request
+        self.assertFalse(
+            IsochroneRequestSerializer(data={**origin, "time": "08:00"}).is_valid()
+        )
+        self.assertTrue(
+            IsochroneRequestSerializer(
+                data={**origin, "date": "2026-10-21", "time": "08:00"}
+            ).is_valid()
+        )
+
+
+# two weekday trips, 300 m to walk between them (B to C), and an unserved stop
+FEED = {
+    "stops.txt": [
+        "stop_id,stop_name,stop_lat,stop_lon",
+        "A,A,-33.918,18.423",
+        "B,B,-33.935,18.413",
+        "C,C,-33.9377,18.413",
+        "D,D,-33.96,18.40",
+        # no trips, 170 m from A
+        "E,E,-33.9165,18.423",
+    ],
+    "routes.txt": ["route_id,agency_id,route_short_name", "R1,GABS,1", "R2,GABS,2"],
+    "trips.txt": [
+        "route_id,service_id,trip_id,trip_headsign,direction_id",
+        "R1,WK,T1,B,0",
+        "R2,WK,T2,D,0",
+    ],
+    "stop_times.txt": [
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence",
+        "T1,07:00:00,07:00:00,A,1",
+        "T1,07:10:00,07:10:00,B,2",
+        "T2,07:20:00,07:20:00,C,1",
+        "T2,07:30:00,07:30:00,D,2",
+    ],
+    "calendar.txt": [
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,"
+        "start_date,end_date",
+        "WK,1,1,1,1,1,0,0,20260101,20261231",
+    ],
+}
+
+
+class RaptorEngineTests(TestCase):
+    def setUp(self):
+        self.gtfs_folder = self.write_feed(FEED)
+        self.engine = RaptorEngine(self.gtfs_folder)
+        self.engine.load()
+
+    def write_feed(self, feed):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        for name, lines in feed.items():
+            with open(os.path.join(folder.name, name), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        return os.path.join(folder.name, "")
+
+    def plan(self, **kwargs):
+        # Monday 06:55 from A to D
+        return self.engine.plan(-33.918, 18.423, -33.96, 18.40, 415, **kwargs)
+
+    def test_walking_distances_share_the_closed_footpaths(self):
+        engine = self.engine
+        self.assertEqual(engine.closed_walk_distance, MAX_CLOSED_WALK_DIST)
+        # every accepted walking distance is a prefix of the footpaths found
+        self.assertEqual(engine.footpaths.max_distance, MAX_CLOSED_WALK_DIST)
+        self.assertEqual(engine.walk_distance(1500), 1500)
+        # longer walks are rejected, not clamped
+        with self.assertRaises(ValueError):
+            engine.walk_distance(5000)
+        self.assertIn("error", self.plan(custom_max_walk_dist=5000))
+
+        # queries neither close footpaths nor compile timetables
+        with mock.patch(
+            "api.raptor_engine.close_footpaths", side_effect=AssertionError
+        ), mock.patch("api.raptor_engine.build_timetable", side_effect=AssertionError):
+            self.assertIsNotNone(self.plan()["earliest_arrival"])
+            self.assertIsNotNone(
+                self.plan(custom_max_walk_dist=MAX_CLOSED_WALK_DIST)["earliest_arrival"]
+            )
+            # too short to walk from B to C
+            for kwargs in ({}, {"use_csa": True}, {"minimize_walking": True}):
+                self.assertIsNone(
+                    self.plan(custom_max_walk_dist=200, **kwargs)["earliest_arrival"]
+                )
+
+    def test_footpaths_found_up_to_the_longest_walk_are_not_closed(self):
+        self.assertEqual(self.engine.transfers, list(self.engine.footpaths.footpaths))
+
+    def test_street_footpaths_closed_beyond_their_distance(self):
+        # F halfway between B and C, street footpaths saved up to 200 m only
+        gtfs_folder = self.write_feed(
+            {**FEED, "stops.txt": FEED["stops.txt"] + ["F,F,-33.93635,18.413"]}
+        )
+        footpaths = [["B", "F", 150], ["F", "B", 150], ["F", "C", 150], ["C", "F", 150]]
+        with open(gtfs_folder + WALK_FOOTPATHS_FILE, "w") as f:
+            json.dump(
+                {"max_distance": 200, "footpaths": footpaths, "access_detours": {}}, f
+            )
+
+        engine = RaptorEngine(gtfs_folder)
+        with mock.patch(
+            "api.raptor_engine.close_footpaths", side_effect=lambda f, _: list(f)
+        ):
+            engine.load()
+        # without closing, B -> C is two walks
+        self.assertIsNone(
+            engine.plan(-33.918, 18.423, -33.96, 18.40, 415)["earliest_arrival"]
+        )
+
+        engine = RaptorEngine(gtfs_folder)
+        engine.load()
+        self.assertEqual(engine.footpaths.max_distance, 200)
+        # the default query walks B -> F -> C as one closed footpath
+        result = engine.plan(-33.918, 18.423, -33.96, 18.40, 415)
+        self.assertIsNotNone(result["earliest_arrival"])
+        self.assertIn(
+            ("B", "C"), {(t.from_stop.id, t.to_stop.id) for t in engine.transfers}
+        )
+
+    def test_trip_transfers_built_on_first_use(self):
+        engine = RaptorEngine(self.gtfs_folder)
+        with mock.patch(
+            "api.raptor_engine.build_trip_transfers", wraps=build_trip_transfers
+        ) as build:
+            engine.load()
+            # only Trip-Based queries need them
+            build.assert_not_called()
+            engine.plan(-33.918, 18.423, -33.96, 18.40, 415, use_trip_based=True)
+            engine.plan(-33.918, 18.423, -33.96, 18.40, 415, use_trip_based=True)
+        build.assert_called_once()
+
+    def test_connections_built_at_load(self):
+        self.assertIsNotNone(self.engine.timetable_connections)
+        with mock.patch(
+            "api.raptor_engine.build_connections", side_effect=AssertionError
+        ):
+            self.assertIsNotNone(self.plan(use_csa=True)["earliest_arrival"])
+            self.assertIs(self.engine.connections(), self.engine.timetable_connections)
+
+    def test_arrive_by_uses_every_stop_within_walking_distance(self):
+        # E is nearer the origin, only A has a trip
+        origin = (-33.917, 18.423)
+        depart = self.engine.plan(*origin, -33.96, 18.40, 415)
+        self.assertEqual(depart["source_stop"]["id"], "A")
 
+        arrive = self.engine.plan(
+            *origin, -33.96, 18.40, depart["earliest_arrival"], arrive_by=True
+        )
+        self.assertEqual(arrive["source_stop"]["id"], "A")
+        self.assertEqual(arrive["earliest_arrival"], depart["earliest_arrival"])
+        # T1 leaves A at 07:00, a minute's walk away
+        self.assertEqual(arrive["latest_departure"], 419)
 
+    def test_raptor_without_journey_has_no_arrival(self):
+        # A and E are near both ends: every target stop is also a source
+        out = self.engine.plan(-33.918, 18.423, -33.9165, 18.423, 415)
+        self.assertEqual(out["alternatives"], [])
+        self.assertIsNone(out["earliest_arrival"])
+        self.assertEqual(out["path"], [])
@@ -15,6 +15,7 @@ from .views import (
     CalendarViewSet,
     CalendarDateViewSet,
     PlanJourneyView,
+    IsochroneView,
 )
 
 # Router for all API viewsets
@@ -37,6 +38,7 @@ urlpatterns = [
     path("user/change_password/", ChangePasswordView.as_view(), name="change-password"),
     # Routes & Preferences
     path("plan/", PlanJourneyView.as_view(), name="plan-journey"),
+    path("isochrone/", IsochroneView.as_view(), name="isochrone"),
     path("preferences/", update_preferences, name="update_preferences"),
     # All registered API endpoints
     path("", include(router.urls)),
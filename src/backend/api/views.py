@@ -16,7 +16,7 @@ from django.views.decorators.csrf import csrf_exempt
 from typing import Any, Dict, Tuple
 from rest_framework.views import APIView
 from .raptor_engine import get_engine, to_mins
-from .serializers import PlanRequestSerializer
+from .serializers import PlanRequestSerializer, IsochroneRequestSerializer
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 import math
@@ -154,15 +154,53 @@ class PlanJourneyView(APIView):
         # else:
         #    target_id = data["target_id"].strip()
 
+        service_date = data.get("date")
+        day = service_date.weekday() if service_date else data.get("day")
         if "departure_minutes" in data:
             dep_mins = int(data["departure_minutes"])
         else:
-            dep_mins = to_mins(int(data["day"]), data["time"])
+            dep_mins = to_mins(int(day), data["time"])
+
+        # Profile query over a departure window (rRAPTOR)
+        latest_mins = None
+        if "latest_departure_minutes" in data:
+            latest_mins = int(data["latest_departure_minutes"])
+        elif "latest_time" in data:
+            latest_mins = to_mins(int(day), data["latest_time"])
+        if latest_mins is not None:
+            if latest_mins < dep_mins:
+                return Response(
+                    {"error": "Latest departure is before the departure time."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            out = engine.plan_range(
+                source_lat=source_lat_p,
+                source_lon=source_lon_p,
+                target_lat=target_lat_p,
+                target_lon=target_lon_p,
+                earliest_departure_minutes=dep_mins,
+                latest_departure_minutes=latest_mins,
+                max_rounds=data.get("max_rounds", 5),
+                debug=False,
+                service_date=service_date,
+            )
+            return Response(
+                {
+                    "journeys": out["journeys"],
+                    "source_stop": out.get("source_stop"),
+                    "target_stop": out.get("target_stop"),
+                    "algorithm_used": "rRAPTOR",
+                },
+                status=status.HTTP_200_OK,
+            )
 
         # Extract preference parameters
         minimize_walking = data.get("minimize_walking", False)
         minimize_stops = data.get("minimize_stops", False)
         use_dijkstra = data.get("use_dijkstra", False)
+        use_trip_based = data.get("use_trip_based", False)
+        use_csa = data.get("use_csa", False)
+        arrive_by = data.get("arrive_by", False)
 
         out = engine.plan(
             source_lat=source_lat_p,  # Pass as float, not string
@@ -175,6 +213,10 @@ class PlanJourneyView(APIView):
             minimize_walking=minimize_walking,
             minimize_stops=minimize_stops,
             use_dijkstra=use_dijkstra,
+            use_trip_based=use_trip_based,
+            use_csa=use_csa,
+            arrive_by=arrive_by,
+            service_date=service_date,
         )
 
         # Minimal response
@@ -182,18 +224,51 @@ class PlanJourneyView(APIView):
         return Response(
             {
                 "earliest_arrival": out.get("earliest_arrival"),
+                "latest_departure": out.get("latest_departure"),
                 "path": out["path"],  # ID-based steps
                 "path_objs": out["path_objs"],  # JSON-safe enriched steps
                 "source_stop": out.get(
                     "source_stop"
                 ),  # Include stop info for debugging
                 "target_stop": out.get("target_stop"),
-                "algorithm_used": "Dijkstra" if use_dijkstra else "RAPTOR",
+                "algorithm_used": out.get("algorithm_used"),
+                # Pareto options (e.g. fewer trips but later arrival)
+                "alternatives": out.get("alternatives", []),
             },
             status=status.HTTP_200_OK,
         )
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class IsochroneView(APIView):
+    """Stops (and optionally GeoJSON areas) reachable within max_minutes."""
+
+    def post(self, request, *args, **kwargs):
+        ser = IsochroneRequestSerializer(data=request.data)
+        ser.is_valid(raise_exception=True)
+        data: Dict[str, Any] = ser.validated_data
+
+        engine = get_engine()
+
+        service_date = data.get("date")
+        day = service_date.weekday() if service_date else data.get("day")
+        if "departure_minutes" in data:
+            dep_mins = int(data["departure_minutes"])
+        else:
+            dep_mins = to_mins(int(day), data["time"])
+
+        out = engine.isochrone(
+            lat=float(data["lat"]),
+            lon=float(data["lon"]),
+            departure_minutes=dep_mins,
+            max_minutes=data["max_minutes"],
+            max_rounds=data.get("max_rounds", 5),
+            geojson=data.get("geojson", False),
+            service_date=service_date,
+        )
+        return Response(out, status=status.HTTP_200_OK)
+
+
 # @api_view(["POST"])
 # @permission_classes([IsAuthenticated])
 # def get_route(request):